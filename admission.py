@@ -0,0 +1,205 @@
+"""
+Admission control for the analysis endpoints.
+
+Without a limit, a burst of large ``/detect`` payloads is accepted, parsed and
+decoded all at once, and memory grows until the process is killed. The
+``AdmissionMiddleware`` runs before the request body is read:
+
+  * requests whose ``Content-Length`` exceeds the route's body limit get 413
+    immediately, and chunked bodies are cut off at the same limit;
+  * at most ``max_concurrent`` requests are processed at a time, up to
+    ``max_queue`` more wait (FIFO) for a slot, and anything beyond that, or
+    waiting longer than ``queue_timeout``, gets 503 with ``Retry-After``.
+
+Configuration (environment variables):
+    VOICE_MAX_CONCURRENT   requests processed at once (default: 2 x VOICE_WORKERS)
+    VOICE_MAX_QUEUE        requests waiting for a slot, 0 rejects when busy (default 64)
+    VOICE_QUEUE_TIMEOUT    seconds a request may wait for a slot (default 10)
+    VOICE_RETRY_AFTER      Retry-After seconds sent with 503 (default 1)
+    VOICE_MAX_BODY_BYTES   largest /detect JSON body (default: fits a base64
+                           encoding of a VOICE_UPLOAD_MAX_BYTES file)
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int = 64, queue_timeout: float = 10.0, retry_after: int = 1):
+        """
+        Args:
+            max_concurrent: requests allowed to run at the same time.
+            max_queue: requests allowed to wait for a slot; more are rejected.
+            queue_timeout: seconds a queued request waits before it is rejected.
+            retry_after: value of the Retry-After header on rejections.
+        """
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    @classmethod
+    def from_env(cls, workers: int):
+        return cls(
+            max_concurrent=int(os.environ.get("VOICE_MAX_CONCURRENT", "0")) or 2 * workers,
+            max_queue=int(os.environ.get("VOICE_MAX_QUEUE", "64")),
+            queue_timeout=float(os.environ.get("VOICE_QUEUE_TIMEOUT", "10")),
+            retry_after=int(os.environ.get("VOICE_RETRY_AFTER", "1")),
+        )
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one processing slot for the duration of the block.
+        Raises Overloaded when the queue is full or the wait times out.
+        """
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def acquire(self):
+        """
+        Takes a slot until ``release`` is called; ``slot`` is the scoped form.
+        Raises Overloaded like ``slot``.
+        """
+        await self._acquire()
+
+    def release(self):
+        self._release()
+
+    async def _acquire(self):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue_full", self.retry_after)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # the slot is handed over by _release, which also counts it as active
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # handed a slot just as the wait ran out: give it back
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            self.rejected["queue_timeout"] += 1
+            raise Overloaded("queue_timeout", self.retry_after)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        self.admitted += 1
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # pass the slot on directly; active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware applying ``controller`` and per-route body limits
+    before the endpoint (and FastAPI's body parsing) sees the request.
+    ``body_limits`` maps a path to its maximum body size (None: no size limit).
+    """
+    def __init__(self, app, controller: AdmissionController, body_limits: dict):
+        self.app = app
+        self.controller = controller
+        self.body_limits = body_limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.body_limits or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        limit = self.body_limits[scope["path"]]
+        if limit is not None:
+            content_length = _content_length(scope)
+            if content_length is not None and content_length > limit:
+                return await _reject(send, 413, {"detail": f"Request body exceeds the {limit} byte limit"})
+            receive = _limited_receive(receive, limit)
+        try:
+            async with self.controller.slot():
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            await _reject(send, 503, {"detail": f"Server busy ({e.reason}), retry later"},
+                          [(b"retry-after", str(e.retry_after).encode())])
+
+
+def _content_length(scope):
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _limited_receive(receive, limit: int):
+    received = 0
+
+    async def limited():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                # surfaces as a 413 response through FastAPI's exception handling
+                raise HTTPException(status_code=413, detail=f"Request body exceeds the {limit} byte limit")
+        return message
+
+    return limited
+
+
+async def _reject(send, status: int, body: dict, headers=()):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": payload})
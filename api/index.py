@@ -1 +1,8 @@
+import os
+
+# Serverless defaults: answer static routes before numpy/soundfile/the model are
+# loaded, and use threads (process pools are unavailable in most sandboxes).
+os.environ.setdefault("VOICE_LAZY_LOAD", "1")
+os.environ.setdefault("VOICE_EXECUTOR", "thread")
+
 from main import app
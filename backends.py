@@ -0,0 +1,155 @@
+"""
+Inference backends for VoiceClassifier.
+
+A backend wraps one model file and turns a float32 feature matrix of shape
+(batch, FEATURE_DIM) into one AI-generated probability per row. Backends are
+chosen by file extension; register new ones with ``register_backend``.
+
+ONNX Runtime is the first implementation (``pip install onnxruntime``). Its
+session options come from the environment unless passed explicitly:
+    VOICE_ORT_INTRA_OP_THREADS  threads inside one operator (default 1: the
+                                execution engine already runs one process per core)
+    VOICE_ORT_INTER_OP_THREADS  threads across independent operators (default 1)
+    VOICE_ORT_GRAPH_OPT         disable | basic | extended | all (default all)
+    VOICE_ORT_WARMUP            warm-up passes run at load time (default 3)
+
+``share_weights`` loads a model's weights once before serve.py forks its
+workers; sessions created afterwards use those arrays instead of private
+copies, so the workers share one copy of the weights.
+"""
+import os
+
+import numpy as np
+
+_BACKENDS = {}
+# real model path -> {initializer name: array}, see share_weights
+_SHARED_WEIGHTS = {}
+
+
+def register_backend(extension: str, backend_cls):
+    """
+    Makes ``backend_cls(path, **options)`` handle model files ending in ``extension``.
+    """
+    _BACKENDS[extension.lower()] = backend_cls
+
+
+def load_backend(path: str, **options):
+    """
+    Instantiates the backend registered for the model file's extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    backend_cls = _BACKENDS.get(extension)
+    if backend_cls is None:
+        raise ValueError(f"No inference backend for '{extension}' models (known: {sorted(_BACKENDS)})")
+    return backend_cls(path, **options)
+
+
+def share_weights(path: str):
+    """
+    Loads the initializers (weights) of the ONNX model at ``path`` into this
+    process. ONNX Runtime sessions created afterwards for that file, here or
+    in processes forked from here, read them from these arrays instead of
+    keeping a private copy; forked workers only read the pages, so they stay
+    shared. Needs the ``onnx`` package. Returns the bytes loaded.
+    """
+    import onnx
+    from onnx import numpy_helper
+    model = onnx.load(path)
+    weights = {}
+    for initializer in model.graph.initializer:
+        array = numpy_helper.to_array(initializer)
+        array.setflags(write=False)
+        weights[initializer.name] = array
+    _SHARED_WEIGHTS[os.path.realpath(path)] = weights
+    return sum(array.nbytes for array in weights.values())
+
+
+class InferenceBackend:
+    name = "base"
+
+    def predict(self, batch):
+        """
+        Args:
+            batch (np.ndarray): float32 features, shape (batch, n_features).
+
+        Returns:
+            np.ndarray: float32 AI-generated probabilities, shape (batch,).
+        """
+        raise NotImplementedError
+
+
+_GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnxruntime"
+
+    def __init__(self, path: str, intra_op_threads: int = None, inter_op_threads: int = None,
+                 graph_optimization: str = None, warmup_runs: int = None, providers=None):
+        """
+        Creates an ONNX Runtime session for ``path`` and runs warm-up passes so
+        the first request does not pay for graph initialization.
+
+        The model takes one float32 input of shape (batch, n_features) and returns
+        either (batch,) / (batch, 1) probabilities or (batch, 2) class
+        probabilities [human, ai].
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("ONNX models need onnxruntime: pip install onnxruntime") from e
+
+        if intra_op_threads is None:
+            intra_op_threads = int(os.environ.get("VOICE_ORT_INTRA_OP_THREADS", "1"))
+        if inter_op_threads is None:
+            inter_op_threads = int(os.environ.get("VOICE_ORT_INTER_OP_THREADS", "1"))
+        if graph_optimization is None:
+            graph_optimization = os.environ.get("VOICE_ORT_GRAPH_OPT", "all")
+        if warmup_runs is None:
+            warmup_runs = int(os.environ.get("VOICE_ORT_WARMUP", "3"))
+        if graph_optimization not in _GRAPH_OPT_LEVELS:
+            raise ValueError(f"Unknown graph optimization level '{graph_optimization}'")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _GRAPH_OPT_LEVELS[graph_optimization])
+        shared = _SHARED_WEIGHTS.get(os.path.realpath(path))
+        if shared:
+            # the session must not outlive the values wrapping the shared arrays
+            self._shared = [(name, ort.OrtValue.ortvalue_from_numpy(array)) for name, array in shared.items()]
+            for name, value in self._shared:
+                options.add_initializer(name, value)
+            # prepacking would copy the weights into a private layout again
+            options.add_session_config_entry("session.disable_prepacking", "1")
+        self.session = ort.InferenceSession(path, sess_options=options, providers=providers or ["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.n_features = model_input.shape[1] if isinstance(model_input.shape[1], int) else None
+        self.output_name = self.session.get_outputs()[0].name
+        self.warmup(warmup_runs)
+
+    def warmup(self, runs: int = 3, batch_size: int = 8):
+        if not runs or self.n_features is None:
+            return
+        dummy = np.zeros((batch_size, self.n_features), dtype=np.float32)
+        for _ in range(runs):
+            self.session.run([self.output_name], {self.input_name: dummy})
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.n_features is not None and batch.shape[1] != self.n_features:
+            raise ValueError(f"Model expects {self.n_features} features, got {batch.shape[1]}")
+        output = np.asarray(self.session.run([self.output_name], {self.input_name: batch})[0], dtype=np.float32)
+        if output.ndim == 2 and output.shape[1] == 2:
+            return output[:, 1]
+        return output.reshape(len(batch))
+
+
+register_backend(".onnx", OnnxBackend)
@@ -0,0 +1,320 @@
+"""
+Offline batch scoring without the HTTP server.
+
+Scores a requests.jsonl-style file (one {"audio_base64", "language"} object per
+line, optional "id") or a directory of audio files across all cores with a
+process pool, and writes one JSON result per line.
+
+    python batch_score.py requests.jsonl -o results.jsonl
+    python batch_score.py /archive/voicemail -o results.jsonl --language Tamil --resume
+
+Results are written in chunks so memory stays bounded, and ``--resume`` skips
+items already present in the output file after an interruption.
+
+With ``--store`` the extracted features are also kept in a memory-mapped
+feature store (see feature_store.py), keyed by the hash of the audio bytes,
+which each result line then carries as "audio_hash". When only the model has
+changed, ``--rescore`` scores the stored features again in vectorized batches
+without decoding anything:
+
+    python batch_score.py /archive/voicemail -o results.jsonl --store features/
+    python batch_score.py features/ --rescore -o rescored.jsonl --model new.onnx
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import executor
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".oga", ".aiff", ".aif", ".au")
+
+
+def iter_jsonl(path: str, default_language: str):
+    """
+    Yields (item_id, payload, language) for every request line. The id is the
+    line's "id" field, or its 1-based line number.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+                item_id = str(obj.get("id", line_no))
+                yield item_id, ("base64", obj["audio_base64"]), obj.get("language", default_language)
+            except (ValueError, KeyError, AttributeError) as e:
+                yield str(line_no), ("invalid", f"Invalid request line: {e}"), default_language
+
+
+def iter_directory(path: str, default_language: str):
+    """
+    Yields (item_id, payload, language) for every audio file under ``path``;
+    the id is the path relative to the directory.
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, path), ("file", full), default_language
+
+
+def score_item(item):
+    """
+    Runs in a pool worker: decode -> features -> predict for one item.
+    """
+    item_id, (kind, payload), language = item
+    record = {"id": item_id, "language": language}
+    try:
+        if kind == "invalid":
+            raise ValueError(payload)
+        source = base64.b64decode(payload) if kind == "base64" else payload
+        features, result, _ = executor.run_pipeline(source, language)
+        record.update(result)
+        record["duration_seconds"] = features["duration"]
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def extract_item(item):
+    """
+    Runs in a pool worker: like ``score_item``, but always computes the full
+    features (no cascade) and returns them with the audio hash for the
+    feature store. Returns (record, digest, features); digest is None on error.
+    """
+    from cache import audio_digest, new_audio_hasher
+    item_id, (kind, payload), language = item
+    record = {"id": item_id, "language": language}
+    try:
+        if kind == "invalid":
+            raise ValueError(payload)
+        if kind == "base64":
+            source = base64.b64decode(payload)
+            digest = audio_digest(source)
+        else:
+            source = payload
+            hasher = new_audio_hasher()
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(block)
+            digest = hasher.digest()
+        features, _ = executor.compute_features(source)
+        results, _ = executor.run_predict_batch([(language, features)])
+        record.update(results[0])
+        record["duration_seconds"] = features["duration"]
+        record["audio_hash"] = digest.hex()
+        return record, digest, features
+    except Exception as e:
+        record["error"] = str(e)
+        return record, None, None
+
+
+def rescore_batch(language: str, keys: list, summary):
+    """
+    Runs in a pool worker: scores stored summary rows of one language.
+    """
+    from feature_store import FEATURE_DIM, SUMMARY_EXTRA
+    records = []
+    duration = summary[:, FEATURE_DIM + SUMMARY_EXTRA.index("duration")]
+    results, _ = executor.run_predict_vectors(language, summary[:, :FEATURE_DIM])
+    for key, seconds, result in zip(keys, duration, results):
+        record = {"id": key.hex(), "language": language, **result}
+        # raw model score, e.g. for fitting a calibration on a labelled corpus
+        confidence = result["confidence_score"]
+        record["ai_probability"] = round(confidence if result["classification"] == "AI-Generated" else 1.0 - confidence, 4)
+        record["duration_seconds"] = round(float(seconds), 4)
+        records.append(record)
+    return records
+
+
+def completed_ids(output_path: str):
+    """
+    Reads the ids already written to ``output_path``. A partially written last
+    line (interrupted run) is truncated so appending starts on a clean line.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            cut = data.rfind(b"\n") + 1
+            f.truncate(cut)
+            data = data[:cut]
+    for line in data.splitlines():
+        try:
+            done.add(str(json.loads(line)["id"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def run(items, output_path: str, workers: int, chunk_size: int, model_path: str = None, resume: bool = False,
+        store=None):
+    """
+    Scores ``items`` in a process pool, keeping at most a few items per worker
+    in flight, and appends results to ``output_path`` every ``chunk_size`` items.
+    With ``store`` (a FeatureStore) the features of every scored clip are
+    appended to it. Returns (scored, errors, seconds).
+    """
+    done = completed_ids(output_path) if resume else set()
+    if done:
+        print(f"Resuming: {len(done)} items already scored", file=sys.stderr)
+    max_in_flight = workers * 4
+    scored = errors = 0
+    buffer = []
+    start = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        rate = scored / elapsed if elapsed > 0 else 0.0
+        label = "Done" if final else "Progress"
+        print(f"{label}: {scored} clips ({errors} errors) in {elapsed:.1f}s, {rate:.2f} clips/s", file=sys.stderr)
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=executor.init_worker, initargs=(model_path,)) as pool:
+
+        def flush():
+            if store is not None:
+                # features first, so every result written has its features stored
+                store.flush()
+            out.write("".join(buffer))
+            out.flush()
+            buffer.clear()
+            report()
+
+        def collect(finished):
+            nonlocal scored, errors
+            for future in finished:
+                if store is None:
+                    record = future.result()
+                else:
+                    record, digest, features = future.result()
+                    if digest is not None:
+                        store.append(digest, features, record["language"])
+                scored += 1
+                errors += "error" in record
+                buffer.append(json.dumps(record) + "\n")
+                if len(buffer) >= chunk_size:
+                    flush()
+
+        pending = set()
+        for item in items:
+            if item[0] in done:
+                continue
+            if len(pending) >= max_in_flight:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(pool.submit(score_item if store is None else extract_item, item))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+        if store is not None:
+            store.flush()
+        if buffer:
+            out.write("".join(buffer))
+            out.flush()
+            buffer.clear()
+
+    report(final=True)
+    return scored, errors, time.perf_counter() - start
+
+
+def rescore(store, output_path: str, workers: int, batch_size: int, model_path: str = None, resume: bool = False):
+    """
+    Scores every clip in ``store`` (a FeatureStore) from its stored features:
+    summary rows are read from the memory map ``batch_size`` at a time and sent
+    to the pool as one matrix per language. Returns (scored, seconds).
+    """
+    done = completed_ids(output_path) if resume else set()
+    if done:
+        print(f"Resuming: {len(done)} items already scored", file=sys.stderr)
+    scored = 0
+    start = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        rate = scored / elapsed if elapsed > 0 else 0.0
+        print(f"{'Done' if final else 'Progress'}: {scored} clips in {elapsed:.1f}s, {rate:.2f} clips/s", file=sys.stderr)
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=executor.init_worker, initargs=(model_path,)) as pool:
+
+        def collect(finished):
+            nonlocal scored
+            for future in finished:
+                records = future.result()
+                out.write("".join(json.dumps(record) + "\n" for record in records))
+                scored += len(records)
+            out.flush()
+            report()
+
+        pending = set()
+        for keys, languages, summary in store.iter_batches(batch_size):
+            groups = {}
+            for row, (key, language) in enumerate(zip(keys, languages)):
+                if key.hex() not in done:
+                    groups.setdefault(language, []).append(row)
+            for language, rows in groups.items():
+                if len(pending) >= workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending.add(pool.submit(rescore_batch, language, [keys[row] for row in rows], summary[rows]))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    report(final=True)
+    return scored, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a requests.jsonl file or a directory of audio files offline.")
+    parser.add_argument("input", help="requests.jsonl-style file or directory of audio files (a feature store with --rescore)")
+    parser.add_argument("-o", "--output", required=True, help="results JSONL file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="results buffered per write (default: 256)")
+    parser.add_argument("--language", default="English", help="language for files / lines without one")
+    parser.add_argument("--model", default=os.environ.get("VOICE_MODEL_PATH"), help="model weights (default: $VOICE_MODEL_PATH)")
+    parser.add_argument("--resume", action="store_true", help="skip items already present in the output file")
+    parser.add_argument("--store", help="also keep the extracted features in this feature store directory")
+    parser.add_argument("--rescore", action="store_true",
+                        help="input is a feature store: score its features without decoding any audio")
+    parser.add_argument("--batch-size", type=int, default=1024, help="clips per forward pass with --rescore (default: 1024)")
+    args = parser.parse_args(argv)
+
+    if args.rescore:
+        from feature_store import FeatureStore
+        if not os.path.exists(os.path.join(args.input, "CURRENT")):
+            parser.error(f"{args.input} is not a feature store")
+        try:
+            store = FeatureStore(args.input)
+        except ValueError as e:
+            parser.error(str(e))
+        with store:
+            rescore(store, args.output, args.workers, args.batch_size, args.model, args.resume)
+        return 0
+    if os.path.isdir(args.input):
+        items = iter_directory(args.input, args.language)
+    else:
+        items = iter_jsonl(args.input, args.language)
+    if args.store:
+        from feature_store import FeatureStore
+        try:
+            store = FeatureStore(args.store)
+        except ValueError as e:
+            parser.error(str(e))
+        with store:
+            scored, errors, _ = run(items, args.output, args.workers, args.chunk_size, args.model, args.resume, store)
+    else:
+        scored, errors, _ = run(items, args.output, args.workers, args.chunk_size, args.model, args.resume)
+    return 1 if scored and errors == scored else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
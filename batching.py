@@ -0,0 +1,97 @@
+"""
+Dynamic micro-batching for classifier inference.
+
+Concurrent ``/detect`` calls each produce one feature dict. Instead of running
+one forward pass per request, the scheduler gathers items for up to
+``max_batch_size`` items or ``max_wait_ms`` milliseconds, runs a single
+``predict_batch`` call and hands each result back to its waiting request.
+
+Configuration (environment variables):
+    VOICE_BATCH_MAX_SIZE  items per forward pass, 1 disables batching (default 16)
+    VOICE_BATCH_MAX_WAIT_MS  how long the first item waits for company (default 5)
+"""
+import asyncio
+import os
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        """
+        Args:
+            predict_batch: async callable taking a list of items and returning a
+                list of results in the same order.
+            max_batch_size: flush as soon as this many items are pending.
+            max_wait_ms: flush at most this long after the first pending item.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    @classmethod
+    def from_env(cls, predict_batch):
+        return cls(
+            predict_batch,
+            max_batch_size=int(os.environ.get("VOICE_BATCH_MAX_SIZE", "16")),
+            max_wait_ms=float(os.environ.get("VOICE_BATCH_MAX_WAIT_MS", "5")),
+        )
+
+    @property
+    def enabled(self):
+        return self.max_batch_size > 1
+
+    async def submit(self, item):
+        """
+        Queues one item and waits for its result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.predict_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"predict_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The waiting request may have been cancelled (client went away).
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,187 @@
+"""
+Async load generator for a running server.
+
+Sends ``/detect`` requests from ``--concurrency`` parallel clients for a fixed
+time (or request count) per concurrency level and reports throughput, error
+counts, p50/p95/p99 latency and the mean per-stage breakdown from the
+``Server-Timing`` header.
+
+    uvicorn main:app --port 8000 &
+    python benchmarks/load.py --url http://localhost:8000 --concurrency 1,4,16 --json load.json
+    python benchmarks/load.py --concurrency 16 --baseline load.json
+
+Every request carries a distinct clip (one sample differs), so the result cache
+does not turn the run into a cache benchmark; ``--same-clip`` measures the
+cached path instead. Needs httpx (``pip install httpx``).
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import math
+import struct
+import sys
+import time
+
+from report import compare, run_info, summarize, write_results
+
+
+def make_wav(seconds: float, sr: int = 16000):
+    """
+    16-bit mono WAV with a harmonic tone, built without numpy so the load
+    generator stays light.
+    """
+    n = int(seconds * sr)
+    samples = bytearray(2 * n)
+    for i in range(n):
+        t = i / sr
+        value = 0.4 * math.sin(2 * math.pi * 150 * t) + 0.2 * math.sin(2 * math.pi * 300 * t)
+        struct.pack_into("<h", samples, 2 * i, int(value * 32767))
+    buffer = io.BytesIO()
+    buffer.write(b"RIFF" + struct.pack("<I", 36 + len(samples)) + b"WAVE")
+    buffer.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sr, 2 * sr, 2, 16))
+    buffer.write(b"data" + struct.pack("<I", len(samples)) + bytes(samples))
+    return buffer.getvalue()
+
+
+class Payloads:
+    """
+    Yields JSON request bodies; unless ``same_clip`` is set, the last sample of
+    the clip is overwritten with a counter so every body hashes differently.
+    """
+    def __init__(self, wav: bytes, language: str, same_clip: bool):
+        self.wav = bytearray(wav)
+        self.language = language
+        self.same_clip = same_clip
+        self.counter = 0
+        self._fixed = self._body(bytes(self.wav)) if same_clip else None
+
+    def _body(self, audio: bytes):
+        return json.dumps({"audio_base64": base64.b64encode(audio).decode(), "language": self.language}).encode()
+
+    def next(self):
+        if self.same_clip:
+            return self._fixed
+        self.counter += 1
+        struct.pack_into("<h", self.wav, len(self.wav) - 2, self.counter % 32768)
+        return self._body(bytes(self.wav))
+
+
+def parse_server_timing(header: str):
+    """
+    'decode;dur=1.2, cache;desc="hit"' -> {"decode": 0.0012} (seconds).
+    """
+    stages = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                try:
+                    stages[name] = float(value) / 1000.0
+                except ValueError:
+                    pass
+    return stages
+
+
+async def run_level(client, url: str, payloads: Payloads, concurrency: int, duration: float, max_requests: int):
+    latencies = []
+    statuses = {}
+    stages = {}
+    errors = 0
+    sent = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors, sent
+        while time.perf_counter() < deadline and (not max_requests or sent < max_requests):
+            sent += 1
+            body = payloads.next()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, content=body, headers={"content-type": "application/json"})
+                await response.aread()
+                status = str(response.status_code)
+                for name, seconds in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stages.setdefault(name, []).append(seconds)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    completed = sum(statuses.values())
+    return {
+        "name": f"detect/c{concurrency}",
+        "concurrency": concurrency,
+        "requests": completed,
+        "errors": errors,
+        "statuses": statuses,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "latency_s": summarize(latencies),
+        "stage_mean_s": {name: sum(values) / len(values) for name, values in stages.items()},
+    }
+
+
+async def run(args):
+    try:
+        import httpx
+    except ImportError as e:
+        raise SystemExit("The load generator needs httpx: pip install httpx") from e
+
+    payloads = Payloads(make_wav(args.clip_seconds), args.language, args.same_clip)
+    url = args.url.rstrip("/") + "/detect"
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # warm-up: loads the model / starts the pool on lazy deployments
+        for _ in range(args.warmup):
+            await client.post(url, content=payloads.next(), headers={"content-type": "application/json"})
+        for concurrency in args.concurrency:
+            result = await run_level(client, url, payloads, concurrency, args.duration, args.requests)
+            latency = result["latency_s"]
+            print(f"c={concurrency:<4}{result['requests']:>8} req{result['errors']:>6} err"
+                  f"{result['throughput_rps']:>10.1f} req/s"
+                  f"  p50 {latency.get('p50', 0) * 1000:8.1f} ms  p95 {latency.get('p95', 0) * 1000:8.1f} ms"
+                  f"  p99 {latency.get('p99', 0) * 1000:8.1f} ms", file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test a running /detect endpoint.")
+    parser.add_argument("--url", default="http://localhost:8000", help="server base URL (default http://localhost:8000)")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16],
+                        help="comma-separated client counts, one run each (default 1,4,16)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level (default 20)")
+    parser.add_argument("--requests", type=int, default=0, help="stop a level after this many requests (default: time only)")
+    parser.add_argument("--clip-seconds", type=float, default=5.0, help="length of the test clip (default 5)")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--same-clip", action="store_true", help="send one identical clip (measures cache hits)")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests sent first (default 3)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against (p95 latency)")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        info = run_info(url=args.url, clip_seconds=args.clip_seconds, duration_s=args.duration, same_clip=args.same_clip)
+        write_results(args.json, {"benchmark": "load", "run": info, "results": results})
+    if args.baseline:
+        regressions = compare(results, args.baseline, key=lambda r: r["name"],
+                              metric=lambda r: (r.get("latency_s") or {}).get("p95"))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Micro-benchmarks for audio decoding and feature extraction.
+
+Decoding is measured through ``preprocessing.decode_audio_source`` (what the
+workers run on the raw upload bytes) over a matrix of containers, channel
+counts, bit depths and clip lengths; ``extract_features`` over the same clip
+lengths. Every case reports wall time (best / median of ``--repeat`` runs,
+plus real-time factor) and the peak Python/numpy allocation measured with
+tracemalloc in a separate run.
+
+    python benchmarks/micro.py --json micro.json
+    python benchmarks/micro.py --quick --baseline micro.json
+
+Test signals are generated deterministically (fixed seed), so runs on different
+commits see identical input.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import decode_audio_source, extract_features  # noqa: E402
+from report import compare, run_info, write_results  # noqa: E402
+
+FORMATS = ("wav", "flac", "mp3")
+CHANNELS = (1, 2)
+BIT_DEPTHS = (8, 16, 24)
+DURATIONS = (1, 10, 60, 600)
+QUICK_DURATIONS = (1, 10)
+
+# (format, bits) -> soundfile subtype; MP3 has no fixed bit depth
+_SUBTYPES = {
+    ("wav", 8): "PCM_U8", ("wav", 16): "PCM_16", ("wav", 24): "PCM_24",
+    ("flac", 8): "PCM_S8", ("flac", 16): "PCM_16", ("flac", 24): "PCM_24",
+    ("mp3", None): "MPEG_LAYER_III",
+}
+
+
+def make_signal(seconds: float, sr: int, channels: int, seed: int = 0):
+    """
+    Speech-like test signal: a gliding harmonic tone with amplitude modulation
+    plus low-level noise, float32 in [-1, 1], shape (frames, channels).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n, dtype=np.float32) / np.float32(sr)
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    # accumulate the phase in float64, then wrap it so float32 stays exact enough
+    phase = np.mod(2 * np.pi * np.cumsum(f0, dtype=np.float64) / sr, 2 * np.pi).astype(np.float32)
+    y = np.zeros(n, dtype=np.float32)
+    for harmonic, gain in ((1, 0.5), (2, 0.25), (3, 0.12)):
+        y += gain * np.sin(harmonic * phase, dtype=np.float32)
+    y *= 0.6 + 0.4 * np.sin(2 * np.pi * 3.0 * t, dtype=np.float32)
+    y += 0.01 * rng.standard_normal(n, dtype=np.float32)
+    out = np.empty((n, channels), dtype=np.float32)
+    for ch in range(channels):
+        # small per-channel offset so stereo is not trivially identical
+        out[:, ch] = np.roll(y, ch * 7)
+    return out
+
+
+def encode(signal, sr: int, fmt: str, bits):
+    buffer = io.BytesIO()
+    sf.write(buffer, signal, sr, format=fmt.upper(), subtype=_SUBTYPES[(fmt, bits)])
+    return buffer.getvalue()
+
+
+def measure(fn, repeat: int, max_seconds: float):
+    """
+    Times ``fn()`` (after one warm-up call) up to ``repeat`` times or until
+    ``max_seconds`` have been spent, then measures its peak allocation once.
+    """
+    fn()
+    times = []
+    budget_start = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "best_s": min(times),
+        "median_s": statistics.median(times),
+        "runs": len(times),
+        "peak_bytes": peak,
+    }
+
+
+def decode_cases(durations, sr: int):
+    for seconds in durations:
+        for channels in CHANNELS:
+            signal = make_signal(seconds, sr, channels)
+            for fmt in FORMATS:
+                for bits in (BIT_DEPTHS if fmt != "mp3" else (None,)):
+                    yield {"format": fmt, "channels": channels, "bits": bits, "seconds": seconds}, signal
+            del signal
+
+
+def run(durations, sr: int, repeat: int, max_seconds: float, skip_mp3: bool):
+    results = []
+    for case, signal in decode_cases(durations, sr):
+        if skip_mp3 and case["format"] == "mp3":
+            continue
+        data = encode(signal, sr, case["format"], case["bits"])
+        stats = measure(lambda: decode_audio_source(data), repeat, max_seconds)
+        depth = f"{case['bits']}bit" if case["bits"] else "vbr"
+        name = f"decode/{case['format']}/{case['channels']}ch/{depth}/{case['seconds']}s"
+        results.append({"name": name, "benchmark": "decode", **case, "input_bytes": len(data),
+                         "realtime_factor": case["seconds"] / stats["best_s"], **stats})
+        print(_line(results[-1]), file=sys.stderr)
+
+    for seconds in durations:
+        y = make_signal(seconds, sr, 1)[:, 0].copy()
+        stats = measure(lambda: extract_features(y, sr), repeat, max_seconds)
+        results.append({"name": f"features/{seconds}s", "benchmark": "extract_features", "seconds": seconds,
+                        "sample_rate": sr, "realtime_factor": seconds / stats["best_s"], **stats})
+        print(_line(results[-1]), file=sys.stderr)
+        del y
+    return results
+
+
+def _line(result):
+    return (f"{result['name']:<36}{result['best_s'] * 1000:>10.2f} ms{result['median_s'] * 1000:>10.2f} ms"
+            f"{result['realtime_factor']:>10.0f}x{result['peak_bytes'] / 2**20:>10.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark audio decoding and feature extraction.")
+    parser.add_argument("--quick", action="store_true", help=f"only {QUICK_DURATIONS} second clips")
+    parser.add_argument("--durations", type=lambda s: [int(x) for x in s.split(",")],
+                        help=f"comma-separated clip lengths in seconds (default {DURATIONS})")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="sample rate of the test clips (default 44100)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (default 5)")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="time budget per case (default 10)")
+    parser.add_argument("--skip-mp3", action="store_true", help="skip MP3 (encoding long clips is slow)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    args = parser.parse_args(argv)
+
+    durations = args.durations or (QUICK_DURATIONS if args.quick else DURATIONS)
+    print(f"{'case':<36}{'best':>13}{'median':>13}{'speed':>11}{'peak':>14}", file=sys.stderr)
+    results = run(durations, args.sample_rate, args.repeat, args.max_seconds, args.skip_mp3)
+
+    if args.json:
+        write_results(args.json, {"benchmark": "micro", "run": run_info(sample_rate=args.sample_rate), "results": results})
+    if args.baseline:
+        regressions = compare(results, args.baseline, key=lambda r: r["name"], metric=lambda r: r.get("best_s"))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
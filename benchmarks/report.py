@@ -0,0 +1,102 @@
+"""
+Shared result handling for the benchmark scripts.
+
+Every script writes one JSON document with a ``run`` header (git commit, Python,
+platform, CPU count, relevant VOICE_* settings) so results from different
+commits can be compared with ``--baseline``.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit():
+    """
+    Returns (commit hash, dirty flag) of the working tree, or (None, None).
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_info(**extra):
+    commit, dirty = git_commit()
+    info = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("VOICE_")},
+    }
+    info.update(extra)
+    return info
+
+
+def percentile(sorted_values, q: float):
+    """
+    Nearest-rank percentile (``q`` in 0..100) of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    """
+    min / mean / p50 / p95 / p99 / max of a list of numbers.
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "min": values[0],
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+def write_results(path: str, document: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}", file=sys.stderr)
+
+
+def compare(current: list, baseline_path: str, key, metric, lower_is_better: bool = True, threshold: float = 0.10):
+    """
+    Prints the relative change of ``metric(result)`` for every result present in
+    both runs (matched by ``key(result)``) and returns the regressions, i.e.
+    changes worse than ``threshold``.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {key(r): metric(r) for r in baseline.get("results", []) if metric(r) is not None}
+    commit = (baseline.get("run") or {}).get("commit") or "unknown"
+    print(f"\nCompared with {baseline_path} (commit {commit[:10]}):")
+    regressions = []
+    for result in current:
+        name, value = key(result), metric(result)
+        old = before.get(name)
+        if value is None or not old:
+            continue
+        change = (value - old) / old
+        worse = change > threshold if lower_is_better else change < -threshold
+        print(f"  {name:<48}{old:>12.4g} -> {value:<12.4g}{change:+8.1%}{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
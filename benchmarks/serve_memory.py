@@ -0,0 +1,160 @@
+"""
+Memory of the pre-forked server (serve.py) with and without shared weights.
+
+For every worker count, starts ``serve.py`` once with ``--share-weights`` (the
+default) and once with ``--no-share-weights`` on the given model, waits for
+the workers to load it, and sums the proportional set size (PSS) of the
+supervisor and its workers. PSS splits shared pages between the processes
+that map them, so the total is the memory the server really takes. It also
+times one ``predict`` call per batch size in this process for both kinds of
+session, since shared weights cannot be prepacked.
+
+    python benchmarks/serve_memory.py --model models/voice_test.onnx
+    python benchmarks/serve_memory.py --model big.onnx --workers 1,2,4 --json serve_memory.json
+
+Linux only (reads /proc). Needs the ``onnx`` package.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from report import ROOT, compare, run_info, write_results
+
+
+def children(pid: int):
+    """
+    PIDs whose parent is ``pid``.
+    """
+    found = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # the command name in parentheses may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            found.append(int(name))
+    return found
+
+
+def pss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def measure_server(model: str, workers: int, share: bool, port: int, settle: float, timeout: float):
+    """
+    Total PSS in MB of serve.py with ``workers`` workers once they have loaded ``model``.
+    """
+    env = dict(os.environ, VOICE_MODEL_PATH=model)
+    command = [sys.executable, os.path.join(ROOT, "serve.py"), "--workers", str(workers), "--port", str(port),
+               "--log-level", "warning", "--share-weights" if share else "--no-share-weights"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                    break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"serve.py did not come up (exit code {process.poll()})")
+                time.sleep(0.2)
+        # workers load their models in their lifespan, some after the first answers
+        time.sleep(settle)
+        pids = [process.pid] + children(process.pid)
+        return sum(pss_mb(pid) for pid in pids), len(pids) - 1
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def time_predict(model: str, batch_sizes, repeats: int):
+    """
+    {"shared"|"private": {batch size: mean seconds per predict call}}.
+    """
+    sys.path.insert(0, ROOT)
+    import numpy as np
+    import backends
+    private = backends.load_backend(model)
+    backends.share_weights(model)
+    shared = backends.load_backend(model)
+    rng = np.random.default_rng(0)
+    timings = {}
+    for name, backend in (("shared", shared), ("private", private)):
+        timings[name] = {}
+        for size in batch_sizes:
+            batch = rng.standard_normal((size, backend.n_features or 1)).astype(np.float32)
+            backend.predict(batch)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                backend.predict(batch)
+            timings[name][size] = (time.perf_counter() - start) / repeats
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure serve.py memory with and without shared model weights.")
+    parser.add_argument("--model", default=os.environ.get("VOICE_MODEL_PATH") or os.path.join(ROOT, "models", "voice_test.onnx"),
+                        help="ONNX model to serve (default: $VOICE_MODEL_PATH or the bundled test model)")
+    parser.add_argument("--workers", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4],
+                        help="comma-separated worker counts (default 1,2,4)")
+    parser.add_argument("--batch-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32],
+                        help="comma-separated predict batch sizes to time (default 1,8,32)")
+    parser.add_argument("--repeats", type=int, default=30, help="predict calls per batch size (default 30)")
+    parser.add_argument("--port", type=int, default=18700, help="port the servers listen on (default 18700)")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait for the workers' loads (default 3)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds a server may take to start")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against (total PSS)")
+    args = parser.parse_args(argv)
+
+    model = os.path.abspath(args.model)
+    results = []
+    print(f"{'mode':<10}{'workers':>8}{'total PSS MB':>14}{'per extra worker':>18}")
+    for share in (True, False):
+        mode = "shared" if share else "private"
+        first = None
+        for workers in args.workers:
+            total, started = measure_server(model, workers, share, args.port, args.settle, args.timeout)
+            if started != workers:
+                print(f"warning: {started} of {workers} workers running", file=sys.stderr)
+            first = (workers, total) if first is None else first
+            extra = (total - first[1]) / (workers - first[0]) if workers > first[0] else None
+            print(f"{mode:<10}{workers:>8}{total:>14.0f}{'' if extra is None else f'{extra:.0f}':>18}")
+            results.append({"name": f"{mode} workers={workers}", "mode": mode, "workers": workers, "total_pss_mb": total})
+
+    predict = time_predict(model, args.batch_sizes, args.repeats)
+    print(f"\n{'mode':<10}" + "".join(f"{f'batch {size}':>12}" for size in args.batch_sizes))
+    for mode, timings in predict.items():
+        print(f"{mode:<10}" + "".join(f"{timings[size] * 1000:>10.2f}ms" for size in args.batch_sizes))
+        for size, seconds in timings.items():
+            results.append({"name": f"{mode} predict batch={size}", "mode": mode, "batch_size": size, "predict_s": seconds})
+
+    if args.json:
+        info = run_info(model=model, model_bytes=os.path.getsize(model))
+        write_results(args.json, {"benchmark": "serve_memory", "run": info, "results": results})
+    if args.baseline:
+        regressions = compare(results, args.baseline, key=lambda r: r["name"],
+                              metric=lambda r: r.get("total_pss_mb", r.get("predict_s")))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
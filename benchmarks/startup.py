@@ -0,0 +1,160 @@
+"""
+Cold-start measurement harness.
+
+Every measurement runs in a fresh interpreter, like a serverless cold start:
+
+  * import time of each tracked module (``python -X importtime``), cumulative
+    and broken down by the heaviest transitive imports;
+  * time from interpreter start to the first ``/health``, ``/`` and ``/detect``
+    responses of the app (served in-process over ASGI, no network).
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --lazy --json startup.json
+
+``--lazy`` sets VOICE_LAZY_LOAD=1 and VOICE_EXECUTOR=thread, i.e. the serverless
+defaults of api/index.py.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRACKED_MODULES = ["main", "executor", "preprocessing", "model", "backends", "numpy", "soundfile", "fastapi"]
+
+# Runs inside the child interpreter: import the app, then time first responses.
+_FIRST_RESPONSE_SCRIPT = r"""
+import asyncio, base64, io, json, sys, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+
+async def call(method, path, body=b"", headers=()):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "scheme": "http", "server": ("test", 80), "client": ("test", 1),
+             "headers": [(b"host", b"test")] + list(headers)}
+    sent = {"body": False}
+    status = {}
+    async def receive():
+        if not sent["body"]:
+            sent["body"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+    await main.app(scope, receive, send)
+    return status.get("code")
+
+def wav_payload():
+    import numpy as np, soundfile as sf
+    sr = 16000
+    t = np.arange(sr) / sr
+    buffer = io.BytesIO()
+    sf.write(buffer, 0.5 * np.sin(2 * np.pi * 440 * t), sr, format="WAV")
+    return json.dumps({"audio_base64": base64.b64encode(buffer.getvalue()).decode(), "language": "English"}).encode()
+
+async def run():
+    results = {"import_main_s": t_import}
+    for name, method, path in [("health", "GET", "/health"), ("root", "GET", "/")]:
+        start = time.perf_counter()
+        code = await call(method, path)
+        results[f"first_{name}_s"] = time.perf_counter() - start
+        results[f"first_{name}_status"] = code
+    if "--detect" in sys.argv:
+        body = wav_payload()  # built before timing; numpy is imported here on purpose
+        start = time.perf_counter()
+        code = await call("POST", "/detect", body, [(b"content-type", b"application/json")])
+        results["first_detect_s"] = time.perf_counter() - start
+        results["first_detect_status"] = code
+    results["since_interpreter_start_s"] = time.perf_counter() - t0
+    main.engine.shutdown()
+    print(json.dumps(results))
+
+asyncio.run(run())
+"""
+
+
+def import_times(module: str, env: dict, top: int = 8):
+    """
+    Imports ``module`` in a fresh interpreter with -X importtime and returns its
+    cumulative time plus the heaviest top-level dependencies (seconds).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        # one space after the separator, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(cumulative_us)))
+    total = next((cum for name, depth, cum in reversed(rows) if depth == 0 and name == module), None)
+    direct = [(name, cum) for name, depth, cum in rows if depth == 1]
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "module": module,
+        "cumulative_s": (total or 0) / 1e6,
+        "heaviest_imports": [{"module": name, "cumulative_s": cum / 1e6} for name, cum in direct[:top]],
+    }
+
+
+def first_responses(env: dict, detect: bool):
+    args = [sys.executable, "-c", _FIRST_RESPONSE_SCRIPT]
+    if detect:
+        args.append("--detect")
+    proc = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip()[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import and first-response times.")
+    parser.add_argument("--lazy", action="store_true", help="use the serverless lazy-loading defaults")
+    parser.add_argument("--no-detect", action="store_true", help="skip the first /detect measurement")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh-interpreter runs per measurement (best is kept)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("VOICE_WORKERS", "1")
+    if args.lazy:
+        env["VOICE_LAZY_LOAD"] = "1"
+        env["VOICE_EXECUTOR"] = "thread"
+
+    modules = []
+    for module in TRACKED_MODULES:
+        runs = [import_times(module, env) for _ in range(args.repeat)]
+        ok = [r for r in runs if "error" not in r]
+        modules.append(min(ok, key=lambda r: r["cumulative_s"]) if ok else runs[0])
+    responses = [first_responses(env, not args.no_detect) for _ in range(args.repeat)]
+    ok = [r for r in responses if "error" not in r]
+    response = min(ok, key=lambda r: r["first_health_s"] + r["import_main_s"]) if ok else responses[0]
+
+    print(f"{'module':<16}{'import (ms)':>12}  heaviest dependencies")
+    for entry in modules:
+        if "error" in entry:
+            print(f"{entry['module']:<16}{'n/a':>12}  {entry['error']}")
+            continue
+        heaviest = ", ".join(f"{d['module']} {d['cumulative_s'] * 1000:.0f}" for d in entry["heaviest_imports"][:3])
+        print(f"{entry['module']:<16}{entry['cumulative_s'] * 1000:>12.1f}  {heaviest}")
+    print()
+    for key, value in response.items():
+        print(f"{key:<28}{value * 1000:>10.1f} ms" if key.endswith("_s") else f"{key:<28}{value!s:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"lazy": args.lazy, "modules": modules, "first_responses": response}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
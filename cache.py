@@ -0,0 +1,188 @@
+"""
+Content-addressed result cache.
+
+Clients often resubmit the same clip (retries, one voicemail checked by several
+services). Results are keyed by a fast hash of the decoded audio bytes plus the
+language and model version, so a hit skips decode, feature extraction and
+inference entirely.
+
+The memory tier is an LRU bounded by entry count and approximate size, with a
+TTL. An optional on-disk tier (one JSON file per key) survives restarts; its
+reads and writes run in a thread so they do not block the event loop.
+
+Configuration (environment variables):
+    VOICE_CACHE_MAX_ENTRIES  memory tier entries, 0 disables the cache (default 1024)
+    VOICE_CACHE_MAX_BYTES    memory tier size budget (default 64 MiB)
+    VOICE_CACHE_TTL          seconds an entry stays valid, 0 means forever (default 3600)
+    VOICE_CACHE_DIR          enables the on-disk tier in this directory
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+
+def new_audio_hasher():
+    """
+    Returns an incremental hasher for audio bytes (for streamed uploads).
+    """
+    return hashlib.blake2b(digest_size=16)
+
+
+def audio_digest(audio_bytes: bytes):
+    hasher = new_audio_hasher()
+    hasher.update(audio_bytes)
+    return hasher.digest()
+
+
+def make_key(digest: bytes, language: str, model_version: str, mode: str = "clip"):
+    """
+    Combines the audio digest with everything else that affects the result.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(digest)
+    h.update(language.strip().lower().encode("utf-8"))
+    h.update(b"\0")
+    h.update(model_version.encode("utf-8"))
+    if mode != "clip":
+        # keeps keys of whole-clip results unchanged
+        h.update(b"\0" + mode.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float = 3600.0, disk_path: str = None):
+        """
+        Args:
+            max_entries: memory tier capacity; 0 disables caching.
+            max_bytes: approximate memory budget of the stored results.
+            ttl: entry lifetime in seconds; 0 keeps entries until evicted.
+            disk_path: directory for the persistent tier, or None.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+        # key -> (expires_at, size, value)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("VOICE_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.environ.get("VOICE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.environ.get("VOICE_CACHE_TTL", "3600")),
+            disk_path=os.environ.get("VOICE_CACHE_DIR") or None,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    async def get(self, key: str):
+        """
+        Returns the cached value for ``key`` or None.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if not expires_at or expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+        if self.disk_path:
+            value, expires_at = await asyncio.to_thread(self._disk_get, key, now)
+            if value is not None:
+                self._store(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        """
+        Stores a JSON-serializable result.
+        """
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else 0.0
+        self._store(key, value, expires_at)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def _store(self, key, value, expires_at):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, key[:2], f"{key}.json")
+
+    def _disk_get(self, key, now):
+        path = self._disk_file(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None, 0.0
+        expires_at = record.get("expires_at", 0.0)
+        if expires_at and expires_at <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, 0.0
+        return record.get("value"), expires_at
+
+    def _disk_set(self, key, value, expires_at):
+        path = self._disk_file(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write-then-rename so a crash never leaves a truncated entry behind.
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Cache disk write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,333 @@
+"""
+Execution engine for the detection pipeline.
+
+Decoding, feature extraction and inference are CPU bound. Running them inline in
+an ``async def`` endpoint blocks the event loop, so one large clip stalls every
+other request on the worker, ``/health`` included. The engine ships the whole
+decode -> features -> predict pipeline to a pool instead.
+
+Configuration (environment variables):
+    VOICE_EXECUTOR   "process" (default), "thread" or "inline"
+    VOICE_WORKERS    pool size, defaults to the number of CPUs
+    VOICE_MODEL_PATH model weights loaded by every worker; per-language models
+                     are added with VOICE_LANGUAGE_MODELS (see registry.py)
+    VOICE_STREAMING  "1" decodes block-wise with early resampling and a duration
+                     cap (see preprocessing.stream_features)
+    VOICE_VAD        "0" disables silence trimming before feature extraction
+                     (see preprocessing.VoiceActivityDetector)
+    VOICE_CASCADE_MODEL  tiny first-stage model over cheap features; requests it
+                         scores confidently skip the full features and model
+    VOICE_CASCADE_BAND   "low,high" AI probabilities sent on to the full model
+                         (default "0.2,0.8")
+    VOICE_SEGMENT_BATCH       windows per forward pass in segment mode (default 32)
+    VOICE_SEGMENT_EARLY_EXIT  "0" scores every window even once the vote is decided
+    VOICE_MAX_AUDIO_SECONDS   longest accepted clip according to its header,
+                              checked before decoding (default 1800, 0 disables)
+    VOICE_FINGERPRINT         "0" skips the landmark fingerprint run_features adds
+                              for the near-duplicate index (see fingerprint.py)
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+# preprocessing / model (numpy, soundfile, the inference backend) are imported
+# inside the functions below, so importing this module stays cheap and the web
+# app can answer static routes before any of them is loaded.
+
+EXECUTOR_MODES = ("process", "thread", "inline")
+STREAMING = os.environ.get("VOICE_STREAMING", "0") == "1"
+VAD = os.environ.get("VOICE_VAD", "1") == "1"
+SEGMENT_BATCH = int(os.environ.get("VOICE_SEGMENT_BATCH", "32"))
+SEGMENT_EARLY_EXIT = os.environ.get("VOICE_SEGMENT_EARLY_EXIT", "1") == "1"
+CASCADE_MODEL = os.environ.get("VOICE_CASCADE_MODEL") or None
+CASCADE_BAND = tuple(float(x) for x in os.environ.get("VOICE_CASCADE_BAND", "0.2,0.8").split(","))
+MAX_AUDIO_SECONDS = float(os.environ.get("VOICE_MAX_AUDIO_SECONDS", "1800"))
+FINGERPRINT = os.environ.get("VOICE_FINGERPRINT", "1") == "1"
+# "clip" scores whole-clip summary features, "segments" overlapping windows
+MODES = ("clip", "segments")
+
+# Model registry owned by the current worker. Created by the pool initializer
+# (process mode) or once in the parent process (thread / inline mode); it loads
+# the default model right away and per-language models on first use.
+_registry = None
+# seconds a process pool may take to bring up every worker
+START_TIMEOUT = 120
+
+
+def init_worker(model_path: str = None, loads=None, ready=None):
+    """
+    Pool initializer: create the model registry and load the default model
+    once per worker process. Returns the seconds the load took (None if the
+    registry already existed).
+
+    In a process pool the load is also put on the ``loads`` queue, and the
+    worker then waits for ``ready`` before taking work (see ExecutionEngine._start).
+    """
+    global _registry
+    if _registry is not None:
+        return None
+    from registry import ModelRegistry
+    registry = ModelRegistry.from_env(model_path, CASCADE_MODEL, CASCADE_BAND)
+    timings = {}
+    registry.get(None, timings)
+    _registry = registry
+    if loads is not None:
+        loads.put(timings["model_load"])
+        ready.wait(START_TIMEOUT)
+    return timings["model_load"]
+
+
+def compute_features(source, timings: dict = None, cascade=None, fingerprint: bool = False):
+    """
+    Decodes ``source`` (raw audio bytes or a file path) and extracts features,
+    block-wise with bounded memory when streaming mode is enabled.
+    Stage durations in seconds are recorded into ``timings`` if given; streaming
+    mode interleaves decoding with feature extraction and reports both as "features".
+    
+    With ``cascade`` (a VoiceClassifier) its first stage screens cheap features right
+    after decoding; when it is confident the full features are never computed.
+    Streaming mode computes all features in its single pass, so there the
+    cascade only saves the full model. Returns (features, result or None).
+    
+    Clips whose header declares more than MAX_AUDIO_SECONDS are rejected with
+    preprocessing.AudioTooLong before any audio is decoded.
+    
+    With ``fingerprint`` the full features carry a landmark "fingerprint".
+    """
+    from preprocessing import check_duration, cheap_features, decode_audio_source, extract_features, stream_features
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    check_duration(source, MAX_AUDIO_SECONDS)
+    if STREAMING:
+        features = stream_features(source, vad=VAD, fingerprint=fingerprint)
+        timings["features"] = time.perf_counter() - start
+        if cascade:
+            start = time.perf_counter()
+            score, result = cascade.screen(features)
+            timings["cascade"] = time.perf_counter() - start
+            if result is not None:
+                return features, result
+            features["cascade_score"] = score
+        return features, None
+    
+    y, sr = decode_audio_source(source)
+    decoded = time.perf_counter()
+    timings["decode"] = decoded - start
+    if cascade:
+        cheap = cheap_features(y, sr, vad=VAD)
+        score, result = cascade.screen(cheap)
+        screened = time.perf_counter()
+        timings["cascade"] = screened - decoded
+        if result is not None:
+            return cheap, result
+        decoded = screened
+    features = extract_features(y, sr, vad=VAD, fingerprint=fingerprint)
+    timings["features"] = time.perf_counter() - decoded
+    if cascade:
+        features["cascade_score"] = score
+    return features, None
+
+
+def summary_features(features: dict):
+    """
+    ``features`` without the per-frame arrays: the model input
+    (model.features_to_vector), duration and other summary values, and the
+    fingerprint. This is what leaves a pool worker; the per-frame arrays of a
+    long clip are tens of MB that would otherwise be pickled to the web process
+    and back to a worker for the micro-batched forward pass.
+    """
+    return {name: value for name, value in features.items() if name != "frames"}
+
+
+def run_pipeline(source, language: str, mode: str = "clip"):
+    """
+    Runs decode -> features -> predict for a single clip.
+    ``source`` is the raw audio bytes or a path to a spooled audio file.
+    In "segments" mode the clip is scored as overlapping windows in batched
+    forward passes (see VoiceClassifier.predict_segments).
+    Executed inside a pool worker; returns picklable (features, result, timings)
+    with the summary features only (see ``summary_features``).
+    """
+    timings = {}
+    classifier = _registry.get(language, timings)
+    cascade = classifier if mode == "clip" and classifier.has_cascade else None
+    features, result = compute_features(source, timings, cascade)
+    if result is not None:
+        return summary_features(features), result, timings
+    start = time.perf_counter()
+    if mode == "segments":
+        from preprocessing import segment_features
+        result = classifier.predict_segments(segment_features(features), SEGMENT_BATCH, SEGMENT_EARLY_EXIT)
+    else:
+        result = classifier.predict(features)
+    timings["predict"] = time.perf_counter() - start
+    return summary_features(features), result, timings
+
+
+def run_features(source, language: str):
+    """
+    Runs decode -> features only; inference is left to the micro-batcher (or
+    skipped on a fingerprint match). Returns (features, result, timings) with
+    the summary features only, which is what ``run_predict_batch`` takes back;
+    result is None unless the cascade's first stage already decided.
+    """
+    timings = {}
+    classifier = _registry.get(language, timings)
+    features, result = compute_features(source, timings, classifier if classifier.has_cascade else None, FINGERPRINT)
+    return summary_features(features), result, timings
+
+
+def run_predict_batch(batch: list):
+    """
+    Runs the (language, features) items of a micro-batch with one vectorized
+    forward pass per language model. ``features`` only needs the summary
+    values (see ``summary_features``). Returns (results in input order,
+    {language: seconds} for the models this call had to load).
+    """
+    groups = {}
+    loads = {}
+    for index, (language, features) in enumerate(batch):
+        timings = {}
+        groups.setdefault(_registry.get(language, timings), []).append((index, features))
+        if "model_load" in timings:
+            loads[language] = timings["model_load"]
+    results = [None] * len(batch)
+    for classifier, items in groups.items():
+        for (index, _), result in zip(items, classifier.predict_batch([features for _, features in items])):
+            results[index] = result
+    return results, loads
+
+
+def run_predict_vectors(language: str, matrix):
+    """
+    Scores rows already in the model input layout (e.g. read from a feature
+    store) with one forward pass of the language's model. Returns (results,
+    timings), timings holding "model_load" if the model had to be loaded.
+    """
+    timings = {}
+    classifier = _registry.get(language, timings)
+    return classifier.predict_vectors(matrix), timings
+
+
+class ExecutionEngine:
+    def __init__(self, mode: str = "process", workers: int = None, model_path: str = None, on_model_load=None):
+        """
+        Args:
+            mode: "process" runs the pipeline in a process pool (one classifier per
+                worker), "thread" in a thread pool sharing one classifier (useful when
+                the heavy stages release the GIL), "inline" on the calling thread.
+            workers: pool size, defaults to the number of CPUs.
+            model_path: passed to every worker's VoiceClassifier.
+            on_model_load: called with the seconds each worker (or the shared
+                classifier) took to load the default model at start.
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.model_path = model_path
+        self.on_model_load = on_model_load
+        self._pool = None
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, on_model_load=None):
+        return cls(
+            mode=os.environ.get("VOICE_EXECUTOR", "process"),
+            workers=int(os.environ.get("VOICE_WORKERS", "0")) or None,
+            model_path=os.environ.get("VOICE_MODEL_PATH") or None,
+            on_model_load=on_model_load,
+        )
+
+    def start(self):
+        """
+        Creates the pool and loads the classifier in every worker.
+        Called from the app lifespan or a warm-up hook; ``run`` also starts the
+        engine lazily on first use.
+        """
+        with self._start_lock:
+            if not self._started:
+                self._start()
+
+    def _start(self):
+        if self.mode == "process":
+            try:
+                # spawn: never fork a process that is already running an event loop
+                context = multiprocessing.get_context("spawn")
+                loads, ready = context.Queue(), context.Event()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=init_worker,
+                    initargs=(self.model_path, loads, ready),
+                )
+                # Workers are spawned on demand, one per submission while none
+                # is idle. They hold off taking work until ``ready``, so one
+                # submission each brings them all up (and loads their models)
+                # before the first real request; each reports its load once.
+                futures = [self._pool.submit(os.getpid) for _ in range(self.workers)]
+                reported = []
+                deadline = time.monotonic() + START_TIMEOUT
+                try:
+                    while len(reported) < self.workers:
+                        reported.append(loads.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    print(f"Only {len(reported)} of {self.workers} workers loaded their model "
+                          f"within {START_TIMEOUT}s; starting anyway.")
+                finally:
+                    ready.set()
+                for future in futures:
+                    future.result()
+                self._report_loads(reported)
+            except (OSError, NotImplementedError, BrokenExecutor) as e:
+                # e.g. serverless sandboxes without /dev/shm semaphores
+                print(f"Process pool unavailable ({e}); falling back to threads.")
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                self.mode = "thread"
+        if self.mode in ("thread", "inline"):
+            # one classifier shared by every thread, loaded once per process
+            seconds = init_worker(self.model_path)
+            self._report_loads([seconds] if seconds is not None else [])
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="voice")
+        self._started = True
+
+    def _report_loads(self, loads):
+        if self.on_model_load is not None:
+            for seconds in loads:
+                self.on_model_load(seconds)
+
+    @property
+    def started(self):
+        return self._started
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        self._started = False
+
+    async def run(self, fn, *args):
+        """
+        Runs ``fn(*args)`` on the engine and awaits the result without blocking
+        the event loop.
+        """
+        if not self._started:
+            # Loading the model can take a while; keep the event loop free meanwhile
+            await asyncio.to_thread(self.start)
+        if self.mode == "inline":
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, fn, *args)
+        except BrokenExecutor:
+            # A worker died (OOM, segfault in a codec). Rebuild the pool for the
+            # next request instead of failing every request from now on.
+            self.shutdown()
+            raise
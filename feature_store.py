@@ -0,0 +1,436 @@
+"""
+Memory-mapped on-disk store of extracted features, for re-scoring a corpus.
+
+Decoding and feature extraction dominate the cost of scoring an archive, and
+neither depends on the model. ``batch_score.py --store`` keeps what
+preprocessing.extract_features computed for every clip; when only the model
+changes, ``batch_score.py --rescore`` reads the features back and sends them
+to the model in batches without decoding anything.
+
+A store is a directory:
+    CURRENT                        name of the live generation directory
+    gen-000001/meta.json           feature parameters and pipeline settings the
+                                   store was written with
+    gen-000001/index.bin           one fixed-size record per appended clip: content
+                                   hash (cache.audio_digest of the audio bytes),
+                                   language, deleted flag, first frame, frame count
+    gen-000001/summary.f32         float32 (clips, SUMMARY_WIDTH): the model input
+                                   (model.features_to_vector), then SUMMARY_EXTRA
+    gen-000001/frames.<name>.f32   float32 (frames, width) per FRAME_COLUMNS
+                                   feature, all clips back to back
+
+All files are append-only and read through numpy memory maps, so a batch of
+clips is a slice of the page cache. Appending a hash again supersedes the
+earlier record and ``remove`` flags a record deleted; both leave dead rows
+behind until ``compact`` copies the live records into a new generation and
+switches CURRENT over to it. Index records are written after the data they
+point to, and data past the last complete record is cut off when the store is
+opened, so an interrupted run loses at most the clips it had not flushed.
+One process may write a store at a time; any number may read it.
+
+Besides the layout, meta.json records the pipeline settings that change the
+feature values (VOICE_VAD, VOICE_STREAMING with VOICE_TARGET_SR and
+VOICE_MAX_DURATION). Appending to or re-scoring a store
+under different settings is refused, since the stored features would no
+longer be what the server computes; ``info`` and ``compact`` work either way.
+
+    python feature_store.py info features/
+    python feature_store.py compact features/
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from model import FEATURE_DIM, N_MFCC, SCALAR_FEATURES, features_to_vector
+from preprocessing import HOP_LENGTH, N_FFT, N_MELS
+
+FORMAT_VERSION = 1
+# summary columns after the model input; NaN where a clip has no value
+SUMMARY_EXTRA = ("duration", "speech_duration", "source_duration", "sample_rate")
+SUMMARY_WIDTH = FEATURE_DIM + len(SUMMARY_EXTRA)
+# per-frame arrays of extract_features and their widths (bands per frame)
+FRAME_COLUMNS = {
+    "rms": 1,
+    "zero_crossing_rate": 1,
+    "spectral_centroid": 1,
+    "spectral_rolloff": 1,
+    "spectral_flatness": 1,
+    "mel_spectrogram": N_MELS,
+    "mfcc": N_MFCC,
+}
+INDEX_DTYPE = np.dtype([
+    ("key", "u1", (16,)),
+    ("language", "S15"),
+    ("deleted", "u1"),
+    ("frame_start", "<i8"),
+    ("frames", "<i8"),
+])
+# live records copied per step by compact
+COMPACT_BATCH = 4096
+
+
+def _settings():
+    """
+    Pipeline settings behind the feature values (see executor.py); the
+    streaming decoder's rate and duration cap only apply in streaming mode.
+    """
+    import executor
+    from preprocessing import STREAM_MAX_SECONDS, STREAM_TARGET_SR
+    return {
+        "vad": executor.VAD,
+        "streaming": executor.STREAMING,
+        "target_sr": STREAM_TARGET_SR if executor.STREAMING else None,
+        "max_duration": STREAM_MAX_SECONDS if executor.STREAMING else None,
+    }
+
+
+def _meta():
+    return {
+        "format": FORMAT_VERSION,
+        "n_fft": N_FFT,
+        "hop_length": HOP_LENGTH,
+        "n_mels": N_MELS,
+        "n_mfcc": N_MFCC,
+        "summary": SCALAR_FEATURES + [f"mfcc_{i}" for i in range(N_MFCC)] + list(SUMMARY_EXTRA),
+        "frames": FRAME_COLUMNS,
+        "settings": _settings(),
+    }
+
+
+def _as_key(key):
+    key = bytes.fromhex(key) if isinstance(key, str) else bytes(key)
+    if len(key) != 16:
+        raise ValueError("Feature store keys are 16-byte content hashes (cache.audio_digest)")
+    return key
+
+
+class FeatureStore:
+    def __init__(self, path: str, flush_every: int = 256, check_settings: bool = True):
+        """
+        Opens the store at ``path``, creating it if needed.
+
+        Args:
+            path: store directory.
+            flush_every: appended clips buffered before their index records
+                are written (``flush`` and ``close`` write them too).
+            check_settings: refuse a store written under different pipeline
+                settings (ValueError); the feature layout is always checked.
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.check_settings = check_settings
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(os.path.join(path, "CURRENT"), "r", encoding="utf-8") as f:
+                self.generation = f.read().strip()
+        except FileNotFoundError:
+            self.generation = self._create_generation(1)
+            self._set_current(self.generation)
+        self._files = None
+        self._maps = None
+        self._pending = []
+        self._open_generation()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return _as_key(key) in self._keys
+
+    def _file(self, name: str):
+        return os.path.join(self.path, self.generation, name)
+
+    def _create_generation(self, number: int, meta: dict = None):
+        generation = f"gen-{number:06d}"
+        os.makedirs(os.path.join(self.path, generation), exist_ok=True)
+        with open(os.path.join(self.path, generation, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta or _meta(), f, indent=2)
+        return generation
+
+    def _set_current(self, generation: str):
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".current-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(generation + "\n")
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+
+    def _open_generation(self):
+        """
+        Checks the feature parameters and settings, cuts off a partially
+        written tail and builds the key -> record map.
+        """
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        expected = json.loads(json.dumps(_meta()))
+        settings = expected.pop("settings")
+        changed = sorted(name for name in expected if meta.get(name) != expected[name])
+        if changed:
+            raise ValueError(f"Feature store {self.path} was written with different feature parameters "
+                             f"({', '.join(changed)}); extract the features into a new store")
+        stored = meta.get("settings") or {}
+        changed = [f"{name}: {stored.get(name)} in the store, {value} now"
+                   for name, value in settings.items() if stored.get(name) != value]
+        if changed and self.check_settings:
+            raise ValueError(f"Feature store {self.path} was extracted with different pipeline settings "
+                             f"({'; '.join(changed)}); run with the store's settings or extract into a new store")
+        self.meta = meta
+
+        index_path = self._file("index.bin")
+        n = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=n) if n else np.zeros(0, dtype=INDEX_DTYPE)
+        ends = index["frame_start"] + index["frames"]
+        rows = self._size("summary.f32") // (4 * SUMMARY_WIDTH)
+        frames = min(self._size(f"frames.{name}.f32") // (4 * width) for name, width in FRAME_COLUMNS.items())
+        valid = (np.arange(n) < rows) & (ends <= frames)
+        # records are only trusted up to the first one whose data is incomplete
+        self.count = n if valid.all() else int(np.argmin(valid))
+        self.frame_count = int(ends[self.count - 1]) if self.count else 0
+        self._truncate("index.bin", self.count * INDEX_DTYPE.itemsize)
+        self._truncate("summary.f32", self.count * 4 * SUMMARY_WIDTH)
+        for name, width in FRAME_COLUMNS.items():
+            self._truncate(f"frames.{name}.f32", self.frame_count * 4 * width)
+
+        self._keys = {}
+        raw = np.ascontiguousarray(index["key"][:self.count]).tobytes()
+        for i, deleted in enumerate(index["deleted"][:self.count]):
+            key = raw[16 * i:16 * (i + 1)]
+            if deleted:
+                self._keys.pop(key, None)
+            else:
+                self._keys[key] = i
+
+    def _size(self, name: str):
+        try:
+            return os.path.getsize(self._file(name))
+        except FileNotFoundError:
+            return 0
+
+    def _truncate(self, name: str, size: int):
+        if self._size(name) > size:
+            with open(self._file(name), "r+b") as f:
+                f.truncate(size)
+
+    def append(self, key, features: dict, language: str = ""):
+        """
+        Adds the ``extract_features`` output of the audio whose content hash is
+        ``key``; a clip already stored under that hash is superseded.
+        """
+        key = _as_key(key)
+        per_frame = features.get("frames")
+        if per_frame is None:
+            raise ValueError("Only full extract_features output (with per-frame arrays) can be stored")
+        if self._files is None:
+            self._files = {name: open(self._file(name), "ab") for name in ("summary.f32", "index.bin")}
+            for name in FRAME_COLUMNS:
+                self._files[name] = open(self._file(f"frames.{name}.f32"), "ab")
+
+        row = np.empty(SUMMARY_WIDTH, dtype="<f4")
+        row[:FEATURE_DIM] = features_to_vector(features)
+        row[FEATURE_DIM:] = [features.get(name, np.nan) for name in SUMMARY_EXTRA]
+        self._files["summary.f32"].write(row.tobytes())
+        n_frames = len(per_frame["rms"])
+        for name in FRAME_COLUMNS:
+            values = np.asarray(per_frame[name], dtype="<f4")
+            # (n_bands, n_frames) spectrograms are stored frame by frame
+            self._files[name].write(np.ascontiguousarray(values.T if values.ndim == 2 else values).tobytes())
+
+        record = np.zeros((), dtype=INDEX_DTYPE)
+        record["key"] = np.frombuffer(key, dtype=np.uint8)
+        record["language"] = (language or "").encode("utf-8")[:15]
+        record["frame_start"] = self.frame_count
+        record["frames"] = n_frames
+        self._pending.append(record.tobytes())
+        self._keys[key] = self.count
+        self.count += 1
+        self.frame_count += n_frames
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffered clips: their data first, then the index records that
+        make them visible.
+        """
+        if self._files is None:
+            return
+        for name, f in self._files.items():
+            if name != "index.bin":
+                f.flush()
+        if self._pending:
+            self._files["index.bin"].write(b"".join(self._pending))
+            self._pending.clear()
+        self._files["index.bin"].flush()
+        self._maps = None
+
+    def close(self):
+        self.flush()
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self._files = None
+        self._maps = None
+
+    def _view(self):
+        """
+        Read-only memory maps of the flushed records: (index, summary, frames).
+        """
+        if self._pending:
+            self.flush()
+        if self._maps is None:
+            def mapped(name, dtype, shape):
+                if not shape[0]:
+                    return np.zeros(shape, dtype=dtype)
+                return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+            self._maps = (
+                mapped("index.bin", INDEX_DTYPE, (self.count,)),
+                mapped("summary.f32", "<f4", (self.count, SUMMARY_WIDTH)),
+                {name: mapped(f"frames.{name}.f32", "<f4", (self.frame_count, width))
+                 for name, width in FRAME_COLUMNS.items()},
+            )
+        return self._maps
+
+    def get(self, key):
+        """
+        The stored features of ``key`` in the ``extract_features`` layout, or
+        None. Per-frame arrays are read-only views of the memory maps.
+        """
+        record = self._keys.get(_as_key(key))
+        if record is None:
+            return None
+        index, summary, frames = self._view()
+        row = summary[record]
+        features = {name: float(row[i]) for i, name in enumerate(SCALAR_FEATURES)}
+        features["mfcc_mean"] = np.array(row[len(SCALAR_FEATURES):FEATURE_DIM])
+        for i, name in enumerate(SUMMARY_EXTRA):
+            value = float(row[FEATURE_DIM + i])
+            if not np.isnan(value):
+                features[name] = int(value) if name == "sample_rate" else value
+        start, n = int(index[record]["frame_start"]), int(index[record]["frames"])
+        features["frames"] = {
+            name: frames[name][start:start + n, 0] if width == 1 else frames[name][start:start + n].T
+            for name, width in FRAME_COLUMNS.items()
+        }
+        return features
+
+    def remove(self, key):
+        """
+        Flags the record of ``key`` deleted. Returns False if it was not stored.
+        """
+        record = self._keys.pop(_as_key(key), None)
+        if record is None:
+            return False
+        self.flush()
+        with open(self._file("index.bin"), "r+b") as f:
+            f.seek(record * INDEX_DTYPE.itemsize + INDEX_DTYPE.fields["deleted"][1])
+            f.write(b"\x01")
+        self._maps = None
+        return True
+
+    def live_records(self):
+        """
+        Record numbers of the stored clips (latest, not deleted), in file order.
+        """
+        return np.fromiter(sorted(self._keys.values()), dtype=np.int64, count=len(self._keys))
+
+    def iter_batches(self, batch_size: int = 1024):
+        """
+        Yields (keys, languages, summary) for the stored clips in batches:
+        16-byte content hashes, language names and a float32 copy of the
+        summary rows, shape (batch, SUMMARY_WIDTH). ``summary[:, :FEATURE_DIM]``
+        is the model input (see VoiceClassifier.predict_vectors).
+        """
+        records = self.live_records()
+        index, summary, _ = self._view()
+        for start in range(0, len(records), max(1, batch_size)):
+            chunk = records[start:start + batch_size]
+            entries = index[chunk]
+            keys = np.ascontiguousarray(entries["key"]).tobytes()
+            yield (
+                [keys[16 * i:16 * (i + 1)] for i in range(len(chunk))],
+                [language.decode("utf-8", "replace") for language in entries["language"]],
+                np.array(summary[chunk]),
+            )
+
+    def compact(self):
+        """
+        Copies the live records into a new generation, switches CURRENT to it
+        and deletes the old one. Readers that still map the old files keep
+        reading them until they reopen the store. Returns the bytes freed.
+        """
+        self.flush()
+        before = self.stats()["bytes"]
+        records = self.live_records()
+        index, summary, frames = self._view()
+        # the copied features keep the settings they were extracted with
+        generation = self._create_generation(int(self.generation.rsplit("-", 1)[1]) + 1, self.meta)
+        directory = os.path.join(self.path, generation)
+        outputs = {name: open(os.path.join(directory, name), "wb") for name in ("summary.f32", "index.bin")}
+        for name in FRAME_COLUMNS:
+            outputs[name] = open(os.path.join(directory, f"frames.{name}.f32"), "wb")
+        frame_count = 0
+        try:
+            for start in range(0, len(records), COMPACT_BATCH):
+                chunk = records[start:start + COMPACT_BATCH]
+                entries = np.array(index[chunk])
+                outputs["summary.f32"].write(np.ascontiguousarray(summary[chunk]).tobytes())
+                for name in FRAME_COLUMNS:
+                    for first, n in zip(entries["frame_start"], entries["frames"]):
+                        outputs[name].write(frames[name][first:first + n].tobytes())
+                entries["frame_start"] = frame_count + np.concatenate([[0], np.cumsum(entries["frames"])[:-1]])
+                frame_count += int(entries["frames"].sum())
+                outputs["index.bin"].write(entries.tobytes())
+            for f in outputs.values():
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in outputs.values():
+                f.close()
+
+        old = os.path.join(self.path, self.generation)
+        self.close()
+        self._set_current(generation)
+        self.generation = generation
+        self._open_generation()
+        shutil.rmtree(old, ignore_errors=True)
+        return before - self.stats()["bytes"]
+
+    def stats(self):
+        directory = os.path.join(self.path, self.generation)
+        return {
+            "generation": self.generation,
+            "clips": len(self._keys),
+            "records": self.count,
+            "dead_records": self.count - len(self._keys),
+            "frames": self.frame_count,
+            "bytes": sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)),
+            "settings": self.meta.get("settings"),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or compact a feature store.")
+    parser.add_argument("command", choices=("info", "compact"))
+    parser.add_argument("path", help="feature store directory")
+    args = parser.parse_args(argv)
+    if not os.path.exists(os.path.join(args.path, "CURRENT")):
+        raise SystemExit(f"{args.path} is not a feature store")
+    with FeatureStore(args.path, check_settings=False) as store:
+        if args.command == "compact":
+            freed = store.compact()
+            print(f"Compacted {args.path}: {freed / 2**20:.1f} MiB freed", file=sys.stderr)
+        print(json.dumps(store.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
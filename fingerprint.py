@@ -0,0 +1,564 @@
+"""
+Near-duplicate index over audio fingerprints.
+
+The result cache only helps when the same bytes come back. The same recording
+re-encoded, resampled or trimmed by a few hundred milliseconds hashes
+differently, but its spectral peaks (preprocessing.LandmarkFingerprinter) stay
+where they were. Every clip the model scores is added here with its verdict;
+a later clip whose landmarks line up with a stored clip's, at one consistent
+time offset, gets that verdict back without running the model.
+
+Landmark hashes live in numpy arrays sorted by hash (hash, clip, anchor frame)
+with a table of where each hash prefix starts, so a lookup reads a handful of
+entries per query hash and votes over the ones that really match. Recent
+additions wait in a small sorted run that is searched the same way, until
+they are merged in off the event loop. Lookups are blocking as well; the API
+runs them on a thread.
+
+With VOICE_FINGERPRINT_PATH the merged index is a directory of ``.npy`` files
+that every server process memory-maps, so prefork workers share one copy in
+the page cache. A process merges its additions under an exclusive file lock
+on top of the newest generation on disk (whoever wrote it) and switches
+CURRENT to the result; the others pick the new generation up within
+VOICE_FINGERPRINT_REFRESH seconds. Additions are shared once merged, i.e.
+every ``merge_every`` landmarks and at shutdown. Without a path each process
+keeps a private index in memory.
+
+Configuration (environment variables):
+    VOICE_FINGERPRINT                 "0" disables fingerprinting (default "1")
+    VOICE_FINGERPRINT_PATH            directory the index is kept in and shared through
+    VOICE_FINGERPRINT_MAX_CLIPS       clips kept, oldest dropped first (default 1000000)
+    VOICE_FINGERPRINT_LANDMARKS       landmarks stored per clip (default 32)
+    VOICE_FINGERPRINT_MIN_SIMILARITY  share of a stored clip's landmarks a match
+                                      must hit (default 0.3, and at least 8)
+    VOICE_FINGERPRINT_REFRESH         seconds between checks for generations
+                                      merged by other processes (default 10)
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (Windows): one process per path
+    fcntl = None
+
+# numpy is imported inside the methods, so importing this module stays cheap
+# for the web app's static routes (see VOICE_LAZY_LOAD).
+
+# matched landmarks must agree on the offset within this many frames
+OFFSET_TOLERANCE = 1
+# hash prefixes shared by more stored entries than this carry no information
+MAX_BUCKET = 4096
+# prefix table sized for about this many entries per prefix
+BUCKET_TARGET = 2
+# anchor frames of the fingerprint grid (preprocessing.FINGERPRINT_HOP / FINGERPRINT_SR)
+FRAME_SECONDS = 256 / 8000
+# prefix bits of the pending run's table (fixed, so additions update it in place)
+PENDING_BITS = 16
+# arrays of a merged generation, one .npy file each
+_ARRAYS = ("hashes", "clips", "times", "offsets", "is_ai", "confidence", "model", "count")
+
+
+class _Merged:
+    """
+    One immutable generation of the merged index. Per-clip columns are indexed
+    by clip id - ``first``. Arrays are memory maps when loaded from disk.
+    """
+    def __init__(self, arrays: dict = None, first: int = 0, models: list = None, shift: int = 32,
+                 generation: str = None):
+        import numpy as np
+        arrays = arrays or {}
+        self.hashes = arrays.get("hashes", np.zeros(0, dtype=np.uint32))
+        self.clips = arrays.get("clips", np.zeros(0, dtype=np.uint32))
+        self.times = arrays.get("times", np.zeros(0, dtype=np.uint16))
+        self.offsets = arrays.get("offsets", np.zeros(2, dtype=np.uint32))
+        self.is_ai = arrays.get("is_ai", np.zeros(0, dtype=np.int8))
+        self.confidence = arrays.get("confidence", np.zeros(0, dtype=np.float32))
+        self.model = arrays.get("model", np.zeros(0, dtype=np.uint16))
+        self.count = arrays.get("count", np.zeros(0, dtype=np.uint8))
+        self.first = first
+        self.models = models or []
+        self.shift = shift
+        self.generation = generation
+
+    @property
+    def clips_stored(self):
+        return len(self.count)
+
+    @property
+    def next_clip(self):
+        return self.first + len(self.count)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+
+class FingerprintIndex:
+    def __init__(self, enabled: bool = True, path: str = None, max_clips: int = 1_000_000,
+                 landmarks: int = 32, min_similarity: float = 0.3, min_votes: int = 8,
+                 merge_every: int = 1 << 16, refresh_seconds: float = 10.0):
+        """
+        Args:
+            enabled: False turns lookups and additions into no-ops.
+            path: directory the merged index is loaded from, written to and
+                shared through with other processes.
+            max_clips: clips kept; the oldest are dropped at the next merge.
+            landmarks: strongest landmarks stored per clip.
+            min_similarity, min_votes: a match needs this share (and number)
+                of the stored clip's landmarks at one offset.
+            merge_every: pending landmarks that trigger a merge into the sorted arrays.
+            refresh_seconds: how often to look for generations merged by other processes.
+        """
+        self.enabled = enabled
+        self.path = path
+        self.max_clips = max_clips
+        self.landmarks = landmarks
+        self.min_similarity = min_similarity
+        self.min_votes = min_votes
+        self.merge_every = merge_every
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merged = None
+        # additions not merged yet: (hashes, clips, times, ids, offsets) sorted
+        # by hash with a PENDING_BITS prefix table; clips are local ids
+        # (0 = oldest pending clip), ids are negative serials
+        self._pending = None
+        self._serial = 0
+        self._is_ai = array("b")
+        self._confidence = array("f")
+        self._model = array("H")
+        self._count = array("B")
+        self._models = []
+        self._task = None
+        self._wakeup = None
+        self.lookups = 0
+        self.matches = 0
+        self.lookup_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get("VOICE_FINGERPRINT", "1") == "1",
+            path=os.environ.get("VOICE_FINGERPRINT_PATH") or None,
+            max_clips=int(os.environ.get("VOICE_FINGERPRINT_MAX_CLIPS", "1000000")),
+            landmarks=int(os.environ.get("VOICE_FINGERPRINT_LANDMARKS", "32")),
+            min_similarity=float(os.environ.get("VOICE_FINGERPRINT_MIN_SIMILARITY", "0.3")),
+            refresh_seconds=float(os.environ.get("VOICE_FINGERPRINT_REFRESH", "10")),
+        )
+
+    @property
+    def pending_clips(self):
+        return len(self._count)
+
+    @property
+    def clips(self):
+        return (self._merged.clips_stored if self._merged is not None else 0) + self.pending_clips
+
+    async def start(self):
+        if not self.enabled:
+            return
+        if self.path and os.path.isfile(self.path):
+            print(f"VOICE_FINGERPRINT_PATH {self.path} is a file, expected a directory; "
+                  f"keeping the index in memory only")
+            self.path = None
+        if self.path:
+            start = time.perf_counter()
+            if await asyncio.to_thread(self.refresh):
+                print(f"Loaded {self.clips} fingerprints from {self.path} in {time.perf_counter() - start:.2f}s")
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._maintain())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled and self.path and self.pending_clips:
+            await asyncio.to_thread(self.merge)
+
+    async def _maintain(self):
+        """
+        Merges once enough additions are pending, and otherwise picks up
+        generations other processes merged.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.refresh_seconds or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if len(self._pending_ids()) >= self.merge_every:
+                    await asyncio.to_thread(self.merge)
+                elif self.path:
+                    await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"Fingerprint index maintenance failed: {e}")
+
+    def _pending_ids(self):
+        pending = self._pending
+        return pending[3] if pending is not None else ()
+
+    def lookup(self, fingerprint: dict, model_version: str):
+        """
+        Finds a stored clip scored by ``model_version`` whose landmarks match
+        ``fingerprint`` (a preprocessing "fingerprint" entry) at one time offset.
+        Returns {"clip", "similarity", "votes", "offset_seconds",
+        "classification", "confidence_score"} or None. Blocking.
+        """
+        if not self.enabled or not len(fingerprint["hashes"]):
+            return None
+        import numpy as np
+        start = time.perf_counter()
+        with self._lock:
+            merged, pending = self._merged, self._pending
+            # merge() replaces these columns rather than trimming them, so the
+            # local ids of this snapshot stay valid
+            pending_columns = (self._is_ai, self._confidence, self._count)
+            pending_codes = self._model.tobytes()
+            pending_model = self._models.index(model_version) if model_version in self._models else None
+        self.lookups += 1
+        merged_model = merged.models.index(model_version) if merged is not None and model_version in merged.models else None
+        if merged_model is None and pending_model is None:
+            self.lookup_seconds += time.perf_counter() - start
+            return None
+        hashes = fingerprint["hashes"]
+        times = fingerprint["times"].astype(np.int32)
+
+        # candidates in one index space: merged clips first, then pending ones
+        n_merged = merged.clips_stored if merged is not None else 0
+        clips, shifts, entries = [], [], []
+        if merged_model is not None and len(merged.hashes):
+            entry, query = _bucket_matches(merged.hashes, merged.offsets, merged.shift, hashes)
+            index = merged.clips[entry].astype(np.int64) - merged.first
+            valid = merged.model[index] == merged_model
+            clips.append(index[valid])
+            shifts.append(merged.times[entry[valid]].astype(np.int32) - times[query[valid]])
+            entries.append(entry[valid])
+        if pending_model is not None and pending is not None:
+            pending_hashes, local, pending_times, ids, offsets = pending
+            entry, query = _bucket_matches(pending_hashes, offsets, 32 - PENDING_BITS, hashes)
+            index = local[entry].astype(np.int64)
+            valid = np.frombuffer(pending_codes, dtype=np.uint16)[index] == pending_model
+            clips.append(index[valid] + n_merged)
+            shifts.append(pending_times[entry[valid]].astype(np.int32) - times[query[valid]])
+            entries.append(ids[entry[valid]])
+        match = None
+        if clips and sum(len(c) for c in clips):
+            match = self._vote(np.concatenate(clips), np.concatenate(shifts), np.concatenate(entries))
+        if match is not None:
+            clip = match.pop("index")
+            if clip < n_merged:
+                stored, is_ai, confidence = merged.count[clip], merged.is_ai[clip], merged.confidence[clip]
+                match["clip"] = merged.first + clip
+            else:
+                local_clip = clip - n_merged
+                is_ai, confidence, stored = (column[local_clip] for column in pending_columns)
+                # provisional: pending clips get their id when merged
+                match["clip"] = (merged.next_clip if merged is not None else 0) + local_clip
+            similarity = min(1.0, match["votes"] / max(int(stored), 1))
+            if similarity < self.min_similarity:
+                match = None
+            else:
+                match.update(
+                    similarity=round(similarity, 4),
+                    classification="AI-Generated" if is_ai else "Human",
+                    confidence_score=round(float(confidence), 4),
+                )
+        self.lookup_seconds += time.perf_counter() - start
+        if match is not None:
+            self.matches += 1
+        return match
+
+    def _vote(self, index, shifts, entries):
+        """
+        Best (clip, offset) by votes; returns {"index", "votes", "offset_seconds"} or None.
+        """
+        import numpy as np
+        # one vote per (clip, offset); neighbouring offsets count along
+        key = (index << 20) | (shifts + (1 << 19)).astype(np.int64)
+        keys, votes = np.unique(key, return_counts=True)
+        total = votes.copy()
+        for delta in range(1, OFFSET_TOLERANCE + 1):
+            for neighbour in (keys - delta, keys + delta):
+                at = np.minimum(np.searchsorted(keys, neighbour), len(keys) - 1)
+                total += np.where(keys[at] == neighbour, votes[at], 0)
+        best = int(np.argmax(total))
+        if total[best] < self.min_votes:
+            return None
+        clip, shift = int(keys[best] >> 20), int(keys[best] & ((1 << 20) - 1)) - (1 << 19)
+        # distinct stored landmarks behind the best offset (a query landmark can
+        # occur in several of its grids)
+        near = (index == clip) & (np.abs(shifts - shift) <= OFFSET_TOLERANCE)
+        matched = len(np.unique(entries[near]))
+        if matched < self.min_votes:
+            return None
+        return {"index": clip, "votes": matched, "offset_seconds": round(shift * FRAME_SECONDS, 3)}
+
+    def add(self, fingerprint: dict, result: dict, model_version: str):
+        """
+        Stores the strongest landmarks of ``fingerprint`` with the verdict in
+        ``result`` and returns the new clip's provisional id (None when nothing
+        was stored). Wakes the background merge once enough are pending.
+        """
+        if not self.enabled or not fingerprint["anchors"]:
+            return None
+        import numpy as np
+        # per-clip counts are stored as uint8
+        count = min(fingerprint["anchors"], self.landmarks, 255)
+        order = np.argsort(fingerprint["hashes"][:count], kind="stable")
+        hashes = fingerprint["hashes"][:count][order]
+        times = fingerprint["times"][:count][order]
+        with self._lock:
+            if model_version not in self._models:
+                self._models.append(model_version)
+            local = len(self._count)
+            ids = -(self._serial + 1 + np.arange(count, dtype=np.int64))
+            self._serial += count
+            if self._pending is None:
+                self._pending = (hashes, np.full(count, local, dtype=np.uint32), times, ids,
+                                 _prefix_table(hashes, PENDING_BITS)[0])
+            else:
+                # a new sorted run; the old one stays valid for running lookups
+                pending_hashes, clips, pending_times, pending_ids, offsets = self._pending
+                at = np.searchsorted(pending_hashes, hashes, "right")
+                self._pending = (
+                    np.insert(pending_hashes, at, hashes),
+                    np.insert(clips, at, local),
+                    np.insert(pending_times, at, times),
+                    np.insert(pending_ids, at, ids),
+                    offsets + _prefix_table(hashes, PENDING_BITS)[0],
+                )
+            self._is_ai.append(result["classification"] == "AI-Generated")
+            self._confidence.append(result["confidence_score"])
+            self._model.append(self._models.index(model_version))
+            self._count.append(count)
+            merged = self._merged
+        if self._wakeup is not None and len(self._pending_ids()) >= self.merge_every:
+            self._wakeup.set()
+        return (merged.next_clip if merged is not None else 0) + local
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if not self.path or fcntl is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "LOCK"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current(self):
+        try:
+            with open(os.path.join(self.path, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self, generation: str):
+        import numpy as np
+        directory = os.path.join(self.path, generation)
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in _ARRAYS:
+            file = os.path.join(directory, f"{name}.npy")
+            # read-only maps: every process on this path shares the page cache
+            arrays[name] = np.load(file, mmap_mode="r") if os.path.getsize(file) > 128 else np.load(file)
+        return _Merged(arrays, meta["first"], meta["models"], meta["shift"], generation)
+
+    def refresh(self):
+        """
+        Switches to the newest generation on disk if another process (or an
+        earlier run) merged one. Returns True if it did. Blocking.
+        """
+        import numpy as np
+        if not self.path:
+            return False
+        with self._file_lock(exclusive=False):
+            generation = self._current()
+            merged = self._merged
+            if generation is None or (merged is not None and merged.generation == generation):
+                return False
+            loaded = self._load(generation)
+        with self._lock:
+            self._merged = loaded
+        return True
+
+    def merge(self):
+        """
+        Folds the pending landmarks into the sorted arrays, leaving out the
+        clips beyond ``max_clips``. With a path this happens under an exclusive
+        file lock on top of the newest generation on disk, which is then
+        replaced by the result. Blocking; lookups and additions keep working
+        meanwhile.
+        """
+        import numpy as np
+        with self._merge_lock, self._file_lock(exclusive=True):
+            with self._lock:
+                merged, pending = self._merged, self._pending
+                taken = len(self._count)
+                columns = {
+                    "is_ai": np.array(self._is_ai, dtype=np.int8),
+                    "confidence": np.array(self._confidence, dtype=np.float32),
+                    "model": np.array(self._model, dtype=np.uint16),
+                    "count": np.array(self._count, dtype=np.uint8),
+                }
+                local_models = list(self._models)
+            if self.path:
+                generation = self._current()
+                if generation is not None and (merged is None or merged.generation != generation):
+                    # another process merged since we last looked: build on its result
+                    merged = self._load(generation)
+            merged = merged or _Merged()
+            if not taken:
+                with self._lock:
+                    self._merged = merged
+                return
+
+            models = list(merged.models)
+            for version in local_models:
+                if version not in models:
+                    models.append(version)
+            remap = np.array([models.index(version) for version in local_models] or [0], dtype=np.uint16)
+            columns["model"] = remap[columns["model"]]
+            floor = max(merged.first, merged.next_clip + taken - self.max_clips)
+
+            hashes, clips, times = merged.hashes, merged.clips, merged.times
+            if len(clips) and merged.first < floor:
+                keep = clips >= floor
+                hashes, clips, times = hashes[keep], clips[keep], times[keep]
+            if pending is not None:
+                new_hashes, local, new_times = pending[:3]
+                new_clips = local.astype(np.int64) + merged.next_clip
+                keep = new_clips >= floor
+                new_hashes, new_clips, new_times = new_hashes[keep], new_clips[keep].astype(np.uint32), new_times[keep]
+                # linear-time merge of two sorted runs
+                at = np.searchsorted(hashes, new_hashes, "right")
+                hashes = np.insert(hashes, at, new_hashes)
+                clips = np.insert(clips, at, new_clips)
+                times = np.insert(times, at, new_times)
+            offsets, shift = _prefix_table(hashes)
+            skip_old = floor - merged.first
+            skip_new = max(0, floor - merged.next_clip)
+            arrays = {"hashes": hashes, "clips": clips, "times": times, "offsets": offsets}
+            for name in ("is_ai", "confidence", "model", "count"):
+                arrays[name] = np.concatenate([getattr(merged, name)[skip_old:], columns[name][skip_new:]])
+            result = _Merged(arrays, floor, models, shift)
+            if self.path:
+                result = self._write(result)
+
+            with self._lock:
+                self._merged = result
+                # the merged clips leave the pending run; later additions stay
+                if self._pending is not None:
+                    pending_hashes, local, pending_times, ids, _ = self._pending
+                    keep = local >= taken
+                    self._pending = (pending_hashes[keep], local[keep] - np.uint32(taken), pending_times[keep], ids[keep],
+                                     _prefix_table(pending_hashes[keep], PENDING_BITS)[0]) if keep.any() else None
+                self._is_ai = self._is_ai[taken:]
+                self._confidence = self._confidence[taken:]
+                self._count = self._count[taken:]
+                # model versions still used by later additions, renumbered
+                codes = {code: i for i, code in enumerate(sorted(set(self._model[taken:])))}
+                self._models = [self._models[code] for code in codes]
+                self._model = array("H", (codes[code] for code in self._model[taken:]))
+
+    def _write(self, merged: _Merged):
+        """
+        Writes ``merged`` as the next generation, points CURRENT at it and
+        deletes the older ones. Called under the exclusive file lock.
+        """
+        import numpy as np
+        current = self._current()
+        number = int(current.rsplit("-", 1)[1]) + 1 if current else 1
+        generation = f"gen-{number:06d}"
+        staging = tempfile.mkdtemp(dir=self.path, prefix=".staging-")
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(getattr(merged, name)))
+            with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"first": merged.first, "models": merged.models, "shift": merged.shift}, f)
+            os.rename(staging, os.path.join(self.path, generation))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".current-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(generation + "\n")
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+        for name in os.listdir(self.path):
+            if name.startswith(("gen-", ".staging-")) and name != generation:
+                # processes still mapping an old generation keep reading it until they refresh
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        return self._load(generation)
+
+    def stats(self):
+        merged, pending = self._merged, self._pending
+        stored = len(merged.hashes) if merged is not None else 0
+        pending_entries = len(pending[0]) if pending is not None else 0
+        return {
+            "enabled": self.enabled,
+            "clips": self.clips,
+            "landmarks": stored + pending_entries,
+            "pending": pending_entries,
+            "generation": merged.generation if merged is not None else None,
+            "bytes": ((merged.nbytes if merged is not None else 0) + sum(a.nbytes for a in pending or ())
+                      + self.pending_clips * 8),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "mean_lookup_ms": round(1000 * self.lookup_seconds / self.lookups, 4) if self.lookups else 0.0,
+        }
+
+
+def _bucket_matches(keys, offsets, shift: int, hashes):
+    """
+    (entry, query) index pairs where keys[entry] == hashes[query], reading only
+    the prefix buckets of the query hashes (see ``_prefix_table``).
+    """
+    import numpy as np
+    prefix = hashes >> np.uint32(shift)
+    lo = offsets[prefix].astype(np.int64)
+    counts = offsets[prefix + 1].astype(np.int64) - lo
+    counts[counts > MAX_BUCKET] = 0
+    total = int(counts.sum())
+    if not total:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    # flattened index ranges of every query hash's prefix bucket
+    entry = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)
+    query = np.repeat(np.arange(len(hashes)), counts)
+    same = keys[entry] == hashes[query]
+    return entry[same], query[same]
+
+
+def _prefix_table(hashes, bits: int = None):
+    """
+    For hashes sorted ascending: (offsets, shift) such that the entries whose
+    hash starts with prefix p (hash >> shift) are hashes[offsets[p]:offsets[p + 1]].
+    ``bits`` defaults to a table size that suits the number of hashes.
+    """
+    import numpy as np
+    if bits is None:
+        bits = min(24, max(8, (len(hashes) // BUCKET_TARGET).bit_length()))
+    shift = 32 - bits
+    counts = np.bincount(hashes >> np.uint32(shift), minlength=1 << bits)
+    offsets = np.zeros((1 << bits) + 1, dtype=np.uint32)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, shift
@@ -0,0 +1,354 @@
+"""
+Asynchronous analysis jobs backed by a local SQLite queue.
+
+Long recordings keep a ``/detect`` connection open for the whole analysis and
+run into proxy timeouts. ``POST /jobs`` instead stores the audio next to the
+queue database and returns a job ID at once; ``GET /jobs/{id}`` reports the
+status and, when done, the same response ``/detect`` would have returned.
+
+Jobs are recorded in SQLite, so queued jobs survive restarts, and jobs left
+"running" by a process that died are queued again on the next start. Workers
+take the shortest clip first (duration read from the audio header), with an
+optional aging term so long clips still get their turn under steady load.
+The database and the workers start with the first /jobs request, or at
+startup when an earlier run left a queue behind.
+
+Configuration (environment variables):
+    VOICE_JOBS_DIR           database and audio directory (default <tmp>/voice-jobs)
+    VOICE_JOBS_WORKERS       jobs analysed at the same time (default: half of VOICE_WORKERS)
+    VOICE_JOBS_AGING         seconds of clip length a job gains per second of waiting (default 0.1)
+    VOICE_JOBS_TTL           seconds finished jobs are kept (default 86400)
+    VOICE_JOBS_MAX_ATTEMPTS  starts before a job that keeps crashing its worker fails (default 3)
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+STATUSES = ("queued", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    language TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    audio_path TEXT,
+    duration REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class JobStore:
+    """
+    The SQLite side: one connection shared by the event loop's worker threads
+    (serialized by a lock), WAL mode so several server processes can share the
+    file. Every method is blocking; call them through ``asyncio.to_thread``.
+    """
+    def __init__(self, directory: str, aging: float = 0.1, max_attempts: int = 3):
+        self.directory = directory
+        self.aging = aging
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def is_open(self):
+        return self._db is not None
+
+    @property
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, "jobs.sqlite3"))
+
+    def open(self):
+        if self._db is not None:
+            return
+        os.makedirs(os.path.join(self.directory, "audio"), exist_ok=True)
+        db = sqlite3.connect(os.path.join(self.directory, "jobs.sqlite3"), timeout=10.0,
+                             isolation_level=None, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(_SCHEMA)
+        self._db = db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def audio_path(self, job_id: str):
+        return os.path.join(self.directory, "audio", f"{job_id}.audio")
+
+    def add(self, job_id: str, language: str, mode: str, cache_key: str, duration: float = None):
+        """
+        Queues a job whose audio is already at ``audio_path(job_id)``.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, language, mode, cache_key, audio_path, duration, created) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, language, mode, cache_key, self.audio_path(job_id), duration, time.time()))
+
+    def claim(self):
+        """
+        Marks the next job as running and returns it, or None when the queue is empty.
+        Order: shortest declared duration first (unknown durations last), minus
+        ``aging`` seconds per second spent waiting.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "ORDER BY COALESCE(duration, 1e9) - (? - created) * ?, created LIMIT 1",
+                    (now, self.aging)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1, owner = ? WHERE id = ?",
+                        (now, self.owner, row["id"]))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return dict(row) if row is not None else None
+
+    def complete(self, job_id: str, result: dict = None, error: dict = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                ("done" if error is None else "failed", time.time(),
+                 json.dumps(result) if result is not None else None,
+                 json.dumps(error) if error is not None else None, job_id))
+        self._remove_audio(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("result", "error"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def recover(self):
+        """
+        Requeues jobs left running by processes on this host that no longer
+        exist (or had this process's PID, e.g. PID 1 in a restarted container);
+        jobs that already used up their attempts fail instead.
+        Returns the number of requeued jobs.
+        """
+        host = socket.gethostname()
+        with self._lock:
+            rows = self._db.execute("SELECT id, owner, attempts FROM jobs WHERE status = 'running'").fetchall()
+        requeued = 0
+        for row in rows:
+            owner_host, _, pid = (row["owner"] or "").rpartition(":")
+            if row["owner"] != self.owner and (owner_host != host or _pid_alive(int(pid or 0))):
+                continue
+            if row["attempts"] >= self.max_attempts:
+                self.complete(row["id"], error={"status": 500, "detail": "Job crashed its worker too often"})
+                continue
+            with self._lock:
+                self._db.execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running'",
+                                 (row["id"],))
+            requeued += 1
+        return requeued
+
+    def release(self):
+        """
+        Requeues the jobs this process is running (graceful shutdown), without
+        counting the interrupted start as an attempt.
+        """
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'queued', owner = NULL, attempts = attempts - 1 "
+                             "WHERE status = 'running' AND owner = ?", (self.owner,))
+
+    def purge(self, older_than: float):
+        """
+        Deletes finished jobs that ended more than ``older_than`` seconds ago.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                             (time.time() - older_than,))
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def _remove_audio(self, job_id: str):
+        try:
+            os.remove(self.audio_path(job_id))
+        except OSError:
+            pass
+
+
+class JobQueue:
+    def __init__(self, run_job, directory: str, workers: int = 1, aging: float = 0.1,
+                 ttl: float = 86400.0, max_attempts: int = 3, poll_interval: float = 1.0):
+        """
+        Args:
+            run_job: async callable taking a job dict and returning the result
+                dict; a ValueError (with an optional ``status_code``) fails the
+                job with that status, anything else with 500.
+            directory: where the database and the queued audio live.
+            workers: jobs analysed concurrently by this process.
+            aging, max_attempts: see JobStore.
+            ttl: seconds finished jobs stay queryable.
+            poll_interval: how often idle workers look for jobs queued by other processes.
+        """
+        self.run_job = run_job
+        self.store = JobStore(directory, aging, max_attempts)
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._start_lock = asyncio.Lock()
+        self._tasks = []
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_env(cls, run_job, workers: int):
+        return cls(
+            run_job,
+            directory=os.environ.get("VOICE_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "voice-jobs"),
+            workers=int(os.environ.get("VOICE_JOBS_WORKERS", "0")) or workers // 2,
+            aging=float(os.environ.get("VOICE_JOBS_AGING", "0.1")),
+            ttl=float(os.environ.get("VOICE_JOBS_TTL", "86400")),
+            max_attempts=int(os.environ.get("VOICE_JOBS_MAX_ATTEMPTS", "3")),
+        )
+
+    @property
+    def started(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        """
+        Opens the store and starts the workers; called by the first ``submit`` / ``get``.
+        """
+        if self._tasks:
+            return
+        async with self._start_lock:
+            if self._tasks:
+                return
+            await asyncio.to_thread(self.store.open)
+            requeued = await asyncio.to_thread(self.store.recover)
+            if requeued:
+                print(f"Requeued {requeued} interrupted job(s)")
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def resume(self):
+        """
+        Starts right away if an earlier run left a database behind, so its
+        queued jobs are picked up again without waiting for a new request.
+        """
+        if await asyncio.to_thread(lambda: self.store.exists):
+            await self.start()
+
+    async def shutdown(self):
+        """
+        Stops the workers and puts the jobs they were running back in the queue.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # a later start may run on another event loop
+        self._wakeup = asyncio.Event()
+        self._start_lock = asyncio.Lock()
+        if self.store.is_open:
+            await asyncio.to_thread(self.store.release)
+            await asyncio.to_thread(self.store.close)
+
+    async def submit(self, spool, language: str, mode: str, cache_key: str, duration: float = None):
+        """
+        Moves the spooled audio into the job directory and queues it. Returns the job ID.
+        """
+        await self.start()
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(_save_spool, spool, self.store.audio_path(job_id))
+        await asyncio.to_thread(self.store.add, job_id, language, mode, cache_key, duration)
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str):
+        await self.start()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def stats(self):
+        counts = self.store.counts() if self.store.is_open else dict.fromkeys(STATUSES, 0)
+        return {"workers": self.workers, **counts}
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                await self._idle()
+                continue
+            try:
+                result, error = await self.run_job(job), None
+            except asyncio.CancelledError:
+                raise
+            except ValueError as ve:
+                result, error = None, {"status": getattr(ve, "status_code", 400), "detail": str(ve)}
+            except Exception as e:
+                print(f"Internal Error: {e}")
+                result, error = None, {"status": 500, "detail": "Internal Server Error processing audio"}
+            await asyncio.to_thread(self.store.complete, job["id"], result, error)
+
+    async def _idle(self):
+        if time.monotonic() - self._last_purge > 60:
+            self._last_purge = time.monotonic()
+            await asyncio.to_thread(self.store.purge, self.ttl)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _save_spool(spool, path: str):
+    """
+    Persists an uploads.AudioSpool at ``path``: a spooled temp file is moved,
+    in-memory audio written out.
+    """
+    spool.finish()
+    if spool.path is not None:
+        shutil.move(spool.path, path)
+        spool.path = None
+    else:
+        with open(path, "wb") as f:
+            f.write(spool.source)
+
+
+def _pid_alive(pid: int):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,309 @@
+"""
+Real-time detection over a WebSocket, for live calls.
+
+``/detect`` needs the whole recording before it can answer. ``/detect/live``
+takes the audio while the call is going on: the client sends binary messages
+as audio arrives and gets a rolling verdict back every ``hop_seconds``.
+
+Each stream keeps a preprocessing.SlidingFeatureWindow over its last
+``window_seconds`` of audio (resampled to VOICE_TARGET_SR). A message only
+costs the frames it completes, and the window is a fixed-size ring, so the
+work per message and the memory per stream stay the same however long the
+call runs. Window features are scored like any /detect clip (through the
+micro-batcher when it is enabled) and the last ``smoothing`` window scores are
+averaged into the verdict. While a window is being scored, audio keeps being
+analysed but no second score is queued behind it; the next verdict covers the
+newest window instead, so a slow model delays verdicts rather than piling up work.
+
+Protocol (``ws://host/detect/live?language=English&format=pcm_s16le&sample_rate=16000``):
+    format       "pcm_s16le" or "pcm_f32le" (raw interleaved samples, with
+                 ``sample_rate`` and ``channels``), or "encoded": every message
+                 is a complete audio file (WAV, FLAC, OGG, MP3, ...)
+    -> binary    audio
+    -> text      "end" (or {"type": "end"}): score what is left, send "final", close
+    <- {"type": "ready", ...}    stream parameters, sent once
+    <- {"type": "verdict", ...}  classification / confidence_score (rolling),
+                                 ai_probability of the latest window, its
+                                 window_start / window_end in stream seconds
+    <- {"type": "final", ...}    the last verdict, once "end" was received
+    <- {"type": "error", ...}    followed by a close (1003 bad parameters,
+                                 1007 undecodable audio, 1009 message too big)
+
+Configuration (environment variables):
+    VOICE_LIVE_WINDOW           seconds of audio each verdict is computed from (default 4)
+    VOICE_LIVE_HOP              seconds of new audio between verdicts (default 1)
+    VOICE_LIVE_SMOOTHING        window scores averaged into the verdict (default 5)
+    VOICE_LIVE_MAX_STREAMS      open streams per process; more are closed with
+                                1013 "try again later" (default 64)
+    VOICE_LIVE_MAX_CHUNK_BYTES  largest audio message (default 1 MiB)
+    VOICE_LIVE_IDLE_TIMEOUT     seconds without a message before the stream is
+                                closed (default 30)
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from fastapi import WebSocketDisconnect
+
+# numpy / preprocessing are imported by LiveSession, so importing this module
+# stays cheap for the web app's static routes (see VOICE_LAZY_LOAD).
+
+FORMATS = ("pcm_s16le", "pcm_f32le", "encoded")
+_SAMPLE_WIDTH = {"pcm_s16le": 2, "pcm_f32le": 4}
+
+
+class LiveSession:
+    """
+    Analysis state of one stream: decoder carry-over, resampler and feature
+    window. ``feed`` is blocking (run it off the event loop); the rest is cheap.
+    """
+    def __init__(self, format: str = "pcm_s16le", sample_rate: int = 16000, channels: int = 1,
+                 window_seconds: float = 4.0, hop_seconds: float = 1.0, smoothing: int = 5):
+        from preprocessing import STREAM_TARGET_SR, HOP_LENGTH, SlidingFeatureWindow
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}")
+        if format != "encoded" and not (1000 <= sample_rate <= 384000 and 1 <= channels <= 32):
+            raise ValueError("sample_rate must be 1000-384000 and channels 1-32")
+        self.format = format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.window = SlidingFeatureWindow(STREAM_TARGET_SR, window_seconds)
+        self.hop_frames = max(1, int(round(hop_seconds * STREAM_TARGET_SR / HOP_LENGTH)))
+        self.scores = deque(maxlen=max(1, smoothing))
+        self.last = None
+        self._resampler = None
+        # bytes of a sample frame split across two messages
+        self._partial = b""
+        self._scored_frames = 0
+
+    def feed(self, chunk: bytes):
+        """
+        Decodes one message and adds it to the feature window.
+        Raises ValueError for audio that cannot be decoded.
+        """
+        import numpy as np
+        from preprocessing import STREAM_TARGET_SR, StreamResampler, decode_audio_bytes
+        if self.format == "encoded":
+            y, sr = decode_audio_bytes(chunk)
+        else:
+            width = _SAMPLE_WIDTH[self.format] * self.channels
+            data = self._partial + chunk if self._partial else chunk
+            usable = len(data) - len(data) % width
+            self._partial = bytes(data[usable:])
+            dtype = "<i2" if self.format == "pcm_s16le" else "<f4"
+            samples = np.frombuffer(data, dtype=dtype, count=usable // _SAMPLE_WIDTH[self.format]).reshape(-1, self.channels)
+            y = samples.mean(axis=1, dtype=np.float32) if self.channels > 1 else samples[:, 0].astype(np.float32)
+            if self.format == "pcm_s16le":
+                y *= 1.0 / 32768.0
+            sr = self.sample_rate
+        if not sr or not len(y):
+            return
+        if self._resampler is None or self._resampler.orig_sr != sr:
+            # an encoded stream may change rate between messages; start over at the new one
+            self._resampler = StreamResampler(sr, STREAM_TARGET_SR)
+        self.window.update(self._resampler.process(y))
+
+    @property
+    def due(self):
+        """A hop of new frames arrived since the last scored window."""
+        return self.pending >= self.hop_frames
+
+    @property
+    def pending(self):
+        """Frames analysed since the last scored window."""
+        return self.window.frames - self._scored_frames
+
+    def snapshot(self):
+        """
+        Features of the current window, marked as scored. Returns (features, start, end).
+        """
+        self._scored_frames = self.window.frames
+        return self.window.features(), self.window.start, self.window.end
+
+    def record(self, result: dict, start: float, end: float):
+        """
+        Adds a window's model result to the rolling verdict; returns the message for the client.
+        """
+        confidence = result["confidence_score"]
+        ai_probability = confidence if result["classification"] == "AI-Generated" else 1.0 - confidence
+        self.scores.append(ai_probability)
+        rolling = sum(self.scores) / len(self.scores)
+        is_ai = rolling >= 0.5
+        self.last = {
+            "type": "verdict",
+            "classification": "AI-Generated" if is_ai else "Human",
+            "confidence_score": round(rolling if is_ai else 1.0 - rolling, 4),
+            "ai_probability": round(ai_probability, 4),
+            "window_start": round(start, 3),
+            "window_end": round(end, 3),
+            "windows_averaged": len(self.scores),
+        }
+        return dict(self.last)
+
+
+class LiveStreams:
+    def __init__(self, score, window_seconds: float = 4.0, hop_seconds: float = 1.0, smoothing: int = 5,
+                 max_streams: int = 64, max_chunk_bytes: int = 1 << 20, idle_timeout: float = 30.0):
+        """
+        Args:
+            score: ``async score(language, features) -> result`` scoring one
+                window's summary features with the model.
+            window_seconds, hop_seconds, smoothing: see the module docstring.
+            max_streams: open streams per process.
+            max_chunk_bytes: largest audio message accepted.
+            idle_timeout: seconds a stream may go without a message.
+        """
+        self.score = score
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.smoothing = smoothing
+        self.max_streams = max_streams
+        self.max_chunk_bytes = max_chunk_bytes
+        self.idle_timeout = idle_timeout
+        self.active = 0
+        self.streams = 0
+        self.rejected = 0
+        self.verdicts = 0
+        self.audio_seconds = 0.0
+        self.verdict_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, score):
+        return cls(
+            score,
+            window_seconds=float(os.environ.get("VOICE_LIVE_WINDOW", "4")),
+            hop_seconds=float(os.environ.get("VOICE_LIVE_HOP", "1")),
+            smoothing=int(os.environ.get("VOICE_LIVE_SMOOTHING", "5")),
+            max_streams=int(os.environ.get("VOICE_LIVE_MAX_STREAMS", "64")),
+            max_chunk_bytes=int(os.environ.get("VOICE_LIVE_MAX_CHUNK_BYTES", str(1 << 20))),
+            idle_timeout=float(os.environ.get("VOICE_LIVE_IDLE_TIMEOUT", "30")),
+        )
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "streams": self.streams,
+            "rejected": self.rejected,
+            "verdicts": self.verdicts,
+            "audio_seconds": round(self.audio_seconds, 2),
+            "mean_verdict_ms": round(self.verdict_seconds / self.verdicts * 1000, 3) if self.verdicts else 0.0,
+        }
+
+    async def serve(self, websocket, language: str, format: str, sample_rate: int, channels: int):
+        """
+        Accepts ``websocket`` and runs the protocol until the client ends the
+        stream, disconnects or goes idle.
+        """
+        if self.active >= self.max_streams:
+            self.rejected += 1
+            # accepted first: a close before the handshake reaches the client as a bare 403
+            await websocket.accept()
+            await websocket.close(code=1013, reason="Too many live streams")
+            return
+        self.active += 1
+        self.streams += 1
+        session = None
+        scoring = None
+        try:
+            await websocket.accept()
+            try:
+                session = await asyncio.to_thread(
+                    LiveSession, format, sample_rate, channels, self.window_seconds, self.hop_seconds, self.smoothing)
+            except ValueError as ve:
+                await self._fail(websocket, 1003, str(ve))
+                return
+            await websocket.send_json({
+                "type": "ready",
+                "language": language,
+                "format": format,
+                "window_seconds": self.window_seconds,
+                "hop_seconds": self.hop_seconds,
+                "smoothing": self.smoothing,
+            })
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.receive(), self.idle_timeout or None)
+                except asyncio.TimeoutError:
+                    await self._fail(websocket, 1000, f"No audio for {self.idle_timeout:g} seconds")
+                    return
+                if message["type"] == "websocket.disconnect":
+                    return
+                chunk = message.get("bytes")
+                if chunk is None:
+                    if _is_end(message.get("text")):
+                        break
+                    continue
+                if len(chunk) > self.max_chunk_bytes:
+                    await self._fail(websocket, 1009, f"Audio messages are limited to {self.max_chunk_bytes} bytes")
+                    return
+                try:
+                    await asyncio.to_thread(session.feed, chunk)
+                except ValueError as ve:
+                    await self._fail(websocket, 1007, str(ve))
+                    return
+                if scoring is not None and scoring.done():
+                    # surfaces a failed send or model error
+                    scoring.result()
+                    scoring = None
+                if scoring is None and session.due:
+                    scoring = asyncio.create_task(self._verdict(websocket, session, language, time.perf_counter()))
+
+            # end of stream: wait for the running verdict, then cover the frames after it
+            if scoring is not None:
+                await scoring
+                scoring = None
+            final = session.last
+            if session.pending or final is None:
+                final = await self._verdict(websocket, session, language, time.perf_counter(), send=False)
+            if final is None:
+                await self._fail(websocket, 1007, "No audio received")
+                return
+            await websocket.send_json({**final, "type": "final", "stream_seconds": round(session.window.end, 3)})
+            await websocket.close(code=1000)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"Live stream error: {e}")
+            try:
+                await self._fail(websocket, 1011, "Internal Server Error processing audio")
+            except Exception:
+                # the client is already gone
+                pass
+        finally:
+            if scoring is not None:
+                scoring.cancel()
+            if session is not None:
+                self.audio_seconds += session.window.end
+            self.active -= 1
+
+    async def _verdict(self, websocket, session: LiveSession, language: str, received: float, send: bool = True):
+        features, start, end = session.snapshot()
+        if not session.window.count:
+            return None
+        result = await self.score(language, features)
+        message = session.record(result, start, end)
+        elapsed = time.perf_counter() - received
+        message["latency_ms"] = round(elapsed * 1000, 3)
+        self.verdicts += 1
+        self.verdict_seconds += elapsed
+        if send:
+            await websocket.send_json(message)
+        return message
+
+    async def _fail(self, websocket, code: int, detail: str):
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=code, reason=detail[:120])
+
+
+def _is_end(text):
+    if text is None:
+        return False
+    if text.strip() == "end":
+        return True
+    try:
+        return json.loads(text).get("type") == "end"
+    except (ValueError, AttributeError):
+        return False
+
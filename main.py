@@ -1,26 +1,168 @@
 from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
-from fastapi import Request
-from pydantic import BaseModel, Field
-from typing import Optional
-from preprocessing import decode_audio, extract_features
-from model import VoiceClassifier
-import uvicorn
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi import Request, Response, WebSocket
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal, Optional
+from contextlib import asynccontextmanager
+from executor import ExecutionEngine, run_pipeline, run_features, run_predict_batch, CASCADE_MODEL, CASCADE_BAND, MAX_AUDIO_SECONDS
+from batching import MicroBatcher
+from cache import ResultCache, audio_digest, make_key
+from ui import serve_asset
+import ui
+from uploads import AudioSpool, InvalidJson, JsonAudioReader, UploadTooLarge, HEAD_BYTES, UPLOAD_MAX_BYTES, iter_upload
+from admission import AdmissionController, AdmissionMiddleware
+from jobs import JobQueue
+from fingerprint import FingerprintIndex
+from live import LiveStreams
+from registry import language_models_from_env, resolve_model
+from metrics import REGISTRY, Counter, Gauge, MetricsMiddleware, StageTimer, AUDIO_SECONDS, PIPELINE_IN_FLIGHT
+import asyncio
+import base64
+import functools
+import json
+import os
+import time
 import sys
 
+# Execution engine: decode -> features -> predict runs in a worker pool so the
+# event loop stays responsive. Each worker loads its own classifier.
+def _count_model_load(language, seconds: float):
+    MODEL_LOADS.inc(1, model_name(language))
+    MODEL_LOAD_SECONDS.inc(seconds, model_name(language))
+
+def _count_default_load(seconds: float):
+    # the default model each worker loads at start, counted like the lazy
+    # per-language loads
+    _count_model_load(None, seconds)
+
+engine = ExecutionEngine.from_env(_count_default_load)
+
+# Micro-batcher: coalesces concurrent requests into one predict_batch call.
+async def _predict_batch(batch):
+    results, loads = await engine.run(run_predict_batch, batch)
+    for language, seconds in loads.items():
+        # the batch was the first for its language model on that worker
+        _count_model_load(language, seconds)
+    return results
+
+batcher = MicroBatcher.from_env(_predict_batch)
+
+# Live streams: rolling verdicts over a sliding window of audio sent over a
+# WebSocket; each window is scored like a clip (see live.py)
+async def _score_live(language, features):
+    if batcher.enabled:
+        return await batcher.submit((language, features))
+    return (await _predict_batch([(language, features)]))[0]
+
+live = LiveStreams.from_env(_score_live)
+
+# Result cache keyed by the decoded audio bytes, language and model version.
+cache = ResultCache.from_env()
+
+# Near-duplicate index: landmark fingerprints of scored clips with their
+# verdicts, so re-encoded / trimmed copies skip the model (see fingerprint.py)
+fingerprints = FingerprintIndex.from_env()
+
+# Admission control: bounds concurrent analyses and the queue in front of them,
+# and rejects oversized bodies before they are read (see admission.py)
+admission = AdmissionController.from_env(engine.workers)
+MAX_BODY_BYTES = int(os.environ.get("VOICE_MAX_BODY_BYTES", "0")) or 4 * (UPLOAD_MAX_BYTES // 3 + 1) + 64 * 1024
+
+# Component counters, read from their owners when /metrics is scraped
+REGISTRY.register(Counter(
+    "voice_cache_lookups_total", "Result cache lookups by outcome.", ("result",),
+    callback=lambda: {("hit",): cache.hits, ("disk_hit",): cache.disk_hits, ("miss",): cache.misses}))
+REGISTRY.register(Gauge(
+    "voice_cache_entries", "Entries in the in-memory result cache.",
+    callback=lambda: {(): cache.stats()["entries"]}))
+DECISIONS = REGISTRY.register(Counter(
+    "voice_decisions_total", "Analysed clips by the cascade stage that decided them.", ("stage",)))
+MODEL_LOADS = REGISTRY.register(Counter(
+    "voice_model_loads_total", "Models loaded by pool workers, at start or on first use of a language.", ("model",)))
+MODEL_LOAD_SECONDS = REGISTRY.register(Counter(
+    "voice_model_load_seconds_total", "Time pool workers spent loading models.", ("model",)))
+REGISTRY.register(Counter(
+    "voice_batches_total", "Micro-batches sent to the model.",
+    callback=lambda: {(): batcher.batches}))
+REGISTRY.register(Counter(
+    "voice_batch_items_total", "Clips scored through the micro-batcher.",
+    callback=lambda: {(): batcher.items}))
+REGISTRY.register(Counter(
+    "voice_fingerprint_lookups_total", "Near-duplicate index lookups by outcome.", ("result",),
+    callback=lambda: {("match",): fingerprints.matches, ("miss",): fingerprints.lookups - fingerprints.matches}))
+REGISTRY.register(Gauge(
+    "voice_fingerprint_clips", "Clips in the near-duplicate index.",
+    callback=lambda: {(): fingerprints.clips}))
+REGISTRY.register(Gauge(
+    "voice_live_streams", "Open /detect/live WebSocket streams.",
+    callback=lambda: {(): live.active}))
+REGISTRY.register(Counter(
+    "voice_live_verdicts_total", "Rolling verdicts sent to live streams.",
+    callback=lambda: {(): live.verdicts}))
+REGISTRY.register(Gauge(
+    "voice_admission_active", "Requests holding an admission slot.",
+    callback=lambda: {(): admission.active}))
+REGISTRY.register(Gauge(
+    "voice_admission_queued", "Requests waiting for an admission slot.",
+    callback=lambda: {(): admission.queued}))
+REGISTRY.register(Counter(
+    "voice_admission_rejected_total", "Requests rejected with 503 by reason.", ("reason",),
+    callback=lambda: {(reason,): count for reason, count in admission.rejected.items()}))
+
+# Lazy loading: numpy, soundfile, preprocessing and the model are only imported
+# (and the classifier built) on first /detect use or via POST /warmup, so static
+# routes answer immediately on a cold start. Enabled by default on serverless.
+LAZY_LOAD = os.environ.get("VOICE_LAZY_LOAD", "0") == "1"
+
+# Streaming JSON: /detect base64-decodes the audio while the body arrives instead
+# of parsing the whole document first (see uploads.JsonAudioReader)
+STREAM_JSON = os.environ.get("VOICE_STREAM_JSON", "1") == "1"
+
+# Per-language models (see registry.py); the web process only needs the paths
+LANGUAGE_MODELS = language_models_from_env()
+
+_model_versions = {}
+
+def model_for(language: str):
+    return resolve_model(language, engine.model_path, LANGUAGE_MODELS)
+
+def model_name(language: str):
+    path = model_for(language)
+    return os.path.basename(path) if path else "simulation"
+
+def current_model_version(language: str = None):
+    path = model_for(language)
+    if path not in _model_versions:
+        from model import model_version
+        _model_versions[path] = model_version(path, CASCADE_MODEL, CASCADE_BAND)
+    return _model_versions[path]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not LAZY_LOAD:
+        engine.start()
+    await fingerprints.start()
+    if not LAZY_LOAD:
+        # otherwise the job queue starts with the first /jobs request
+        await jobs.resume()
+    yield
+    await jobs.shutdown()
+    await fingerprints.shutdown()
+    engine.shutdown()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Voice Detection API",
     description="API to detect AI-generated voices in multiple languages.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize the classifier (in a real app, you'd load the model path here)
-classifier = VoiceClassifier()
-
 class AudioRequest(BaseModel):
     audio_base64: str = Field(..., description="Base64 encoded MP3 audio string")
     language: str = Field(..., description="Language of the audio (Tamil, English, Hindi, Malayalam, Telugu, Kannada)")
+    mode: Literal["clip", "segments"] = Field("clip", description="'segments' scores overlapping windows and aggregates them")
 
 class AudioResponse(BaseModel):
     classification: str
@@ -37,357 +179,663 @@ async def root(request: Request, format: str | None = None):
             "message": "AI Voice Detection System is running",
             "endpoints": {
                 "detect": "/detect",
+                "live": "/detect/live",
                 "docs": "/docs",
                 "app": "/app",
                 "health": "/health"
             }
         })
-    return """
-    <!doctype html>
-    <html>
-    <head>
-      <meta charset="utf-8">
-      <meta name="viewport" content="width=device-width, initial-scale=1">
-      <title>AI Voice Detection</title>
-      <style>
-        :root { color-scheme: dark; }
-        @keyframes gradientShift { 0% { background-position: 0% 50%; } 50% { background-position: 100% 50%; } 100% { background-position: 0% 50%; } }
-        body { font-family: system-ui, -apple-system, Segoe UI, Roboto, Helvetica, Arial, sans-serif; margin: 0; min-height: 100vh; padding: 3rem 2rem; background: linear-gradient(135deg, #0b1220 0%, #101826 50%, #0b1220 100%); background-size: 200% 200%; animation: gradientShift 18s ease infinite; display: flex; align-items: center; color: #e2e8f0; }
-        .card { max-width: 900px; margin: 0 auto; border-radius: 18px; padding: 2rem; backdrop-filter: blur(14px) saturate(160%); background: rgba(15,23,42,0.55); border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 10px 30px rgba(2,6,23,0.6), 0 0 20px rgba(99,102,241,0.2); }
-        h1 { font-size: 2rem; margin-bottom: 1rem; letter-spacing: .02em; color: #000000; }
-        label { display: block; margin: .6rem 0 .3rem; font-weight: 700; color: #cbd5e1; }
-        input[type=file], select, textarea { width: 100%; padding: .75rem .9rem; border: 1px solid rgba(148,163,184,0.25); border-radius: 14px; background: rgba(2,6,23,0.6); color: #e2e8f0; box-shadow: inset 0 1px 6px rgba(2,6,23,0.3); }
-        input[type=file]:focus, select:focus, textarea:focus { outline: none; border-color: #22d3ee; box-shadow: 0 0 0 3px rgba(34,211,238,0.25); }
-        button { margin-top: 1rem; padding: .85rem 1.2rem; border: none; border-radius: 14px; background: linear-gradient(90deg, #3b82f6, #8b5cf6); color: #fff; cursor: pointer; box-shadow: 0 12px 24px rgba(59,130,246,0.35), 0 0 16px rgba(139,92,246,0.35); transition: transform .18s ease, box-shadow .18s ease; }
-        button:hover { transform: translateY(-1px); box-shadow: 0 16px 30px rgba(59,130,246,0.5), 0 0 22px rgba(139,92,246,0.45); }
-        button:disabled { background: linear-gradient(90deg,#64748b,#475569); cursor: not-allowed; box-shadow: none; }
-        .dialog { border-radius: 18px; border: 1px solid rgba(99,102,241,0.35); background: rgba(2,6,23,0.75); box-shadow: 0 10px 28px rgba(2,6,23,0.55), 0 0 20px rgba(99,102,241,0.18); }
-        .dialog-header { display: flex; align-items: center; gap: .75rem; padding: .75rem 1rem; border-bottom: 1px solid rgba(148,163,184,0.2); }
-        .badge { padding: .35rem .6rem; border-radius: 999px; font-size: .85rem; background: linear-gradient(90deg,#22d3ee,#a78bfa); color: #0b1220; }
-        .badge--ai { background: linear-gradient(90deg,#ef4444,#f59e0b); color: #0b1220; }
-        .badge--human { background: linear-gradient(90deg,#10b981,#22d3ee); color: #0b1220; }
-        .dialog-body { padding: .9rem 1rem; }
-        .summary { color: #cbd5e1; margin-bottom: .5rem; }
-        pre { background: rgba(2,6,23,0.9); color: #e2e8f0; padding: 1rem; border-radius: 14px; overflow: auto; border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 0 0 1px rgba(99,102,241,0.25) inset, 0 8px 24px rgba(59,130,246,0.25), 0 0 16px rgba(139,92,246,0.2); }
-        #copy { margin-left: auto; padding: .6rem .85rem; border: none; border-radius: 12px; background: linear-gradient(90deg, #22d3ee, #a78bfa); color: #0b1220; cursor: pointer; box-shadow: 0 8px 18px rgba(34,211,238,0.35), 0 0 12px rgba(167,139,250,0.3); }
-        .row { display: grid; grid-template-columns: 1fr; gap: 1rem; }
-        @media (min-width: 640px) { .row { grid-template-columns: 1fr 1fr; } }
-        .small { font-size: .95rem; color: #94a3b8; }
-        .links a { margin-right: .75rem; color: #93c5fd; text-decoration: none; }
-      </style>
-    </head>
-    <body>
-      <div class="card">
-        <h1>AI-Generated Voice Detection</h1>
-        <div class="links">
-          <a href="/docs">API Docs</a>
-          <a href="/health" target="_blank">Health JSON</a>
-          <a href="/?format=json" target="_blank">Root JSON</a>
-        </div>
-        <p class="small">Upload audio and select language. The API returns classification, confidence, and explanation.</p>
-        <div class="row">
-          <div>
-            <label for="file">Audio file (WAV/MP3)</label>
-            <input id="file" type="file" accept=".wav,.mp3,audio/*">
-          </div>
-          <div>
-            <label for="lang">Language</label>
-            <select id="lang">
-              <option>English</option>
-              <option>Tamil</option>
-              <option>Hindi</option>
-              <option>Malayalam</option>
-              <option>Telugu</option>
-              <option>Kannada</option>
-            </select>
-          </div>
-        </div>
-        <button id="send">Detect</button>
-        <div id="out" style="margin-top:1rem;">
-          <div class="dialog">
-            <div class="dialog-header">
-              <span id="status-badge" class="badge">Ready</span>
-              <button id="copy">Copy</button>
-            </div>
-            <div class="dialog-body">
-              <div class="summary" id="summary-text">Awaiting input</div>
-              <pre id="result">{ "status": "ready" }</pre>
-            </div>
-          </div>
-        </div>
-        <p class="small">Or paste Base64 audio below (optional):</p>
-        <textarea id="base64" rows="4" placeholder="Base64 audio string"></textarea>
-      </div>
-      <script>
-        async function toBase64(file) {
-          return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onload = () => resolve(reader.result.split(',')[1]);
-            reader.onerror = reject;
-            reader.readAsDataURL(file);
-          });
-        }
-        async function detect() {
-          const btn = document.getElementById('send');
-          btn.disabled = true;
-          const fileInput = document.getElementById('file');
-          const lang = document.getElementById('lang').value;
-          let audioB64 = document.getElementById('base64').value.trim();
-          try {
-            if (!audioB64) {
-              const f = fileInput.files[0];
-              if (!f) throw new Error('Select a file or paste Base64 audio');
-              audioB64 = await toBase64(f);
-            }
-            const res = await fetch('/detect', {
-              method: 'POST',
-              headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify({ audio_base64: audioB64, language: lang })
-            });
-            const txt = await res.text();
-            document.getElementById('result').textContent = txt;
-          } catch (err) {
-            document.getElementById('result').textContent = JSON.stringify({ error: String(err) }, null, 2);
-          } finally {
-            btn.disabled = false;
-          }
-        }
-        document.getElementById('send').addEventListener('click', detect);
-        document.getElementById('copy').addEventListener('click', async () => {
-          const txt = document.getElementById('result').textContent;
-          try { await navigator.clipboard.writeText(txt); } catch(e) {}
-        });
-        function renderSummary(obj) {
-          const badge = document.getElementById('status-badge');
-          const summary = document.getElementById('summary-text');
-          badge.className = 'badge';
-          if (obj && typeof obj === 'object' && obj.classification) {
-            const cls = String(obj.classification);
-            const conf = typeof obj.confidence_score === 'number' ? Math.round(obj.confidence_score * 100) / 100 : obj.confidence_score;
-            summary.textContent = `${cls} • ${conf}`;
-            badge.textContent = cls;
-            if (/AI-Generated/i.test(cls)) badge.className = 'badge badge--ai';
-            if (/Human/i.test(cls)) badge.className = 'badge badge--human';
-          } else {
-            summary.textContent = 'Response';
-            badge.textContent = 'JSON';
-          }
-        }
-      </script>
-    </body>
-    </html>
-    """
+    return serve_asset(request, ui.ROOT_PAGE)
 
 @app.get("/health")
 def health_check():
     return {"status": "active", "message": "AI Voice Detection System is running"}
 
-@app.get("/app", response_class=HTMLResponse)
-def app_page():
-    return """
-    <!doctype html>
-    <html>
-    <head>
-      <meta charset="utf-8">
-      <meta name="viewport" content="width=device-width, initial-scale=1">
-      <meta name="apple-mobile-web-app-capable" content="yes">
-      <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
-      <title>AI Voice Detection</title>
-      <link rel="manifest" href="/manifest.json">
-      <style>
-        :root { color-scheme: dark; }
-        @keyframes floatbg { 0% { background-position: 0% 50%; } 50% { background-position: 100% 50%; } 100% { background-position: 0% 50%; } }
-        body { font-family: system-ui, -apple-system, Segoe UI, Roboto, Helvetica, Arial, sans-serif; margin: 0; min-height: 100vh; padding: 2.5rem 2rem; background: linear-gradient(135deg, #0b1220 0%, #0f172a 50%, #0b1220 100%); background-size: 200% 200%; animation: floatbg 18s ease-in-out infinite; display: flex; align-items: center; color: #e2e8f0; }
-        .card { max-width: 760px; margin: 0 auto; border-radius: 18px; padding: 2rem; backdrop-filter: blur(12px) saturate(160%); background: rgba(15,23,42,0.55); border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 10px 30px rgba(2,6,23,0.6), 0 0 20px rgba(99,102,241,0.2); }
-        h1 { font-size: 1.8rem; margin-bottom: 1rem; letter-spacing: .02em; color: #000000; }
-        label { display: block; margin: .6rem 0 .3rem; font-weight: 700; color: #cbd5e1; }
-        input[type=file], select, textarea { width: 100%; padding: .75rem .9rem; border: 1px solid rgba(148,163,184,0.25); border-radius: 14px; background: rgba(2,6,23,0.6); color: #e2e8f0; box-shadow: inset 0 1px 6px rgba(2,6,23,0.3); }
-        input[type=file]:focus, select:focus, textarea:focus { outline: none; border-color: #22d3ee; box-shadow: 0 0 0 3px rgba(34,211,238,0.25); }
-        button { margin-top: 1rem; padding: .85rem 1.2rem; border: none; border-radius: 14px; background: linear-gradient(90deg, #3b82f6, #8b5cf6); color: #fff; cursor: pointer; box-shadow: 0 12px 24px rgba(59,130,246,0.35), 0 0 16px rgba(139,92,246,0.35); transition: transform .18s ease, box-shadow .18s ease; }
-        button:hover { transform: translateY(-1px); box-shadow: 0 16px 30px rgba(59,130,246,0.5), 0 0 22px rgba(139,92,246,0.45); }
-        button:disabled { background: linear-gradient(90deg,#64748b,#475569); cursor: not-allowed; box-shadow: none; }
-        .dialog { border-radius: 18px; border: 1px solid rgba(99,102,241,0.35); background: rgba(2,6,23,0.75); box-shadow: 0 10px 28px rgba(2,6,23,0.55), 0 0 20px rgba(99,102,241,0.18); }
-        .dialog-header { display: flex; align-items: center; gap: .75rem; padding: .75rem 1rem; border-bottom: 1px solid rgba(148,163,184,0.2); }
-        .badge { padding: .35rem .6rem; border-radius: 999px; font-size: .85rem; background: linear-gradient(90deg,#22d3ee,#a78bfa); color: #0b1220; }
-        .badge--ai { background: linear-gradient(90deg,#ef4444,#f59e0b); color: #0b1220; }
-        .badge--human { background: linear-gradient(90deg,#10b981,#22d3ee); color: #0b1220; }
-        .dialog-body { padding: .9rem 1rem; }
-        .summary { color: #cbd5e1; margin-bottom: .5rem; }
-        pre { background: rgba(2,6,23,0.9); color: #e2e8f0; padding: 1rem; border-radius: 14px; overflow: auto; border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 0 0 1px rgba(99,102,241,0.25) inset, 0 8px 24px rgba(59,130,246,0.25), 0 0 16px rgba(139,92,246,0.2); }
-        #copy { margin-left: auto; padding: .6rem .85rem; border: none; border-radius: 12px; background: linear-gradient(90deg, #22d3ee, #a78bfa); color: #0b1220; cursor: pointer; box-shadow: 0 8px 18px rgba(34,211,238,0.35), 0 0 12px rgba(167,139,250,0.3); }
-        .row { display: grid; grid-template-columns: 1fr; gap: 1rem; }
-        @media (min-width: 640px) { .row { grid-template-columns: 1fr 1fr; } }
-        .small { font-size: .95rem; color: #94a3b8; }
-      </style>
-      <script>
-        if ('serviceWorker' in navigator) {
-          window.addEventListener('load', () => {
-            navigator.serviceWorker.register('/sw.js').catch(() => {});
-          });
-        }
-      </script>
-    </head>
-    <body>
-      <div class="card">
-        <h1>AI-Generated Voice Detection</h1>
-        <p class="small">Upload audio and select language. The API returns classification, confidence, and explanation.</p>
-        <div class="row">
-          <div>
-            <label for="file">Audio file (WAV/MP3)</label>
-            <input id="file" type="file" accept=".wav,.mp3,audio/*">
-          </div>
-          <div>
-            <label for="lang">Language</label>
-            <select id="lang">
-              <option>English</option>
-              <option>Tamil</option>
-              <option>Hindi</option>
-              <option>Malayalam</option>
-              <option>Telugu</option>
-              <option>Kannada</option>
-            </select>
-          </div>
-        </div>
-        <button id="send">Detect</button>
-        <div id="out" style="margin-top:1rem;">
-          <div class="dialog">
-            <div class="dialog-header">
-              <span id="status-badge" class="badge">Ready</span>
-              <button id="copy">Copy</button>
-            </div>
-            <div class="dialog-body">
-              <div class="summary" id="summary-text">Awaiting input</div>
-              <pre id="result">{ "status": "ready" }</pre>
-            </div>
-          </div>
-        </div>
-        <p class="small">Or paste Base64 audio below (optional):</p>
-        <textarea id="base64" rows="4" placeholder="Base64 audio string"></textarea>
-      </div>
-      <script>
-        async function toBase64(file) {
-          return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onload = () => resolve(reader.result.split(',')[1]);
-            reader.onerror = reject;
-            reader.readAsDataURL(file);
-          });
-        }
-        async function detect() {
-          const btn = document.getElementById('send');
-          btn.disabled = true;
-          const fileInput = document.getElementById('file');
-          const lang = document.getElementById('lang').value;
-          let audioB64 = document.getElementById('base64').value.trim();
-          try {
-            if (!audioB64) {
-              const f = fileInput.files[0];
-              if (!f) throw new Error('Select a file or paste Base64 audio');
-              audioB64 = await toBase64(f);
-            }
-            const res = await fetch('/detect', {
-              method: 'POST',
-              headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify({ audio_base64: audioB64, language: lang })
-            });
-            const txt = await res.text();
-            document.getElementById('result').textContent = txt;
-          } catch (err) {
-            document.getElementById('result').textContent = JSON.stringify({ error: String(err) }, null, 2);
-          } finally {
-            btn.disabled = false;
-          }
-        }
-        document.getElementById('send').addEventListener('click', detect);
-        document.getElementById('copy').addEventListener('click', async () => {
-          const txt = document.getElementById('result').textContent;
-          try { await navigator.clipboard.writeText(txt); } catch(e) {}
-        });
-        function renderSummary(obj) {
-          const badge = document.getElementById('status-badge');
-          const summary = document.getElementById('summary-text');
-          badge.className = 'badge';
-          if (obj && typeof obj === 'object' && obj.classification) {
-            const cls = String(obj.classification);
-            const conf = typeof obj.confidence_score === 'number' ? Math.round(obj.confidence_score * 100) / 100 : obj.confidence_score;
-            summary.textContent = `${cls} • ${conf}`;
-            badge.textContent = cls;
-            if (/AI-Generated/i.test(cls)) badge.className = 'badge badge--ai';
-            if (/Human/i.test(cls)) badge.className = 'badge badge--human';
-          } else {
-            summary.textContent = 'Response';
-            badge.textContent = 'JSON';
-          }
+@app.post("/warmup")
+async def warmup():
+    """
+    Explicit warm-up hook: loads the pipeline modules and the classifier now
+    instead of on the first /detect call (e.g. from a scheduled ping).
+    """
+    start = time.perf_counter()
+    already_warm = engine.started
+    await asyncio.to_thread(engine.start)
+    await asyncio.to_thread(current_model_version)
+    return {
+        "status": "warm",
+        "already_warm": already_warm,
+        "seconds": round(time.perf_counter() - start, 4)
+    }
+
+@app.get("/stats")
+def stats():
+    return {
+        "cache": cache.stats(),
+        "fingerprints": fingerprints.stats(),
+        "batching": batcher.stats(),
+        "admission": admission.stats(),
+        "jobs": jobs.stats(),
+        "live": live.stats(),
+        "executor": {"mode": engine.mode, "workers": engine.workers},
+        "models": model_stats(),
+    }
+
+def model_stats():
+    """
+    Configured models with the languages they serve, and how often (and how
+    long) the workers loaded each one, summed over all workers.
+    """
+    models = {}
+    for path in {engine.model_path, *LANGUAGE_MODELS.values()}:
+        name = os.path.basename(path) if path else "simulation"
+        languages = sorted(language for language, p in LANGUAGE_MODELS.items() if p == path)
+        models[name] = {
+            "path": path,
+            "languages": languages + (["default"] if path == engine.model_path else []),
+            "loads": MODEL_LOADS.value(name),
+            "load_seconds_total": round(MODEL_LOAD_SECONDS.value(name), 4),
         }
-      </script>
-    </body>
-    </html>
+    return models
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Request, stage latency, cache and batching metrics in the Prometheus text format.
     """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/app", response_class=HTMLResponse)
+def app_page(request: Request):
+    return serve_asset(request, ui.APP_PAGE)
 
 @app.get("/manifest.json", response_class=JSONResponse)
-def manifest():
+def manifest(request: Request):
+    return serve_asset(request, ui.MANIFEST_ASSET)
+
+@app.get("/sw.js", response_class=PlainTextResponse)
+def service_worker(request: Request):
+    return serve_asset(request, ui.SERVICE_WORKER)
+
+def _decode_payload(audio_base64: str, language: str, mode: str = "clip"):
+    audio_bytes = base64.b64decode(audio_base64)
+    return audio_bytes, make_key(audio_digest(audio_bytes), language, current_model_version(language), mode)
+
+# Feature dict entries that describe the clip rather than the voice
+_NON_FEATURE_KEYS = {"duration", "source_duration", "speech_duration", "cascade_score", "fingerprint"}
+
+async def analyze_audio(source, language: str, timer: StageTimer = None, mode: str = "clip") -> AudioResponse:
+    """
+    Runs decode -> features -> predict on the execution engine and builds the response.
+    ``source`` is the raw audio bytes or the path of a spooled upload.
+    Stage durations (measured inside the worker) are added to ``timer``.
+    Segment mode batches its own windows, so it bypasses the micro-batcher
+    and the near-duplicate index.
+    """
+    timer = timer or StageTimer()
+    PIPELINE_IN_FLIGHT.inc()
+    try:
+        if mode == "clip" and (batcher.enabled or fingerprints.enabled):
+            features, result, timings = await engine.run(run_features, source, language)
+            timer.update(timings)
+            if result is None and "fingerprint" in features:
+                with timer.stage("fingerprint"):
+                    match = await asyncio.to_thread(
+                        fingerprints.lookup, features["fingerprint"], current_model_version(language))
+                    result = _fingerprint_result(match)
+            if result is None:
+                # includes the wait for the batch to fill
+                with timer.stage("predict"):
+                    if batcher.enabled:
+                        result = await batcher.submit((language, features))
+                    else:
+                        result = (await _predict_batch([(language, features)]))[0]
+                if "fingerprint" in features:
+                    await asyncio.to_thread(
+                        fingerprints.add, features["fingerprint"], result, current_model_version(language))
+        else:
+            features, result, timings = await engine.run(run_pipeline, source, language, mode)
+            timer.update(timings)
+    finally:
+        PIPELINE_IN_FLIGHT.dec()
+    if "model_load" in timings:
+        # this request was the first for its language model on that worker
+        _count_model_load(language, timings["model_load"])
+    AUDIO_SECONDS.inc(features["duration"])
+    DECISIONS.inc(1, result["decision_stage"])
+    
+    metadata = {
+        "duration_seconds": features["duration"],
+        "detected_language": language,
+        "features_summary": {k: v for k, v in features.items() if k not in _NON_FEATURE_KEYS and isinstance(v, float)}
+    }
+    if "source_duration" in features:
+        # streaming mode: only the first VOICE_MAX_DURATION seconds were analysed
+        metadata["source_duration_seconds"] = features["source_duration"]
+    if "speech_duration" in features:
+        # silence trimming: seconds of speech the features were computed from
+        metadata["speech_duration_seconds"] = features["speech_duration"]
+    # which cascade stage decided, and the first-stage score when it passed the request on
+    metadata["decision_stage"] = result["decision_stage"]
+    if "cascade_score" in features:
+        metadata["cascade_score"] = round(features["cascade_score"], 4)
+    if "fingerprint_match" in result:
+        metadata["fingerprint_match"] = result["fingerprint_match"]
+    if "segments" in result:
+        metadata["segments"] = result["segments"]
+        metadata["segment_summary"] = result["segment_summary"]
+    return AudioResponse(
+        classification=result["classification"],
+        confidence_score=result["confidence_score"],
+        explanation=result["explanation"],
+        metadata=metadata
+    )
+
+def _fingerprint_result(match: dict):
+    """
+    The stored verdict of a near-duplicate, as a model result.
+    """
+    if match is None:
+        return None
     return {
-        "name": "AI Voice Detection",
-        "short_name": "VoiceDetect",
-        "start_url": "/app",
-        "display": "standalone",
-        "background_color": "#ffffff",
-        "theme_color": "#2563eb",
-        "icons": []
+        "classification": match["classification"],
+        "confidence_score": match["confidence_score"],
+        "explanation": (
+            f"Closely matches a previously analysed clip (similarity {match['similarity']:.2f}); "
+            f"returning its verdict of {match['classification'].lower()} speech."
+        ),
+        "decision_stage": "fingerprint",
+        "fingerprint_match": {key: match[key] for key in ("clip", "similarity", "votes", "offset_seconds")},
     }
 
-@app.get("/sw.js", response_class=PlainTextResponse)
-def service_worker():
-    return """
-    self.addEventListener('install', (event) => {
-      self.skipWaiting();
-    });
-    self.addEventListener('activate', (event) => {
-      event.waitUntil(clients.claim());
-    });
-    self.addEventListener('fetch', (event) => {
-      event.respondWith(fetch(event.request));
-    });
-    """
-@app.post("/detect", response_model=AudioResponse)
-async def detect_voice(request: AudioRequest):
+@app.post(
+    "/detect",
+    response_model=AudioResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": AudioRequest.model_json_schema()}},
+            "required": True
+        }
+    }
+)
+async def detect_voice(request: Request, response: Response):
     """
     Analyzes the uploaded audio and returns whether it is AI-generated or Human.
+    The Server-Timing header breaks the latency down per pipeline stage.
+    """
+    timer = StageTimer()
+    if STREAM_JSON:
+        result = await _detect_stream(request, timer)
+    else:
+        try:
+            payload = AudioRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise _body_error(e)
+        result = await _detect_base64(payload.audio_base64, payload.language, timer, payload.mode)
+    response.headers["Server-Timing"] = timer.server_timing()
+    return result
+
+def _body_error(e: ValidationError):
+    # same 422 shape FastAPI produces for a model-bound body
+    return RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+
+def _probe_head(head: bytes):
+    from preprocessing import check_duration
+    check_duration(head, MAX_AUDIO_SECONDS, partial=True)
+
+async def _read_json_audio(request: Request, spool: AudioSpool) -> AudioRequest:
+    """
+    Reads a /detect-shaped JSON body without materializing it: the audio_base64
+    string is decoded chunk by chunk into ``spool`` (memory up to
+    VOICE_UPLOAD_SPOOL_BYTES, a temp file beyond), hashing on the way. Once the
+    first HEAD_BYTES of audio are in, the header's declared duration is checked
+    while the rest uploads. Returns the request with an empty audio_base64.
+    """
+    reader = JsonAudioReader(spool)
+    try:
+        probed = False
+        async for chunk in request.stream():
+            reader.feed(chunk)
+            if not probed and len(spool.head) >= HEAD_BYTES:
+                probed = True
+                await asyncio.to_thread(_probe_head, bytes(spool.head))
+        members = reader.finish()
+        spool.finish()
+    except InvalidJson as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error",
+                                       "input": {}, "ctx": {"error": str(e)}}])
+    try:
+        # the audio itself is already in the spool; validate everything else
+        return AudioRequest.model_validate({**members, "audio_base64": ""} if reader.found else members)
+    except ValidationError as e:
+        raise _body_error(e)
+
+async def _detect_stream(request: Request, timer: StageTimer) -> AudioResponse:
     """
-    # Validate language
-    supported_languages = ["tamil", "english", "hindi", "malayalam", "telugu", "kannada"]
-    if request.language.lower() not in supported_languages:
-        # We can just warn or proceed, but let's strictly validate for now or just allow it.
-        # The prompt says "Voice samples will be provided in five languages", implying these are the expected ones.
-        pass 
+    /detect without materializing the body (see ``_read_json_audio``).
+    """
+    spool = AudioSpool()
+    try:
+        with timer.stage("base64"):
+            payload = await _read_json_audio(request, spool)
+        
+        key = make_key(spool.digest(), payload.language, current_model_version(payload.language), payload.mode)
+        cached = await cache.get(key)
+        if cached is not None:
+            timer.note("cache", "hit")
+            return AudioResponse(**cached)
+        
+        response = await analyze_audio(spool.source, payload.language, timer, payload.mode)
+        await cache.set(key, response.model_dump())
+        return response
+        
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (HTTPException, RequestValidationError):
+        raise
+    except ValueError as ve:
+        # e.g. preprocessing.AudioTooLong carries its own status (413)
+        raise HTTPException(status_code=getattr(ve, "status_code", 400), detail=str(ve))
+    except Exception as e:
+        print(f"Internal Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error processing audio")
+    finally:
+        spool.close()
 
+async def _detect_base64(audio_base64: str, language: str, timer: StageTimer = None, mode: str = "clip") -> AudioResponse:
+    """
+    Cache lookup + analysis for a Base64 payload, shared by /detect and /detect/batch.
+    """
+    timer = timer or StageTimer()
     try:
-        # 1. Decode Audio
-        y, sr = decode_audio(request.audio_base64)
+        # 1. Decode Base64 and hash the audio bytes (off the event loop, large payloads)
+        with timer.stage("base64"):
+            audio_bytes, key = await asyncio.to_thread(_decode_payload, audio_base64, language, mode)
         
-        # 2. Extract Features
-        features = extract_features(y, sr)
+        # 2. Serve repeated clips straight from the cache
+        cached = await cache.get(key)
+        if cached is not None:
+            timer.note("cache", "hit")
+            return AudioResponse(**cached)
         
-        # 3. Predict
-        result = classifier.predict(features)
+        # 3. Decode Audio, Extract Features, Predict
+        response = await analyze_audio(audio_bytes, language, timer, mode)
+        await cache.set(key, response.model_dump())
+        return response
         
-        # 4. Construct Response
-        return AudioResponse(
-            classification=result["classification"],
-            confidence_score=result["confidence_score"],
-            explanation=result["explanation"],
-            metadata={
-                "duration_seconds": features["duration"],
-                "detected_language": request.language,
-                "features_summary": {k: v for k, v in features.items() if k != "duration" and k != "mfcc_mean"}
-            }
-        )
+    except ValueError as ve:
+        # e.g. preprocessing.AudioTooLong carries its own status (413)
+        raise HTTPException(status_code=getattr(ve, "status_code", 400), detail=str(ve))
+    except Exception as e:
+        print(f"Internal Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error processing audio")
+
+# Items of one /detect/batch request analysed at the same time (each also
+# needs an admission slot, see detect_voice_batch)
+BATCH_CONCURRENCY = int(os.environ.get("VOICE_BATCH_CONCURRENCY", "0")) or 2 * engine.workers
+
+async def _iter_lines(chunks, max_line_bytes: int):
+    """
+    Splits a streamed body into lines. Over-long lines are yielded as None
+    (and skipped) instead of being buffered without bound.
+    """
+    buffer = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline < 0:
+                break
+            line = bytes(buffer[:newline])
+            del buffer[:newline + 1]
+            if oversized:
+                oversized = False
+                yield None
+            elif line.strip():
+                yield line
+        if len(buffer) > max_line_bytes:
+            buffer.clear()
+            oversized = True
+    if oversized:
+        yield None
+    elif buffer.strip():
+        yield bytes(buffer)
+
+async def _score_line(index: int, line):
+    """
+    Scores one NDJSON item; failures become a per-item error line.
+    """
+    item = {"index": index}
+    try:
+        if line is None:
+            raise HTTPException(status_code=413, detail="Line exceeds the upload size limit")
+        try:
+            payload = json.loads(line)
+            if isinstance(payload, dict) and "id" in payload:
+                item["id"] = payload["id"]
+            request = AudioRequest.model_validate(payload)
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid item: {e}")
+        response = await _detect_base64(request.audio_base64, request.language, mode=request.mode)
+        item.update(response.model_dump())
+    except HTTPException as e:
+        item.update({"status": e.status_code, "error": e.detail})
+    return json.dumps(item) + "\n"
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body while
+    streaming the response. The stock class listens for client disconnects on
+    ``receive``, which would swallow request body chunks; here disconnects
+    surface through ``request.stream()`` instead.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.post(
+    "/detect/batch",
+    response_class=StreamingResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+            "required": True
+        }
+    }
+)
+async def detect_voice_batch(request: Request):
+    """
+    Bulk detection over newline-delimited JSON. Each line has the /detect shape
+    (`{"audio_base64": ..., "language": ...}`, optional `id`). Items are analysed
+    concurrently and one NDJSON result line (with the item's `index`) is streamed
+    back as soon as that item finishes, so output order may differ from input
+    order. Bad items produce an `error` line without failing the batch.
+    Every item in flight counts against VOICE_MAX_CONCURRENT like a separate
+    request; the batch always keeps at least one item going.
+    """
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    # The request holds one admission slot, which one item at a time may use;
+    # every other item in flight takes a slot of its own like a separate request.
+    own_slot_free = True
+    own_slot_freed = asyncio.Event()
+    
+    async def run(index, line):
+        await results.put(await _score_line(index, line))
+    
+    async def item_slot():
+        """
+        Waits for a slot for the next item: the request's own, or an admission
+        slot, whichever is available first. Returns True for the request's own.
+        """
+        nonlocal own_slot_free
+        if not own_slot_free:
+            own_slot_freed.clear()
+            acquire = asyncio.ensure_future(admission.acquire())
+            freed = asyncio.ensure_future(own_slot_freed.wait())
+            try:
+                await asyncio.wait((acquire, freed), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                freed.cancel()
+                acquire.cancel()
+                # a slot granted just before the cancellation is handed back by acquire
+                await asyncio.gather(acquire, return_exceptions=True)
+            if not acquire.cancelled() and acquire.exception() is None:
+                return False
+            # rejected (queue full or timed out): wait for the request's own slot instead
+            while not own_slot_free:
+                own_slot_freed.clear()
+                await own_slot_freed.wait()
+        own_slot_free = False
+        return True
+    
+    async def produce():
+        tasks = set()
         
+        def finished(borrowed, task):
+            nonlocal own_slot_free
+            tasks.discard(task)
+            slots.release()
+            if borrowed:
+                own_slot_free = True
+                own_slot_freed.set()
+            else:
+                admission.release()
+        
+        index = 0
+        try:
+            async for line in _iter_lines(request.stream(), 2 * UPLOAD_MAX_BYTES):
+                # Backpressure: stop reading the body while all slots are busy
+                await slots.acquire()
+                try:
+                    borrowed = await item_slot()
+                except BaseException:
+                    slots.release()
+                    raise
+                task = asyncio.create_task(run(index, line))
+                tasks.add(task)
+                # a callback, so the slot comes back even if the task is cancelled before it starts
+                task.add_done_callback(functools.partial(finished, borrowed))
+                index += 1
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await results.put(None)
+    
+    async def stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                line = await results.get()
+                if line is None:
+                    break
+                yield line
+        finally:
+            producer.cancel()
+    
+    return DuplexStreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def _read_upload(request: Request, spool: AudioSpool, language: str, mode: str):
+    """
+    Spools a multipart (`file` part, optional `language` / `mode` fields) or raw
+    audio body. Returns the (language, mode) to use.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'file' part")
+        language = form.get("language") or language
+        mode = form.get("mode") or mode
+        if mode not in ("clip", "segments"):
+            raise HTTPException(status_code=400, detail="mode must be 'clip' or 'segments'")
+        await spool.consume(iter_upload(upload))
+    else:
+        await spool.consume(request.stream())
+    if not spool.size:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    return language, mode
+
+@app.post(
+    "/detect/upload",
+    response_model=AudioResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"},
+                            "language": {"type": "string"},
+                            "mode": {"type": "string", "enum": ["clip", "segments"]}
+                        }
+                    }
+                },
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
+            },
+            "required": True
+        }
+    }
+)
+async def detect_voice_upload(request: Request, language: str = "English", mode: Literal["clip", "segments"] = "clip"):
+    """
+    Same analysis as /detect, but takes the audio file itself instead of Base64:
+    multipart/form-data with a `file` part (and optional `language` / `mode`
+    fields), or a raw application/octet-stream body with `?language=&mode=`.
+    """
+    spool = AudioSpool()
+    try:
+        language, mode = await _read_upload(request, spool, language, mode)
+        key = make_key(spool.digest(), language, current_model_version(language), mode)
+        cached = await cache.get(key)
+        if cached is not None:
+            return AudioResponse(**cached)
+        
+        response = await analyze_audio(spool.source, language, mode=mode)
+        await cache.set(key, response.model_dump())
+        return response
+        
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
     except ValueError as ve:
-        raise HTTPException(status_code=400, detail=str(ve))
+        # e.g. preprocessing.AudioTooLong carries its own status (413)
+        raise HTTPException(status_code=getattr(ve, "status_code", 400), detail=str(ve))
     except Exception as e:
         print(f"Internal Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error processing audio")
+    finally:
+        spool.close()
+
+@app.websocket("/detect/live")
+async def detect_live(websocket: WebSocket, language: str = "English", format: str = "pcm_s16le",
+                      sample_rate: int = 16000, channels: int = 1):
+    """
+    Real-time detection for live calls: send audio as binary messages
+    (raw PCM, or complete encoded files with `format=encoded`) and receive a
+    rolling verdict every VOICE_LIVE_HOP seconds. Send "end" for a final verdict.
+    """
+    await live.serve(websocket, language, format, sample_rate, channels)
+
+# Asynchronous jobs: long recordings are queued in SQLite and analysed in the
+# background; clients poll GET /jobs/{id} (see jobs.py)
+async def _run_job(job: dict):
+    cached = await cache.get(job["cache_key"])
+    if cached is not None:
+        return cached
+    response = await analyze_audio(job["audio_path"], job["language"], mode=job["mode"])
+    result = response.model_dump()
+    await cache.set(job["cache_key"], result)
+    return result
+
+jobs = JobQueue.from_env(_run_job, engine.workers)
+
+REGISTRY.register(Gauge(
+    "voice_jobs", "Asynchronous jobs by status.", ("status",),
+    callback=lambda: {(status,): count for status, count in jobs.stats().items() if status != "workers"}))
+
+def _probe_job_audio(source):
+    from preprocessing import check_duration, probe_duration
+    check_duration(source, MAX_AUDIO_SECONDS)
+    return probe_duration(source)
+
+@app.post(
+    "/jobs",
+    status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": AudioRequest.model_json_schema()},
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"},
+                            "language": {"type": "string"},
+                            "mode": {"type": "string", "enum": ["clip", "segments"]}
+                        }
+                    }
+                },
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
+            },
+            "required": True
+        }
+    }
+)
+async def submit_job(request: Request, response: Response, language: str = "English",
+                     mode: Literal["clip", "segments"] = "clip"):
+    """
+    Queues the audio for background analysis and returns its job ID right away.
+    Takes the /detect JSON body or, like /detect/upload, a multipart or raw audio
+    body. Shorter clips are analysed first; poll `GET /jobs/{job_id}` for the result.
+    """
+    spool = AudioSpool()
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            payload = await _read_json_audio(request, spool)
+            language, mode = payload.language, payload.mode
+            if not spool.size:
+                raise HTTPException(status_code=400, detail="Empty upload")
+        else:
+            language, mode = await _read_upload(request, spool, language, mode)
+        duration = await asyncio.to_thread(_probe_job_audio, spool.source)
+        key = make_key(spool.digest(), language, current_model_version(language), mode)
+        job_id = await jobs.submit(spool, language, mode, key, duration)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (HTTPException, RequestValidationError):
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=getattr(ve, "status_code", 400), detail=str(ve))
+    except Exception as e:
+        print(f"Internal Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error queuing job")
+    finally:
+        spool.close()
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a job: queued, running, done (with the /detect response in
+    `result`) or failed (with the HTTP status and detail /detect would have
+    returned in `error`). Finished jobs are kept for VOICE_JOBS_TTL seconds.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "language": job["language"],
+        "mode": job["mode"],
+        "duration_seconds": job["duration"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+app.add_middleware(AdmissionMiddleware, controller=admission, body_limits={
+    "/detect": MAX_BODY_BYTES,
+    "/detect/upload": UPLOAD_MAX_BYTES + 64 * 1024,
+    # raw and multipart uploads like /detect/upload, or the base64 /detect body
+    "/jobs": max(UPLOAD_MAX_BYTES + 64 * 1024, MAX_BODY_BYTES),
+    # unbounded stream of items; each item in flight takes an admission slot
+    "/detect/batch": None,
+})
+# Registered last so it sees every route; unknown paths share one "other" label
+app.add_middleware(MetricsMiddleware, routes=[route.path for route in app.routes])
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
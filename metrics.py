@@ -0,0 +1,231 @@
+"""
+Low-overhead request and pipeline metrics in the Prometheus text format.
+
+Metrics are plain Python counters updated from the event loop thread (no locks,
+no background threads), so they are cheap enough to leave enabled in
+production. ``MetricsMiddleware`` counts requests, errors, received bytes,
+latency and in-flight requests per route; ``StageTimer`` collects per-stage
+pipeline timings for one request, feeds the stage histogram and renders the
+``Server-Timing`` header.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond cache hits up to multi-minute recordings.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """
+        ``callback`` (optional) returns {labels tuple: value} at render time, for
+        values owned by other components (cache hits, queue depth, ...).
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        if self.callback is not None:
+            self._values = dict(self.callback())
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "voice_requests_total", "HTTP requests by route and status code.", ("route", "status")))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "voice_request_errors_total", "HTTP requests answered with a 4xx/5xx status.", ("route", "status")))
+REQUEST_BYTES = REGISTRY.register(Counter(
+    "voice_request_bytes_total", "Request body bytes received.", ("route",)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "voice_request_seconds", "HTTP request latency.", ("route",)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "voice_requests_in_flight", "HTTP requests currently being handled.", ("route",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "voice_stage_seconds", "Time spent per pipeline stage (base64, decode, features, predict).", ("stage",)))
+AUDIO_SECONDS = REGISTRY.register(Counter(
+    "voice_audio_seconds_total", "Seconds of audio analysed."))
+PIPELINE_IN_FLIGHT = REGISTRY.register(Gauge(
+    "voice_pipeline_in_flight", "Clips currently in the decode/features/predict pipeline."))
+
+
+class StageTimer:
+    """
+    Collects stage durations for one request.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.notes = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, name)
+
+    def update(self, timings: dict):
+        """
+        Adds durations measured elsewhere (e.g. inside a pool worker).
+        """
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    def note(self, name: str, description: str):
+        """
+        Adds a duration-less Server-Timing entry, e.g. note("cache", "hit").
+        """
+        self.notes[name] = description
+
+    def server_timing(self):
+        """
+        Renders a Server-Timing header value in milliseconds, e.g.
+        'base64;dur=0.41, decode;dur=1.20, features;dur=3.40, predict;dur=0.08, total;dur=5.31'.
+        """
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.extend(f'{name};desc="{description}"' for name, description in self.notes.items())
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task or body buffering) counting
+    requests, errors, body bytes, latency and in-flight requests.
+    Routes outside ``routes`` are grouped under "other" to bound label cardinality.
+    """
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = set(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = scope["path"] if scope["path"] in self.routes else "other"
+        status = {"code": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                REQUEST_BYTES.inc(len(message.get("body", b"")), route)
+            return message
+
+        async def status_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc(1, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, status_send)
+        finally:
+            IN_FLIGHT.dec(1, route)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+            code = str(status["code"])
+            REQUESTS.inc(1, route, code)
+            if status["code"] >= 400:
+                REQUEST_ERRORS.inc(1, route, code)
@@ -1,26 +1,113 @@
+import os
 import random
 
+import numpy as np
+
+from backends import load_backend
+
+# Model input layout: summary features from preprocessing.extract_features,
+# flattened into one float32 vector per clip.
+SCALAR_FEATURES = [
+    "rms",
+    "zero_crossing_rate",
+    "spectral_centroid_mean",
+    "spectral_rolloff_mean",
+    "spectral_flatness_mean",
+]
+N_MFCC = 13  # matches preprocessing.N_MFCC
+FEATURE_DIM = len(SCALAR_FEATURES) + N_MFCC
+
+# Input layout of the optional first cascade stage (preprocessing.cheap_features)
+CASCADE_FEATURES = [
+    "rms",
+    "zero_crossing_rate",
+    "spectral_centroid_mean",
+]
+
+def features_to_vector(features: dict):
+    """
+    Flattens a feature dict into the float32 model input vector (FEATURE_DIM,).
+    """
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    for i, name in enumerate(SCALAR_FEATURES):
+        vector[i] = features.get(name, 0.0)
+    mfcc = features.get("mfcc_mean")
+    if mfcc is not None:
+        mfcc = np.asarray(mfcc, dtype=np.float32)[:N_MFCC]
+        vector[len(SCALAR_FEATURES):len(SCALAR_FEATURES) + len(mfcc)] = mfcc
+    return vector
+
+def segments_to_matrix(segments: dict):
+    """
+    Stacks per-window features from preprocessing.segment_features into the
+    model input layout, shape (n_windows, FEATURE_DIM), without a Python loop
+    over windows.
+    """
+    n = len(segments["start"])
+    matrix = np.zeros((n, FEATURE_DIM), dtype=np.float32)
+    for i, name in enumerate(SCALAR_FEATURES):
+        matrix[:, i] = segments[name]
+    mfcc = np.asarray(segments["mfcc_mean"], dtype=np.float32)[:, :N_MFCC]
+    matrix[:, len(SCALAR_FEATURES):len(SCALAR_FEATURES) + mfcc.shape[1]] = mfcc
+    return matrix
+
+def model_version(model_path: str = None, cascade_model_path: str = None, cascade_band=None):
+    """
+    Identifies the weights a prediction came from, so cached results are not
+    served across model updates. A cascade stage and its band are part of it.
+    """
+    def file_version(path):
+        try:
+            mtime = int(os.path.getmtime(path))
+        except OSError:
+            mtime = 0
+        return f"{os.path.basename(path)}@{mtime}"
+    
+    version = file_version(model_path) if model_path else "simulation"
+    if cascade_model_path:
+        low, high = cascade_band or (0.0, 1.0)
+        version += f"+{file_version(cascade_model_path)}[{low:g}-{high:g}]"
+    return version
+
 class VoiceClassifier:
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, backend_options: dict = None,
+                 cascade_model_path: str = None, cascade_band=(0.2, 0.8)):
         """
         Initialize the classifier. 
-        In a real scenario, this would load a pre-trained model (e.g., PyTorch, TensorFlow, ONNX).
+        Loads a pre-trained model through the backend registered for its file
+        extension (see backends.py; ONNX Runtime for ".onnx").
+        backend_options are passed to the backend (e.g. thread counts).
+        
+        cascade_model_path (optional) is a tiny first-stage model over
+        CASCADE_FEATURES. Its AI probability decides a request on its own unless
+        it falls inside cascade_band (low, high); see ``screen``.
         """
         self.model_path = model_path
+        self.cascade_band = tuple(cascade_band)
+        self.version = model_version(model_path, cascade_model_path, self.cascade_band)
+        self.backend_options = backend_options or {}
+        self.backend = None
+        self.cascade_backend = None
         self.is_loaded = False
         if model_path:
             self.load_model(model_path)
         else:
             # Placeholder for when no model is provided
             print("No model path provided. Running in simulation mode.")
+        if cascade_model_path:
+            print(f"Loading cascade stage from {cascade_model_path}...")
+            self.cascade_backend = load_backend(cascade_model_path, **self.backend_options)
+
+    @property
+    def has_cascade(self):
+        return self.cascade_backend is not None
 
     def load_model(self, path):
         """
         Load the model weights.
         """
         print(f"Loading model from {path}...")
-        # TODO: Implement actual model loading logic
-        # self.model = torch.load(path)
+        self.backend = load_backend(path, **self.backend_options)
         self.is_loaded = True
 
     def predict(self, features: dict):
@@ -37,35 +124,153 @@ class VoiceClassifier:
                 "explanation": str
             }
         """
-        # TODO: Replace with actual model inference
-        # input_tensor = preprocess(features)
-        # output = self.model(input_tensor)
-        # score = torch.sigmoid(output).item()
+        return self.predict_batch([features])[0]
+
+    def predict_batch(self, batch: list):
+        """
+        Predicts a list of feature dicts with a single forward pass.
+
+        Args:
+            batch (list): feature dicts from preprocessing.
+
+        Returns:
+            list: one result dict per input, in order (see ``predict``).
+        """
+        scores = self._forward(batch)
+        return [self._build_result(features, score) for features, score in zip(batch, scores)]
+
+    def predict_vectors(self, matrix):
+        """
+        ``predict_batch`` for inputs already in the model layout, shape
+        (batch, FEATURE_DIM) as from ``features_to_vector`` (e.g. rows read
+        from a feature_store.FeatureStore), without building feature dicts.
+
+        Returns:
+            list: one result dict per row, in order (see ``predict``).
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        centroid = matrix[:, SCALAR_FEATURES.index("spectral_centroid_mean")]
+        return [
+            self._build_result({"spectral_centroid_mean": float(c)}, score)
+            for c, score in zip(centroid, self._score(matrix))
+        ]
+
+    def screen(self, features: dict):
+        """
+        First cascade stage: scores the cheap features (CASCADE_FEATURES) with
+        the cascade model.
         
-        # SIMULATION LOGIC:
-        # For demonstration purposes, we return a mock result.
-        # We can use the spectral centroid from features to make it slightly dynamic,
-        # though this is NOT a real detection metric.
+        Returns:
+            tuple: (score, result). result has decision_stage "cascade" when the
+            score is outside the uncertainty band, otherwise it is None and the
+            caller computes the full features and calls ``predict``.
+        """
+        vector = np.array([[features.get(name, 0.0) for name in CASCADE_FEATURES]], dtype=np.float32)
+        score = float(self.cascade_backend.predict(vector)[0])
+        low, high = self.cascade_band
+        if low <= score <= high:
+            return score, None
+        return score, self._build_result(features, score, stage="cascade")
+
+    def predict_segments(self, segments: dict, batch_size: int = 32, early_exit: bool = True):
+        """
+        Scores the windows from preprocessing.segment_features and aggregates
+        them into one verdict by majority vote.
+        
+        Windows are scored in vectorized batches of ``batch_size``. With
+        ``early_exit`` scoring stops as soon as one class holds a majority of
+        all windows, since the remaining windows can no longer change the vote.
+        
+        Returns:
+            dict: the ``predict`` fields plus "segments" (one
+            {"start", "end", "ai_probability"} per scored window) and
+            "segment_summary" (window counts and whether scoring stopped early).
+        """
+        matrix = segments_to_matrix(segments)
+        total = len(matrix)
+        if not total:
+            raise ValueError("Audio too short to segment")
+        scores = []
+        ai_votes = 0
+        for start in range(0, total, max(1, batch_size)):
+            chunk = self._score(matrix[start:start + batch_size])
+            scores.extend(chunk)
+            ai_votes += sum(score >= 0.5 for score in chunk)
+            if early_exit and max(ai_votes, len(scores) - ai_votes) * 2 > total:
+                break
         
-        # Mock score generation
-        confidence = random.uniform(0.6, 0.99)
+        scored = len(scores)
+        human_votes = scored - ai_votes
+        mean_score = float(np.mean(scores))
+        is_ai = ai_votes > human_votes or (ai_votes == human_votes and mean_score >= 0.5)
+        agreeing = [score if is_ai else 1.0 - score for score in scores if (score >= 0.5) == is_ai]
+        classification = "AI-Generated" if is_ai else "Human"
         
-        # Randomly decide class for demo (or use feature logic if we had a real heuristic)
-        # Let's say if we have a high spectral centroid, we might guess AI (just a guess)
-        # Real AI voices often have artifacts in high frequencies, but modern ones don't.
+        explanation = (
+            f"{ai_votes} of {scored} analysed segments score as AI-generated and {human_votes} as human; "
+            f"the majority indicates {classification.lower()} speech."
+        )
+        if self.backend is None:
+            explanation += " Note: This is a simulation response as no trained model is loaded."
         
-        is_ai = random.choice([True, False])
+        return {
+            "classification": classification,
+            "confidence_score": round(float(np.mean(agreeing)), 4),
+            "explanation": explanation,
+            "decision_stage": "full",
+            "segments": [
+                {"start": round(float(s), 2), "end": round(float(e), 2), "ai_probability": round(float(p), 4)}
+                for s, e, p in zip(segments["start"], segments["end"], scores)
+            ],
+            "segment_summary": {
+                "total": total,
+                "scored": scored,
+                "ai": ai_votes,
+                "human": human_votes,
+                "early_exit": scored < total,
+            },
+        }
+
+    def _forward(self, batch: list):
+        """
+        Returns the probability that each item is AI-generated.
+        """
+        return self._score(np.stack([features_to_vector(f) for f in batch]))
+
+    def _score(self, matrix):
+        """
+        Scores a (batch, FEATURE_DIM) float32 matrix with one forward pass.
+        """
+        if self.backend is not None:
+            return self.backend.predict(matrix).tolist()
+        
+        # SIMULATION LOGIC:
+        # For demonstration purposes, we return a mock score per item.
+        # Real AI voices often have artifacts in high frequencies, but modern ones don't,
+        # so we do not pretend to derive the score from the features.
+        scores = []
+        for _ in range(len(matrix)):
+            confidence = random.uniform(0.6, 0.99)
+            is_ai = random.choice([True, False])
+            scores.append(confidence if is_ai else 1.0 - confidence)
+        return scores
+
+    def _build_result(self, features: dict, score: float, stage: str = "full"):
+        is_ai = score >= 0.5
+        confidence = score if is_ai else 1.0 - score
         
         classification = "AI-Generated" if is_ai else "Human"
         
         explanation = (
             f"Analysis of audio features (Spectral Centroid: {features.get('spectral_centroid_mean', 0):.2f}) "
-            f"suggests patterns consistent with {classification.lower()} speech. "
-            "Note: This is a simulation response as no trained model is loaded."
+            f"suggests patterns consistent with {classification.lower()} speech."
         )
+        if self.backend is None and stage == "full":
+            explanation += " Note: This is a simulation response as no trained model is loaded."
 
         return {
             "classification": classification,
             "confidence_score": round(confidence, 4),
-            "explanation": explanation
+            "explanation": explanation,
+            "decision_stage": stage
         }
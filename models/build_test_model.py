@@ -0,0 +1,100 @@
+"""
+Builds the small ONNX models bundled for exercising the inference path end to end.
+
+    python models/build_test_model.py               # (re)writes models/voice_test.onnx and voice_cascade_test.onnx
+    python models/build_test_model.py --check       # also loads them through VoiceClassifier
+    python models/build_test_model.py -o /tmp/m     # writes them to another directory
+
+voice_test.onnx is a fixed logistic regression over the FEATURE_DIM summary
+features (float32 input "features" of shape (batch, FEATURE_DIM), output
+"ai_probability" of shape (batch, 1)); voice_cascade_test.onnx is the same over
+the CASCADE_FEATURES of the first cascade stage. Their weights are arbitrary;
+they only exist so that the ONNX Runtime backend, batching, the cascade and
+warm-up can be measured without a trained model.
+Needs the `onnx` package in addition to `onnxruntime`.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from model import CASCADE_FEATURES, FEATURE_DIM, SCALAR_FEATURES, VoiceClassifier
+
+OUTPUT = os.path.join(HERE, "voice_test.onnx")
+CASCADE_OUTPUT = os.path.join(HERE, "voice_cascade_test.onnx")
+
+SCALE = {
+    "rms": 2.0,
+    "zero_crossing_rate": 8.0,
+    "spectral_centroid_mean": 1.0 / 2000.0,
+    "spectral_rolloff_mean": 1.0 / 4000.0,
+    "spectral_flatness_mean": 6.0,
+}
+
+
+def build(path: str = OUTPUT, feature_names=SCALAR_FEATURES, n_features: int = FEATURE_DIM, bias: float = -1.5):
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    weights = np.zeros((n_features, 1), dtype=np.float32)
+    for i, name in enumerate(feature_names):
+        weights[i, 0] = SCALE[name]
+    bias = np.array([bias], dtype=np.float32)
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("MatMul", ["features", "W"], ["logits_raw"]),
+            helper.make_node("Add", ["logits_raw", "b"], ["logits"]),
+            helper.make_node("Sigmoid", ["logits"], ["ai_probability"]),
+        ],
+        "voice_test",
+        [helper.make_tensor_value_info("features", TensorProto.FLOAT, ["batch", n_features])],
+        [helper.make_tensor_value_info("ai_probability", TensorProto.FLOAT, ["batch", 1])],
+        initializer=[numpy_helper.from_array(weights, "W"), numpy_helper.from_array(bias, "b")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], producer_name="voice-test")
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    print(f"Wrote {path}")
+
+
+def check(path: str = OUTPUT, cascade_path: str = CASCADE_OUTPUT):
+    from preprocessing import cheap_features, extract_features
+
+    sr = 16000
+    t = np.arange(sr) / sr
+    clips = [
+        0.5 * np.sin(2 * np.pi * 440 * t),
+        0.1 * np.random.default_rng(0).standard_normal(sr),
+    ]
+    classifier = VoiceClassifier(path, cascade_model_path=cascade_path)
+    results = classifier.predict_batch([extract_features(clip.astype(np.float32), sr) for clip in clips])
+    for result in results:
+        print(result["classification"], result["confidence_score"])
+    for clip in clips:
+        score, result = classifier.screen(cheap_features(clip.astype(np.float32), sr))
+        print(f"cascade score {score:.4f}:", result["classification"] if result else "uncertain, full model")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the small ONNX test models (needs onnx).")
+    parser.add_argument("-o", "--output-dir", default=HERE, help="directory to write the models to (default: models/)")
+    parser.add_argument("--check", action="store_true", help="also score two synthetic clips through VoiceClassifier")
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, os.path.basename(OUTPUT))
+    cascade_path = os.path.join(args.output_dir, os.path.basename(CASCADE_OUTPUT))
+    build(path)
+    build(cascade_path, CASCADE_FEATURES, len(CASCADE_FEATURES), bias=-2.0)
+    if args.check:
+        check(path, cascade_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,81 +1,1069 @@
 import base64
 import io
+import os
 import numpy as np
 import soundfile as sf
-import wave
 import struct
+from functools import lru_cache
 
 def decode_audio(base64_string: str):
     """
     Decodes a Base64 string into a numpy audio array and sampling rate.
     """
     # Decode base64 string
-    audio_bytes = base64.b64decode(base64_string)
-    audio_file = io.BytesIO(audio_bytes)
-    # Try reading with soundfile (supports many formats on libsndfile)
+    return decode_audio_bytes(base64.b64decode(base64_string))
+
+def decode_audio_bytes(audio_bytes: bytes):
+    """
+    Decodes raw (already base64-decoded) audio file bytes into a numpy audio
+    array and sampling rate.
+    """
+    data = np.frombuffer(audio_bytes, dtype=np.uint8)
+    return _decode(data, lambda: io.BytesIO(audio_bytes))
+
+def decode_audio_file(path: str):
+    """
+    Decodes an audio file on disk (e.g. a spooled upload). WAV data is read
+    through a memory map, so the file is never copied into Python bytes.
+    """
+    if os.path.getsize(path):
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        data = np.zeros(0, dtype=np.uint8)
+    return _decode(data, lambda: path)
+
+def decode_audio_source(source):
+    """
+    Decodes either raw audio bytes or a path to an audio file.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return decode_audio_file(source)
+    return decode_audio_bytes(source)
+
+class AudioTooLong(ValueError):
+    # mapped to 413 Payload Too Large by the API
+    status_code = 413
+
+def probe_duration(source, partial: bool = False):
+    """
+    Reads the duration in seconds of ``source`` (bytes or a file path) from the
+    container header only, without decoding any audio. Returns None when the
+    header does not tell (or cannot be read; the decoder reports that later).
+    
+    With ``partial`` the source is only the beginning of a file still being
+    received; the WAV data size is then taken as declared rather than as present.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        data = np.memmap(source, dtype=np.uint8, mode="r") if os.path.getsize(source) else np.zeros(0, dtype=np.uint8)
+        audio_file = source
+    else:
+        data = np.frombuffer(source, dtype=np.uint8)
+        audio_file = io.BytesIO(source)
     try:
-        y, sr = sf.read(audio_file, always_2d=False)
-        # ensure mono
-        if isinstance(y, np.ndarray) and y.ndim > 1:
-            y = np.mean(y, axis=1)
-        return y.astype(np.float32), int(sr)
+        if sniff_format(bytes(data[:12])) == "wav":
+            (code, channels, sr, block_align, bits), start, end = _wav_layout(data, declared=partial)
+            if code in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) and sr and block_align and end is not None:
+                return (end - start) / block_align / sr
+            return None
+        return float(sf.info(audio_file).duration) or None
     except Exception:
-        # Fallback: try WAV via built-in wave module
-        try:
-            audio_file.seek(0)
-            with wave.open(audio_file, "rb") as wf:
-                sr = wf.getframerate()
-                n_frames = wf.getnframes()
-                n_channels = wf.getnchannels()
-                sampwidth = wf.getsampwidth()
-                frames = wf.readframes(n_frames)
-                # Convert bytes to numpy array
-                fmt_char = {1: 'b', 2: 'h', 4: 'i'}.get(sampwidth)
-                if not fmt_char:
-                    raise ValueError("Unsupported sample width")
-                fmt = f"<{n_frames * n_channels}{fmt_char}"
-                data = struct.unpack(fmt, frames)
-                y = np.array(data, dtype=np.float32)
-                if n_channels > 1:
-                    y = y.reshape(-1, n_channels).mean(axis=1)
-                # Normalize based on bit depth
-                max_val = float(2 ** (8 * sampwidth - 1))
-                y = y / max_val
-                return y, sr
-        except Exception as e:
-            raise ValueError(f"Unsupported or unreadable audio format: {str(e)}")
-
-def extract_features(y, sr):
+        return None
+
+def check_duration(source, max_seconds: float, partial: bool = False):
+    """
+    Raises AudioTooLong when the header says ``source`` is longer than
+    ``max_seconds`` (0 / None disables the check). See ``probe_duration``
+    for ``partial``.
+    """
+    if not max_seconds:
+        return
+    duration = probe_duration(source, partial)
+    if duration is not None and duration > max_seconds:
+        raise AudioTooLong(f"Audio is {duration:.1f} s long; the limit is {max_seconds:g} s")
+
+def sniff_format(header: bytes):
+    """
+    Identifies the container from its first bytes: "wav", "flac", "ogg",
+    "aiff", "mp3" or None when unknown.
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+def _decode(data, open_for_soundfile):
+    """
+    Picks one decoder from the sniffed header: PCM/float WAV is converted
+    straight from the buffer, everything else goes to libsndfile.
+    """
+    try:
+        if sniff_format(bytes(data[:12])) == "wav":
+            decoded = _decode_wav(data)
+            # None: a compressed WAV codec (ADPCM, mu-law, ...) libsndfile handles
+            if decoded is not None:
+                return decoded
+        return _decode_soundfile(open_for_soundfile())
+    except Exception as e:
+        raise ValueError(f"Unsupported or unreadable audio format: {str(e)}")
+
+def _decode_soundfile(audio_file):
+    # Decode straight to float32 (no float64 intermediate)
+    y, sr = sf.read(audio_file, dtype="float32", always_2d=True)
+    if y.shape[1] == 1:
+        return y.reshape(-1), int(sr)
+    mono = y.sum(axis=1, dtype=np.float32)
+    mono *= 1.0 / y.shape[1]
+    return mono, int(sr)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Frames converted per step, so the integer -> float32 conversion never
+# allocates more than the output array plus one small block.
+DECODE_BLOCK = 1 << 16
+
+def _decode_wav(data):
+    """
+    Converts the PCM payload of a WAV file held in a uint8 buffer to mono
+    float32 from a view over the buffer.
+    """
+    fmt, start, end = _wav_layout(data)
+    return _pcm_to_mono(data[start:end], *fmt)
+
+def _wav_layout(data, declared: bool = False):
+    """
+    Walks the RIFF chunks of a WAV file held in a uint8 buffer. Returns
+    ((code, channels, sr, block_align, bits), data_start, data_end).
+    With ``declared`` data_end is where the header says the data chunk ends,
+    even past the end of the buffer (None when the writer left it open).
+    """
+    n_bytes = len(data)
+    pos = 12
+    fmt = None
+    while pos + 8 <= n_bytes:
+        chunk_id = bytes(data[pos:pos + 4])
+        size = int.from_bytes(bytes(data[pos + 4:pos + 8]), "little")
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            raw = bytes(data[body:body + min(size, 40)])
+            if len(raw) < 16:
+                raise ValueError("Truncated WAV fmt chunk")
+            code, channels, sr, _, block_align, bits = struct.unpack("<HHIIHH", raw[:16])
+            if code == WAVE_FORMAT_EXTENSIBLE and len(raw) >= 26:
+                # The real format code is the first field of the SubFormat GUID
+                code = struct.unpack("<H", raw[24:26])[0]
+            fmt = (code, channels, sr, block_align, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk precedes fmt chunk")
+            # Streaming writers leave the size at 0 / 0xFFFFFFFF; read to the end then
+            if declared:
+                return fmt, body, None if size in (0, 0xFFFFFFFF) else body + size
+            end = n_bytes if size in (0, 0xFFFFFFFF) else min(body + size, n_bytes)
+            return fmt, body, end
+        pos = body + size + (size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+def _pcm_to_mono(pcm, code, channels, sr, block_align, bits):
+    """
+    Converts interleaved PCM / IEEE float bytes to a mono float32 array.
+    Returns None for codecs that need a real decoder.
+    """
+    if channels < 1 or sr < 1:
+        raise ValueError("Invalid WAV header")
+    width = block_align // channels if block_align else (bits + 7) // 8
+    if code == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        dtype, offset, scale = ("<f4" if width == 4 else "<f8"), 0.0, 1.0
+    elif code == WAVE_FORMAT_PCM and width == 1:
+        dtype, offset, scale = "u1", 128.0, 1.0 / 128.0
+    elif code == WAVE_FORMAT_PCM and width in (2, 3, 4):
+        # 24-bit samples are widened into the top three bytes of an int32
+        dtype = "<i2" if width == 2 else "<i4"
+        offset, scale = 0.0, 1.0 / float(2 ** 15 if width == 2 else 2 ** 31)
+    else:
+        return None
+    
+    frame_bytes = width * channels
+    n = len(pcm) // frame_bytes
+    pcm = pcm[:n * frame_bytes].reshape(n, frame_bytes)
+    
+    if dtype == "<f4" and channels == 1 and np.little_endian:
+        # Zero copy: the payload already is mono float32 (read-only view)
+        return pcm.reshape(-1).view(np.float32), int(sr)
+    
+    y = np.empty(n, dtype=np.float32)
+    for start in range(0, n, DECODE_BLOCK):
+        block = pcm[start:start + DECODE_BLOCK]
+        if width == 3:
+            wide = np.zeros((len(block), channels, 4), dtype=np.uint8)
+            wide[:, :, 1:] = block.reshape(len(block), channels, 3)
+            samples = wide.view("<i4").reshape(len(block), channels)
+        else:
+            samples = block.view(dtype)
+        # Mix down while converting: one float32 write per output sample
+        np.sum(samples, axis=1, dtype=np.float32, out=y[start:start + DECODE_BLOCK])
+    if offset:
+        y -= offset * channels
+    y *= scale / channels
+    return y, int(sr)
+
+# Framing / spectral analysis parameters. Every spectral feature is computed
+# from the same framed STFT, so they all describe the full clip.
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 64
+N_MFCC = 13
+ROLLOFF_PERCENT = 0.85
+# Frames transformed per batched rfft; bounds the temporary spectrum size.
+FRAME_BLOCK = 256
+
+def frame_signal(y, frame_length: int = N_FFT, hop_length: int = HOP_LENGTH):
+    """
+    Returns a read-only (n_frames, frame_length) strided view over ``y``.
+    No samples are copied; signals shorter than one frame are zero-padded.
+    """
+    if len(y) < frame_length:
+        y = np.pad(y, (0, frame_length - len(y)))
+    n_frames = 1 + (len(y) - frame_length) // hop_length
+    stride = y.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        y, shape=(n_frames, frame_length), strides=(hop_length * stride, stride), writeable=False
+    )
+
+@lru_cache(maxsize=8)
+def _hann_window(n_fft: int):
+    return np.hanning(n_fft).astype(np.float32)
+
+@lru_cache(maxsize=8)
+def _fft_frequencies(sr: int, n_fft: int):
+    return np.fft.rfftfreq(n_fft, d=1.0 / sr).astype(np.float32)
+
+def _hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz, dtype=np.float64) / 700.0)
+
+def _mel_to_hz(mel):
+    return 700.0 * (10.0 ** (np.asarray(mel, dtype=np.float64) / 2595.0) - 1.0)
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sr: int, n_fft: int = N_FFT, n_mels: int = N_MELS):
+    """
+    Triangular mel filterbank, shape (n_mels, n_fft // 2 + 1), float32.
+    Cached per sample rate.
+    """
+    fft_freqs = np.fft.rfftfreq(n_fft, d=1.0 / sr)
+    mel_points = np.linspace(_hz_to_mel(0.0), _hz_to_mel(sr / 2.0), n_mels + 2)
+    hz_points = _mel_to_hz(mel_points)
+    lower, center, upper = hz_points[:-2, None], hz_points[1:-1, None], hz_points[2:, None]
+    rising = (fft_freqs[None, :] - lower) / np.maximum(center - lower, 1e-10)
+    falling = (upper - fft_freqs[None, :]) / np.maximum(upper - center, 1e-10)
+    weights = np.maximum(0.0, np.minimum(rising, falling))
+    # Slaney-style area normalisation so wide high-frequency bands are not over-weighted
+    weights *= (2.0 / (upper - lower))
+    return weights.astype(np.float32)
+
+@lru_cache(maxsize=8)
+def _dct_matrix(n_mfcc: int, n_mels: int):
+    """
+    Orthonormal DCT-II basis, shape (n_mfcc, n_mels).
+    """
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    basis = np.cos(np.pi / n_mels * (n + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    basis[0] *= 1.0 / np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+def warm_tables(sample_rates=(8000, 16000, 22050, 44100, 48000)):
+    """
+    Computes the cached windows, frequency grids, mel filterbanks and DCT basis
+    for the common sample rates. Called before forking server workers so the
+    tables live in memory shared copy-on-write instead of once per worker.
+    """
+    tables = [_hann_window(N_FFT), _hann_window(CHEAP_N_FFT), _dct_matrix(N_MFCC, N_MELS)]
+    for sr in sample_rates:
+        tables += [_fft_frequencies(sr, N_FFT), _fft_frequencies(sr, CHEAP_N_FFT), mel_filterbank(sr)]
+    for table in tables:
+        # shared between workers: nobody may write to them
+        table.setflags(write=False)
+    return sum(table.nbytes for table in tables)
+
+def _frame_features(frames, sr: int):
+    """
+    Per-frame features for a block of frames, from a single batched rfft.
+    """
+    # Time-domain per-frame statistics (read straight from the strided view)
+    frame_rms = np.sqrt(np.einsum("ij,ij->i", frames, frames, dtype=np.float32) / frames.shape[1])
+    signs = np.signbit(frames)
+    frame_zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1).astype(np.float32) / (frames.shape[1] - 1)
+    
+    # One spectrum for everything else
+    magnitude = np.abs(np.fft.rfft(frames * _hann_window(frames.shape[1]), axis=1)).astype(np.float32, copy=False)
+    power = np.square(magnitude)
+    freqs = _fft_frequencies(sr, frames.shape[1])
+    
+    mag_sum = magnitude.sum(axis=1)
+    centroid = np.divide(magnitude @ freqs, mag_sum, out=np.zeros_like(mag_sum), where=mag_sum > 0)
+    
+    cumulative = np.cumsum(power, axis=1)
+    threshold = ROLLOFF_PERCENT * cumulative[:, -1:]
+    rolloff = freqs[np.minimum((cumulative < threshold).sum(axis=1), len(freqs) - 1)]
+    
+    log_power = np.log(power + 1e-10)
+    flatness = np.exp(log_power.mean(axis=1)) / (power.mean(axis=1) + 1e-10)
+    
+    mel = power @ mel_filterbank(sr, frames.shape[1]).T
+    log_mel = 10.0 * np.log10(mel + 1e-10)
+    mfcc = log_mel @ _dct_matrix(N_MFCC, mel.shape[1]).T
+    return {
+        "rms": frame_rms,
+        "zero_crossing_rate": frame_zcr,
+        "spectral_centroid": centroid,
+        "spectral_rolloff": rolloff,
+        "spectral_flatness": flatness.astype(np.float32, copy=False),
+        "mel_spectrogram": log_mel.astype(np.float32, copy=False),
+        "mfcc": mfcc.astype(np.float32, copy=False),
+    }
+
+def _signal_stats(y, chunk: int = 1 << 16):
+    """
+    Whole-signal sum of squares and zero-crossing count in chunks, without
+    clip-sized temporaries.
+    """
+    sum_sq = 0.0
+    crossings = 0
+    for start in range(0, len(y), chunk):
+        # one sample of overlap so crossings at chunk boundaries are counted
+        segment = y[start:start + chunk + 1]
+        body = segment[:chunk]
+        sum_sq += float(np.dot(body, body))
+        signs = np.signbit(segment)
+        crossings += int(np.count_nonzero(signs[1:] != signs[:-1]))
+    return sum_sq, crossings
+
+# Landmark fingerprint: spectral peaks of the audio resampled to a fixed rate,
+# so the same recording fingerprints alike whatever its sample rate or codec.
+FINGERPRINT_SR = 8000
+FINGERPRINT_N_FFT = 512
+FINGERPRINT_HOP = 256
+# frames are cut every HOP / PHASES samples and split into PHASES interleaved
+# grids, so a copy trimmed by a fraction of a hop still lines up with one of them
+FINGERPRINT_PHASES = 4
+FINGERPRINT_MIN_BIN = 13   # ~200 Hz
+FINGERPRINT_MAX_BIN = 244  # ~3.8 kHz
+FINGERPRINT_PEAK_FRAMES = 3
+FINGERPRINT_PEAK_BINS = 6
+FINGERPRINT_PEAKS_PER_SECOND = 10
+FINGERPRINT_FAN_OUT = 5
+FINGERPRINT_MAX_DT = 63
+FINGERPRINT_SECONDS = float(os.environ.get("VOICE_FINGERPRINT_SECONDS", "15"))
+
+class LandmarkFingerprinter:
+    """
+    Incremental spectral-peak fingerprint of the first FINGERPRINT_SECONDS of a
+    signal. ``update`` takes the same blocks as FeatureAccumulator; ``finalize``
+    picks the local maxima of each grid's log spectrogram, keeps the strongest
+    few per second and combines every peak with two of the next
+    FINGERPRINT_FAN_OUT ones. Each triple (anchor bin, the other two bins
+    relative to it, their frame distances) is hashed to 32 bits and kept
+    with the anchor's frame index.
+    """
+    def __init__(self, sr: int, max_seconds: float = FINGERPRINT_SECONDS):
+        self.resampler = StreamResampler(sr, FINGERPRINT_SR)
+        self.step = FINGERPRINT_HOP // FINGERPRINT_PHASES
+        self.budget = int(max_seconds * FINGERPRINT_SR) if max_seconds else None
+        self.n_samples = 0
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._spectra = []
+
+    def update(self, block):
+        if self.budget is not None and self.n_samples >= self.budget:
+            return
+        if self.budget is not None:
+            # only the input that can still reach the budget; the margin covers
+            # the samples the filter and the interpolation hold back
+            block = block[:int(np.ceil((self.budget - self.n_samples) * self.resampler.step)) + 64]
+        block = self.resampler.process(block)
+        if self.budget is not None:
+            block = block[:self.budget - self.n_samples]
+        self.n_samples += block.size
+        buf = np.concatenate([self._tail, block]) if self._tail.size else block
+        if buf.size < FINGERPRINT_N_FFT:
+            self._tail = np.array(buf, copy=True)
+            return
+        frames = frame_signal(buf, FINGERPRINT_N_FFT, self.step)
+        spectrum = np.abs(np.fft.rfft(frames * _hann_window(FINGERPRINT_N_FFT), axis=1))
+        spectrum = spectrum[:, FINGERPRINT_MIN_BIN:FINGERPRINT_MAX_BIN]
+        # dB, kept in half precision: only peak positions matter
+        self._spectra.append((20.0 * np.log10(spectrum + 1e-6)).astype(np.float16))
+        self._tail = np.array(buf[len(frames) * self.step:], copy=True)
+
+    def finalize(self):
+        """
+        Returns {"hashes": uint32, "times": uint16, "anchors": int}. The first
+        ``anchors`` landmarks come from the grid starting at the first sample,
+        strongest first (the ones worth storing); the rest are the other
+        grids' (worth looking up).
+        """
+        hashes, times = [], []
+        anchors = 0
+        if self._spectra:
+            spectra = np.concatenate(self._spectra).astype(np.float32)
+            seconds = self.n_samples / FINGERPRINT_SR
+            for phase in range(FINGERPRINT_PHASES):
+                h, t = _landmarks(spectra[phase::FINGERPRINT_PHASES], seconds)
+                hashes.append(h)
+                times.append(t)
+                if phase == 0:
+                    anchors = len(h)
+        return {
+            "hashes": np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint32),
+            "times": np.concatenate(times) if times else np.zeros(0, dtype=np.uint16),
+            "anchors": anchors,
+        }
+
+def _landmarks(spectrogram, seconds: float):
+    """
+    Peak triples of one (n_frames, n_bins) dB spectrogram, strongest first.
+    """
+    if not len(spectrogram):
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16)
+    # a point is a peak if nothing in its neighbourhood is louder
+    neighbourhood = _running_max(_running_max(spectrogram, FINGERPRINT_PEAK_FRAMES, 0), FINGERPRINT_PEAK_BINS, 1)
+    # row-major: peaks come out ordered by frame
+    frame, bin_ = np.nonzero((spectrogram == neighbourhood) & (spectrogram > spectrogram.mean()))
+    strength = spectrogram[frame, bin_]
+    keep = int(np.ceil(FINGERPRINT_PEAKS_PER_SECOND * seconds))
+    if len(frame) > keep:
+        strongest = np.sort(np.argsort(-strength, kind="stable")[:keep])
+        frame, bin_, strength = frame[strongest], bin_[strongest], strength[strongest]
+    frame = frame.astype(np.int64)
+    bin_ = bin_.astype(np.int64)
+
+    triples = []
+    for j in range(1, FINGERPRINT_FAN_OUT):
+        for k in range(j + 1, FINGERPRINT_FAN_OUT + 1):
+            anchor = np.arange(max(len(frame) - k, 0))
+            dt1 = frame[anchor + j] - frame[anchor]
+            dt2 = frame[anchor + k] - frame[anchor]
+            valid = (dt1 > 0) & (dt2 > dt1) & (dt2 <= FINGERPRINT_MAX_DT)
+            triples.append((anchor[valid], j, k, dt1[valid], dt2[valid]))
+    anchor = np.concatenate([t[0] for t in triples])
+    second = np.concatenate([t[0] + t[1] for t in triples])
+    third = np.concatenate([t[0] + t[2] for t in triples])
+    dt1 = np.concatenate([t[3] for t in triples])
+    dt2 = np.concatenate([t[4] for t in triples])
+    order = np.argsort(-(strength[anchor] + strength[second] + strength[third]), kind="stable")
+    anchor, second, third, dt1, dt2 = anchor[order], second[order], third[order], dt1[order], dt2[order]
+    # 8 + 9 + 9 + 6 + 6 bits, mixed down to 32 (multiplicative hashing)
+    packed = (bin_[anchor] | (bin_[second] - bin_[anchor] + 256) << 8 | (bin_[third] - bin_[anchor] + 256) << 17
+              | dt1 << 26 | dt2 << 32).astype(np.uint64)
+    hashes = ((packed * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)).astype(np.uint32)
+    return hashes, frame[anchor].astype(np.uint16)
+
+def _running_max(x, radius: int, axis: int):
+    """
+    Maximum over x[i - radius : i + radius + 1] along ``axis`` (edges padded
+    with -inf), as 2 * radius shifted np.maximum passes.
+    """
+    out = x.copy()
+    n = x.shape[axis]
+    for shift in range(1, min(radius, n - 1) + 1):
+        ahead = [slice(None)] * x.ndim
+        behind = [slice(None)] * x.ndim
+        ahead[axis], behind[axis] = slice(shift, None), slice(None, n - shift)
+        np.maximum(out[tuple(behind)], x[tuple(ahead)], out=out[tuple(behind)])
+        np.maximum(out[tuple(ahead)], x[tuple(behind)], out=out[tuple(ahead)])
+    return out
+
+class FeatureAccumulator:
+    """
+    Incremental version of ``extract_features``: feed consecutive blocks of mono
+    float32 samples with ``update`` and call ``finalize`` once. Frames are cut
+    exactly as they would be from the concatenated signal; only the samples of
+    the next incomplete frame are carried between blocks.
+    
+    With ``fingerprint`` the blocks also feed a LandmarkFingerprinter and the
+    result has a "fingerprint" entry.
+    """
+    def __init__(self, sr: int, fingerprint: bool = False):
+        self.sr = int(sr)
+        self.fingerprinter = LandmarkFingerprinter(self.sr) if fingerprint and self.sr else None
+        self.n_samples = 0
+        self._sum_sq = 0.0
+        self._crossings = 0
+        self._last_sign = None
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._blocks = []
+
+    def update(self, block):
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        if not block.size:
+            return
+        sum_sq, crossings = _signal_stats(block)
+        self._sum_sq += sum_sq
+        self._crossings += crossings
+        first_sign = bool(np.signbit(block[0]))
+        if self._last_sign is not None and first_sign != self._last_sign:
+            self._crossings += 1
+        self._last_sign = bool(np.signbit(block[-1]))
+        self.n_samples += block.size
+        if self.fingerprinter is not None:
+            self.fingerprinter.update(block)
+        
+        # Frame the carried tail + new samples (no copy when nothing is carried)
+        buf = np.concatenate([self._tail, block]) if self._tail.size else block
+        if buf.size < N_FFT:
+            self._tail = np.array(buf, copy=True)
+            return
+        frames = frame_signal(buf)
+        for i in range(0, len(frames), FRAME_BLOCK):
+            self._blocks.append(_frame_features(frames[i:i + FRAME_BLOCK], self.sr))
+        self._tail = np.array(buf[len(frames) * HOP_LENGTH:], copy=True)
+
+    def finalize(self):
+        duration = float(self.n_samples / self.sr) if self.sr else 0.0
+        if not self.n_samples or not self.sr:
+            features = _empty_features(duration)
+            features["sample_rate"] = self.sr
+            if self.fingerprinter is not None:
+                features["fingerprint"] = self.fingerprinter.finalize()
+            return features
+        if not self._blocks:
+            # Shorter than one frame: analyse it zero-padded, like extract_features
+            self._blocks.append(_frame_features(frame_signal(self._tail), self.sr))
+        
+        per_frame = {}
+        for name in self._blocks[0]:
+            per_frame[name] = np.concatenate([b[name] for b in self._blocks], axis=0)
+        # (n_frames, n_bands) -> (n_bands, n_frames), the usual spectrogram layout
+        per_frame["mel_spectrogram"] = np.ascontiguousarray(per_frame["mel_spectrogram"].T)
+        per_frame["mfcc"] = np.ascontiguousarray(per_frame["mfcc"].T)
+        
+        features = {
+            "rms": float(np.sqrt(self._sum_sq / self.n_samples)),
+            "zero_crossing_rate": float(self._crossings / max(self.n_samples - 1, 1)),
+            "spectral_centroid_mean": float(per_frame["spectral_centroid"].mean()),
+            "spectral_rolloff_mean": float(per_frame["spectral_rolloff"].mean()),
+            "spectral_flatness_mean": float(per_frame["spectral_flatness"].mean()),
+            "duration": duration,
+            "sample_rate": self.sr,
+            "mfcc_mean": per_frame["mfcc"].mean(axis=1),
+            "frames": per_frame
+        }
+        if self.fingerprinter is not None:
+            features["fingerprint"] = self.fingerprinter.finalize()
+        return features
+
+def extract_features(y, sr, vad: bool = False, fingerprint: bool = False):
     """
     Extracts features from the audio signal.
     For a real model, this would match the training preprocessing (e.g., Mel-spectrogram).
-    Here we extract some basic features for demonstration/heuristic use.
+    
+    All spectral features come from one framed STFT over the full clip
+    (N_FFT-sample Hann frames every HOP_LENGTH samples), transformed in blocks of
+    FRAME_BLOCK frames. Returns summary floats plus float32 per-frame arrays under
+    "frames" (mel_spectrogram and mfcc are shaped (n_bands, n_frames)).
+    
+    With ``vad`` silence is trimmed first (``trim_silence``) and only the speech
+    is analysed; "speech_duration" is then the analysed length (0.0 when no
+    speech was found and the whole clip was analysed) and "duration" stays the
+    full clip length.
+    
+    With ``fingerprint`` the result also has a "fingerprint" entry (see
+    ``LandmarkFingerprinter``), computed from the same analysed samples.
     """
-    # Basic feature set implemented using numpy
     y = np.asarray(y, dtype=np.float32)
+    if y.ndim > 1:
+        y = y.mean(axis=1, dtype=np.float32)
     duration = float(len(y) / sr) if sr else 0.0
-    # RMS energy
-    rms = float(np.sqrt(np.mean(y ** 2))) if y.size else 0.0
-    # Zero crossing rate
-    zcr = float(np.mean(np.abs(np.diff(np.sign(y)))) / 2.0) if y.size else 0.0
-    # Spectral centroid (simple magnitude spectrum centroid)
-    if y.size:
-        # Use a window to avoid edge artifacts
-        win = min(len(y), 2048)
-        segment = y[:win]
-        window = np.hanning(win)
-        segment = segment * window
-        spectrum = np.abs(np.fft.rfft(segment))
-        freqs = np.fft.rfftfreq(win, d=1.0 / sr) if sr else np.arange(len(spectrum))
-        if spectrum.sum() > 0:
-            centroid = float((freqs * spectrum).sum() / spectrum.sum())
-        else:
-            centroid = 0.0
-    else:
-        centroid = 0.0
+    speech_found = False
+    if vad and sr:
+        y, speech_found = trim_silence(y, sr)
+    accumulator = FeatureAccumulator(sr or 0, fingerprint)
+    if sr:
+        accumulator.update(y)
+    features = accumulator.finalize()
+    features["duration"] = duration
+    if vad:
+        features["speech_duration"] = float(len(y) / sr) if speech_found else 0.0
+    return features
+
+# Cheap first-stage features: short frames on a sparse grid, no mel / MFCC
+CHEAP_N_FFT = 512
+CHEAP_HOP = 4 * CHEAP_N_FFT
+
+def cheap_features(y, sr, vad: bool = False):
+    """
+    Inexpensive subset of ``extract_features`` for the first cascade stage:
+    "rms" and "zero_crossing_rate" over the whole signal (one pass, no STFT) and
+    "spectral_centroid_mean" from CHEAP_N_FFT-sample frames every CHEAP_HOP
+    samples, i.e. a small fraction of the full spectrogram work. "duration" and
+    (with ``vad``) "speech_duration" follow ``extract_features``.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if y.ndim > 1:
+        y = y.mean(axis=1, dtype=np.float32)
+    duration = float(len(y) / sr) if sr else 0.0
+    speech_found = False
+    if vad and sr:
+        y, speech_found = trim_silence(y, sr)
+    features = {"rms": 0.0, "zero_crossing_rate": 0.0, "spectral_centroid_mean": 0.0, "duration": duration}
+    if vad:
+        features["speech_duration"] = float(len(y) / sr) if speech_found else 0.0
+    if not len(y) or not sr:
+        return features
+    
+    sum_sq, crossings = _signal_stats(y)
+    frames = frame_signal(y, CHEAP_N_FFT, CHEAP_HOP)
+    freqs = _fft_frequencies(sr, CHEAP_N_FFT)
+    centroid_sum = 0.0
+    for i in range(0, len(frames), FRAME_BLOCK):
+        block = frames[i:i + FRAME_BLOCK]
+        magnitude = np.abs(np.fft.rfft(block * _hann_window(CHEAP_N_FFT), axis=1)).astype(np.float32, copy=False)
+        mag_sum = magnitude.sum(axis=1)
+        centroid_sum += float(np.divide(magnitude @ freqs, mag_sum, out=np.zeros_like(mag_sum), where=mag_sum > 0).sum())
+    features["rms"] = float(np.sqrt(sum_sq / len(y)))
+    features["zero_crossing_rate"] = float(crossings / max(len(y) - 1, 1))
+    features["spectral_centroid_mean"] = centroid_sum / len(frames)
+    return features
+
+def _empty_features(duration: float = 0.0):
     return {
-        "rms": rms,
-        "zero_crossing_rate": zcr,
-        "spectral_centroid_mean": centroid,
-        "duration": duration
+        "rms": 0.0,
+        "zero_crossing_rate": 0.0,
+        "spectral_centroid_mean": 0.0,
+        "spectral_rolloff_mean": 0.0,
+        "spectral_flatness_mean": 0.0,
+        "duration": duration,
+        "mfcc_mean": np.zeros(N_MFCC, dtype=np.float32),
+        "frames": {
+            "rms": np.zeros(0, dtype=np.float32),
+            "zero_crossing_rate": np.zeros(0, dtype=np.float32),
+            "spectral_centroid": np.zeros(0, dtype=np.float32),
+            "spectral_rolloff": np.zeros(0, dtype=np.float32),
+            "spectral_flatness": np.zeros(0, dtype=np.float32),
+            "mel_spectrogram": np.zeros((N_MELS, 0), dtype=np.float32),
+            "mfcc": np.zeros((N_MFCC, 0), dtype=np.float32),
+        }
     }
+
+# Segment mode: overlapping analysis windows over the per-frame features
+SEGMENT_SECONDS = float(os.environ.get("VOICE_SEGMENT_SECONDS", "4.0"))
+SEGMENT_HOP_SECONDS = float(os.environ.get("VOICE_SEGMENT_HOP", "2.0"))
+
+def segment_features(features: dict, window_seconds: float = SEGMENT_SECONDS, hop_seconds: float = SEGMENT_HOP_SECONDS):
+    """
+    Summary features for overlapping windows of ``window_seconds`` every
+    ``hop_seconds``, computed from the per-frame arrays of ``extract_features``
+    (no second pass over the audio). Window means come from one cumulative sum
+    per feature, so the cost is linear in the number of frames.
+    
+    Returns a dict of arrays with one row per window: "start" / "end" (seconds
+    in the analysed audio), the scalar summary features ("rms", ...) and
+    "mfcc_mean" (n_windows, N_MFCC). A clip shorter than one window is a single
+    window; the last window is aligned to the end of the clip.
+    """
+    per_frame = features["frames"]
+    sr = features.get("sample_rate") or 0
+    n_frames = len(per_frame["rms"])
+    if not n_frames or not sr:
+        empty = np.zeros(0, dtype=np.float32)
+        return {
+            "start": empty, "end": empty, "rms": empty, "zero_crossing_rate": empty,
+            "spectral_centroid_mean": empty, "spectral_rolloff_mean": empty, "spectral_flatness_mean": empty,
+            "mfcc_mean": np.zeros((0, N_MFCC), dtype=np.float32),
+        }
+    frame_rate = sr / HOP_LENGTH
+    window = min(max(1, int(round(window_seconds * frame_rate))), n_frames)
+    hop = max(1, int(round(hop_seconds * frame_rate)))
+    starts = np.arange(0, n_frames - window + 1, hop)
+    if starts[-1] + window < n_frames:
+        starts = np.append(starts, n_frames - window)
+    ends = starts + window
+    
+    def window_mean(values):
+        cumulative = np.cumsum(values, axis=0, dtype=np.float64)
+        cumulative = np.concatenate([np.zeros((1,) + cumulative.shape[1:]), cumulative])
+        return ((cumulative[ends] - cumulative[starts]) / window).astype(np.float32)
+    
+    analysed = features.get("speech_duration") or features.get("duration", 0.0)
+    return {
+        "start": (starts * HOP_LENGTH / sr).astype(np.float32),
+        "end": np.minimum(((ends - 1) * HOP_LENGTH + N_FFT) / sr, max(analysed, 0.0)).astype(np.float32),
+        "rms": np.sqrt(window_mean(np.square(per_frame["rms"]))),
+        "zero_crossing_rate": window_mean(per_frame["zero_crossing_rate"]),
+        "spectral_centroid_mean": window_mean(per_frame["spectral_centroid"]),
+        "spectral_rolloff_mean": window_mean(per_frame["spectral_rolloff"]),
+        "spectral_flatness_mean": window_mean(per_frame["spectral_flatness"]),
+        "mfcc_mean": window_mean(per_frame["mfcc"].T),
+    }
+
+# Live mode: summary features of the most recent window of a signal that is
+# still arriving. Per-frame rows go into a fixed-size ring with running sums.
+# (per-frame name, summary name) of the window means
+_WINDOW_SCALARS = (
+    ("zero_crossing_rate", "zero_crossing_rate"),
+    ("spectral_centroid", "spectral_centroid_mean"),
+    ("spectral_rolloff", "spectral_rolloff_mean"),
+    ("spectral_flatness", "spectral_flatness_mean"),
+)
+
+class SlidingFeatureWindow:
+    """
+    Summary features over the last ``window_seconds`` of a signal fed block by
+    block with ``update`` (mono float32 at ``sr``). Frames are cut as by
+    ``FeatureAccumulator``, but each frame's features become one row of a ring
+    of ``capacity`` rows and the window sums are updated by adding the new rows
+    and subtracting the ones they overwrite, so neither the cost of an update
+    nor the memory depends on how long the stream has been running. Frames
+    that would be overwritten within the same block are not analysed at all.
+    
+    ``features`` returns the window in the layout of one ``segment_features``
+    window ("rms" is the root mean square of the frame RMS values).
+    """
+    def __init__(self, sr: int, window_seconds: float):
+        self.sr = int(sr)
+        self.capacity = max(1, int(round(window_seconds * self.sr / HOP_LENGTH)))
+        # columns: squared frame RMS, the _WINDOW_SCALARS, the MFCCs
+        self._rows = np.zeros((self.capacity, 1 + len(_WINDOW_SCALARS) + N_MFCC), dtype=np.float64)
+        self._sums = np.zeros(self._rows.shape[1], dtype=np.float64)
+        self._head = 0
+        self._since_refresh = 0
+        self.count = 0
+        # frames analysed since the start of the stream
+        self.frames = 0
+        self._tail = np.zeros(0, dtype=np.float32)
+
+    def update(self, block):
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        if not block.size:
+            return
+        buf = np.concatenate([self._tail, block]) if self._tail.size else block
+        if buf.size < N_FFT:
+            self._tail = np.array(buf, copy=True)
+            return
+        frames = frame_signal(buf)
+        self._tail = np.array(buf[len(frames) * HOP_LENGTH:], copy=True)
+        skipped = max(0, len(frames) - self.capacity)
+        self.frames += skipped
+        for i in range(skipped, len(frames), FRAME_BLOCK):
+            block_features = _frame_features(frames[i:i + FRAME_BLOCK], self.sr)
+            rows = np.column_stack(
+                [np.square(block_features["rms"])]
+                + [block_features[name] for name, _ in _WINDOW_SCALARS]
+                + [block_features["mfcc"]]
+            )
+            self._push(rows)
+
+    def _push(self, rows):
+        n = len(rows)
+        slots = (self._head + np.arange(n)) % self.capacity
+        if self.count == self.capacity:
+            self._sums -= self._rows[slots].sum(axis=0)
+        elif self.count + n > self.capacity:
+            overwritten = slots[:self.count + n - self.capacity]
+            self._sums -= self._rows[overwritten].sum(axis=0)
+        self._rows[slots] = rows
+        self._sums += rows.sum(axis=0)
+        self._head = (self._head + n) % self.capacity
+        self.count = min(self.capacity, self.count + n)
+        self.frames += n
+        self._since_refresh += n
+        if self._since_refresh >= self.capacity:
+            # re-sum once per window so rounding errors do not build up
+            self._sums = self._rows[:self.count].sum(axis=0)
+            self._since_refresh = 0
+
+    @property
+    def start(self):
+        """Start of the window in seconds since the start of the stream."""
+        return (self.frames - self.count) * HOP_LENGTH / self.sr
+
+    @property
+    def end(self):
+        """End of the last analysed frame in seconds since the start of the stream."""
+        return ((self.frames - 1) * HOP_LENGTH + N_FFT) / self.sr if self.frames else 0.0
+
+    def features(self):
+        if not self.count:
+            features = _empty_features()
+            del features["frames"]
+            return features
+        means = self._sums / self.count
+        features = {"rms": float(np.sqrt(max(means[0], 0.0)))}
+        for i, (_, name) in enumerate(_WINDOW_SCALARS):
+            features[name] = float(means[1 + i])
+        features["mfcc_mean"] = means[1 + len(_WINDOW_SCALARS):].astype(np.float32)
+        features["duration"] = self.end - self.start
+        features["sample_rate"] = self.sr
+        return features
+
+# Voice-activity detection. Frames are classified as speech by energy, with a
+# lower energy bar for noisy (high zero-crossing) frames such as fricatives.
+VAD_THRESHOLD_DB = float(os.environ.get("VOICE_VAD_THRESHOLD_DB", "-45"))
+VAD_WEAK_DB = 10.0
+VAD_ZCR = 0.25
+VAD_FRAME_SECONDS = 0.02
+VAD_PAD_SECONDS = float(os.environ.get("VOICE_VAD_PAD", "0.15"))
+VAD_MAX_GAP_SECONDS = float(os.environ.get("VOICE_VAD_MAX_GAP", "0.5"))
+
+def vad_frame_mask(frames, threshold_db: float = VAD_THRESHOLD_DB):
+    """
+    Speech / non-speech decision for each row of ``frames`` (n_frames, frame_length):
+    energy above ``threshold_db`` dBFS, or above ``threshold_db - VAD_WEAK_DB``
+    with a zero-crossing rate above VAD_ZCR.
+    """
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float32) / frames.shape[1]
+    energy_db = 10.0 * np.log10(energy + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(frames.shape[1] - 1, 1)
+    return (energy_db > threshold_db) | ((energy_db > threshold_db - VAD_WEAK_DB) & (zcr > VAD_ZCR))
+
+class VoiceActivityDetector:
+    """
+    Block-wise silence trimming. Feed consecutive mono float32 blocks to
+    ``process`` and call ``finish`` once; the concatenated outputs are the input
+    with leading and trailing silence removed (except ``pad_seconds`` around the
+    speech) and every internal gap longer than ``max_gap_seconds`` shortened to
+    that length. Memory is bounded by one block plus ``max_gap_seconds`` of audio.
+    """
+    def __init__(self, sr: int, threshold_db: float = VAD_THRESHOLD_DB,
+                 pad_seconds: float = VAD_PAD_SECONDS, max_gap_seconds: float = VAD_MAX_GAP_SECONDS):
+        self.sr = int(sr)
+        self.threshold_db = threshold_db
+        self.frame_length = max(1, int(round(self.sr * VAD_FRAME_SECONDS)))
+        self.pad = int(np.ceil(pad_seconds * self.sr / self.frame_length))
+        gap = max(int(np.ceil(max_gap_seconds * self.sr / self.frame_length)), 2 * self.pad)
+        # a long gap keeps its first gap_head and last gap_tail frames
+        self.gap_head = gap - gap // 2
+        self.gap_tail = gap // 2
+        self.input_samples = 0
+        self.output_samples = 0
+        self.speech_found = False
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._empty = np.zeros((0, self.frame_length), dtype=np.float32)
+        # silence since the last speech frame: its first frames, its last frames, its length
+        self._gap_start = self._empty
+        self._gap_end = self._empty
+        self._gap_frames = 0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self.input_samples += block.size
+        buf = np.concatenate([self._tail, block]) if self._tail.size else block
+        n_frames = len(buf) // self.frame_length
+        frames = buf[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+        self._tail = np.array(buf[n_frames * self.frame_length:], copy=True)
+        if not n_frames:
+            return np.zeros(0, dtype=np.float32)
+        
+        mask = vad_frame_mask(frames, self.threshold_db)
+        # run boundaries of consecutive speech / silence frames
+        edges = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+        starts = np.concatenate([[0], edges])
+        ends = np.concatenate([edges, [n_frames]])
+        out = []
+        for start, end in zip(starts, ends):
+            if mask[start]:
+                self._speech(frames[start:end], out)
+            else:
+                self._silence(frames[start:end])
+        return self._emit(out)
+
+    def finish(self):
+        """
+        Returns the audio kept after the last block: the trailing pad, or the
+        final partial frame when the clip ends in speech.
+        """
+        if not self.speech_found:
+            return np.zeros(0, dtype=np.float32)
+        if self._gap_frames:
+            return self._emit([self._gap_start[:self.pad]])
+        return self._emit([self._tail[None, :]])
+
+    @property
+    def speech_duration(self):
+        """
+        Seconds of audio kept so far.
+        """
+        return self.output_samples / self.sr if self.sr else 0.0
+
+    def _speech(self, run, out):
+        if self.speech_found:
+            # a gap between speech: all of it if short, else its head and tail
+            rest = min(self._gap_frames - len(self._gap_start), self.gap_tail)
+            out.append(self._gap_start)
+            if rest > 0:
+                out.append(self._gap_end[len(self._gap_end) - rest:])
+        else:
+            # leading silence: only the pre-roll before the first speech
+            out.append(self._gap_end[len(self._gap_end) - min(self.pad, len(self._gap_end)):])
+            self.speech_found = True
+        self._gap_start = self._gap_end = self._empty
+        self._gap_frames = 0
+        out.append(run)
+
+    def _silence(self, run):
+        self._gap_frames += len(run)
+        if self.speech_found and len(self._gap_start) < self.gap_head:
+            self._gap_start = np.concatenate([self._gap_start, run[:self.gap_head - len(self._gap_start)]])
+        keep = self.gap_tail if self.speech_found else self.pad
+        if keep:
+            self._gap_end = np.concatenate([self._gap_end, run[-keep:]])[-keep:]
+
+    def _emit(self, pieces):
+        pieces = [p for p in pieces if p.size]
+        if not pieces:
+            return np.zeros(0, dtype=np.float32)
+        out = np.concatenate([p.reshape(-1) for p in pieces])
+        self.output_samples += out.size
+        return out
+
+def trim_silence(y, sr: int, **options):
+    """
+    Removes leading / trailing silence and shortens long internal gaps of a mono
+    signal (see ``VoiceActivityDetector``). Returns (trimmed, speech_found); the
+    input is returned unchanged when no speech is found.
+    """
+    vad = VoiceActivityDetector(sr, **options)
+    kept = [vad.process(y), vad.finish()]
+    if not vad.speech_found:
+        return y, False
+    return np.concatenate(kept), True
+
+# Streaming decode defaults. Streaming mode never holds more than one block of
+# decoded audio plus the (capped) per-frame features in memory.
+STREAM_TARGET_SR = int(os.environ.get("VOICE_TARGET_SR", "16000"))
+STREAM_MAX_SECONDS = float(os.environ.get("VOICE_MAX_DURATION", "600"))
+STREAM_BLOCK_FRAMES = 1 << 16
+
+class StreamResampler:
+    """
+    Block-wise sample-rate converter: windowed-sinc low-pass (when downsampling)
+    followed by linear interpolation. Filter history and the fractional read
+    position carry over between blocks, so block boundaries are seamless.
+    """
+    def __init__(self, orig_sr: int, target_sr: int, taps: int = 63):
+        self.orig_sr = int(orig_sr)
+        self.target_sr = int(target_sr)
+        # input samples advanced per output sample
+        self.step = self.orig_sr / self.target_sr
+        self._filter = None
+        if self.target_sr < self.orig_sr:
+            cutoff = 0.95 * 0.5 * self.target_sr / self.orig_sr  # cycles per input sample
+            n = np.arange(taps) - (taps - 1) / 2.0
+            h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.hamming(taps)
+            self._filter = (h / h.sum()).astype(np.float32)
+            self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pos = 0.0
+
+    @property
+    def passthrough(self):
+        return self.orig_sr == self.target_sr
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        if self.passthrough or not block.size:
+            # an empty block would make the convolution swap its operands
+            return block
+        if self._filter is not None:
+            padded = np.concatenate([self._history, block])
+            self._history = padded[len(padded) - len(self._history):].copy()
+            block = np.convolve(padded, self._filter, mode="valid").astype(np.float32, copy=False)
+        buf = np.concatenate([self._pending, block]) if self._pending.size else block
+        # output sample k sits at input position pos + k * step; it needs buf[i + 1]
+        n_out = int(np.ceil((len(buf) - 1 - self._pos) / self.step)) if len(buf) - 1 > self._pos else 0
+        positions = self._pos + self.step * np.arange(n_out)
+        index = positions.astype(np.int64)
+        frac = (positions - index).astype(np.float32)
+        out = buf[index] * (1.0 - frac) + buf[np.minimum(index + 1, len(buf) - 1)] * frac
+        next_pos = self._pos + self.step * n_out
+        consumed = min(int(next_pos), len(buf))
+        self._pending = buf[consumed:].copy()
+        self._pos = next_pos - consumed
+        return out.astype(np.float32, copy=False)
+
+def iter_audio_blocks(source, target_sr: int = STREAM_TARGET_SR, max_seconds: float = STREAM_MAX_SECONDS,
+                      block_frames: int = STREAM_BLOCK_FRAMES):
+    """
+    Decodes ``source`` (bytes or a file path) block by block with
+    ``soundfile.blocks``, mixing down to mono and resampling to ``target_sr``
+    as blocks arrive. Stops once ``max_seconds`` of output audio have been
+    produced (0 / None disables the cap).
+    
+    Yields mono float32 blocks at ``target_sr`` (the native rate if None).
+    """
+    audio_file = source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    try:
+        sound = sf.SoundFile(audio_file)
+    except Exception as e:
+        raise ValueError(f"Unsupported or unreadable audio format: {str(e)}")
+    with sound:
+        resampler = StreamResampler(sound.samplerate, target_sr or sound.samplerate)
+        budget = int(max_seconds * resampler.target_sr) if max_seconds else None
+        for block in sound.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+            if block.shape[1] == 1:
+                mono = block[:, 0]
+            else:
+                mono = block.sum(axis=1, dtype=np.float32)
+                mono *= 1.0 / block.shape[1]
+            out = resampler.process(mono)
+            if budget is not None:
+                out = out[:budget]
+                budget -= len(out)
+            if out.size:
+                yield out
+            if budget is not None and budget <= 0:
+                break
+
+def stream_features(source, target_sr: int = STREAM_TARGET_SR, max_seconds: float = STREAM_MAX_SECONDS,
+                    vad: bool = False, fingerprint: bool = False):
+    """
+    Streaming equivalent of ``decode_audio_source`` + ``extract_features``:
+    decoded blocks go straight into a ``FeatureAccumulator``, so peak memory is
+    bounded by the block size and the analysed-duration cap, not the input length.
+    "duration" is the decoded (capped) duration; "source_duration" the full input length.
+    
+    With ``vad`` blocks pass through a ``VoiceActivityDetector`` first. Until the
+    first speech frame the raw blocks are also analysed, so a clip without any
+    speech falls back to its untrimmed features like ``extract_features``.
+    ``fingerprint`` is passed on to the accumulators.
+    """
+    audio_file = source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    try:
+        info = sf.info(audio_file)
+    except Exception as e:
+        raise ValueError(f"Unsupported or unreadable audio format: {str(e)}")
+    sr = target_sr or info.samplerate
+    accumulator = FeatureAccumulator(sr, fingerprint)
+    detector = VoiceActivityDetector(sr) if vad else None
+    fallback = FeatureAccumulator(sr, fingerprint) if vad else None
+    decoded = 0
+    for block in iter_audio_blocks(source, target_sr, max_seconds):
+        decoded += block.size
+        if detector is None:
+            accumulator.update(block)
+            continue
+        accumulator.update(detector.process(block))
+        if fallback is not None:
+            if detector.speech_found:
+                fallback = None
+            else:
+                fallback.update(block)
+    if detector is not None:
+        accumulator.update(detector.finish())
+        if not detector.speech_found:
+            accumulator = fallback
+    features = accumulator.finalize()
+    features["duration"] = float(decoded / sr)
+    features["source_duration"] = float(info.duration)
+    if detector is not None:
+        features["speech_duration"] = detector.speech_duration if detector.speech_found else 0.0
+    return features
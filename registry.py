@@ -0,0 +1,156 @@
+"""
+Per-language model registry.
+
+Requests carry a ``language``; the registry routes each one to the classifier
+configured for that language, falling back to the default model
+(VOICE_MODEL_PATH) for languages without one. Models are loaded on first use
+in each worker and kept under a memory budget: when loading another model
+would exceed it, the least recently used ones are unloaded. The default model
+is loaded up front and never evicted. A model's footprint is approximated by
+the size of its files on disk.
+
+Configuration (environment variables):
+    VOICE_LANGUAGE_MODELS  "language=path,..." e.g. "tamil=models/ta.onnx,hindi=models/hi.onnx"
+    VOICE_MODEL_MEMORY_MB  budget for resident models per worker, 0 means unlimited (default 0)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LANGUAGE_MODELS_ENV = "VOICE_LANGUAGE_MODELS"
+
+
+def parse_language_models(spec: str):
+    """
+    "Tamil=a.onnx, hindi=b.onnx" -> {"tamil": "a.onnx", "hindi": "b.onnx"}.
+    """
+    models = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        language, sep, path = entry.partition("=")
+        if not sep or not language.strip() or not path.strip():
+            raise ValueError(f"Invalid {LANGUAGE_MODELS_ENV} entry '{entry.strip()}', expected language=path")
+        models[normalize_language(language)] = path.strip()
+    return models
+
+
+def normalize_language(language: str):
+    return (language or "").strip().lower()
+
+
+def language_models_from_env():
+    return parse_language_models(os.environ.get(LANGUAGE_MODELS_ENV, ""))
+
+
+def resolve_model(language: str, default_path: str = None, language_paths: dict = None):
+    """
+    The model file serving ``language`` (the default model when it has none).
+    Needs no loaded model, so the web process can use it for cache keys.
+    """
+    return (language_paths or {}).get(normalize_language(language), default_path)
+
+
+class ModelRegistry:
+    def __init__(self, default_path: str = None, language_paths: dict = None, memory_budget: int = 0,
+                 cascade_model_path: str = None, cascade_band=(0.2, 0.8)):
+        """
+        Args:
+            default_path: model for languages without their own (None: simulation).
+            language_paths: normalized language -> model path.
+            memory_budget: bytes of model files kept resident, 0 for no limit.
+            cascade_model_path, cascade_band: passed to every VoiceClassifier.
+        """
+        self.default_path = default_path
+        self.language_paths = dict(language_paths or {})
+        self.memory_budget = memory_budget
+        self.cascade_model_path = cascade_model_path
+        self.cascade_band = cascade_band
+        # path -> VoiceClassifier, least recently used first
+        self._resident = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        # path -> lock held while that model loads, so a slow load blocks only
+        # the callers waiting for the same model
+        self._loading = {}
+
+    @classmethod
+    def from_env(cls, default_path: str = None, cascade_model_path: str = None, cascade_band=(0.2, 0.8)):
+        return cls(
+            default_path=default_path,
+            language_paths=language_models_from_env(),
+            memory_budget=int(float(os.environ.get("VOICE_MODEL_MEMORY_MB", "0")) * 1024 * 1024),
+            cascade_model_path=cascade_model_path,
+            cascade_band=cascade_band,
+        )
+
+    def get(self, language: str = None, timings: dict = None):
+        """
+        Returns the classifier for ``language``, loading it (and evicting least
+        recently used models to stay within the budget) on first use. A load
+        is recorded as "model_load" seconds into ``timings`` if given.
+        """
+        path = resolve_model(language, self.default_path, self.language_paths)
+        with self._lock:
+            classifier = self._cached(path)
+            if classifier is not None:
+                return classifier
+            guard = self._loading.setdefault(path, threading.Lock())
+        with guard:
+            with self._lock:
+                # loaded by the caller this one waited for
+                classifier = self._cached(path)
+            if classifier is not None:
+                return classifier
+            try:
+                return self._load(path, timings)
+            finally:
+                with self._lock:
+                    self._loading.pop(path, None)
+
+    def _cached(self, path):
+        classifier = self._resident.get(path)
+        if classifier is not None:
+            self._resident.move_to_end(path)
+        return classifier
+
+    def _load(self, path, timings: dict = None):
+        from model import VoiceClassifier
+        size = self._footprint(path)
+        with self._lock:
+            self._evict(size)
+        start = time.perf_counter()
+        classifier = VoiceClassifier(path, cascade_model_path=self.cascade_model_path, cascade_band=self.cascade_band)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._resident[path] = classifier
+            self._sizes[path] = size
+        if timings is not None:
+            timings["model_load"] = seconds
+        return classifier
+
+    def _evict(self, incoming: int):
+        if not self.memory_budget:
+            return
+        for path in list(self._resident):
+            if self.resident_bytes + incoming <= self.memory_budget:
+                break
+            if path == self.default_path:
+                continue
+            del self._resident[path]
+            print(f"Unloaded model {path or 'simulation'} to stay within the model memory budget")
+
+    def _footprint(self, path):
+        size = 0
+        for file in (path, self.cascade_model_path):
+            if file:
+                try:
+                    size += os.path.getsize(file)
+                except OSError:
+                    pass
+        return size
+
+    @property
+    def resident_bytes(self):
+        return sum(self._sizes[path] for path in self._resident)
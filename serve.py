@@ -0,0 +1,317 @@
+"""
+Production server: a pre-forking supervisor for ``main:app``.
+
+``python main.py`` runs one uvicorn process with auto-reload, which uses a
+single core. This runs several worker processes that share as much memory as
+possible:
+
+  * the parent imports the app and the pipeline modules (numpy, soundfile,
+    ONNX Runtime), computes the feature tables (windows, mel filterbanks,
+    DCT) and loads the weights of every ONNX model (``backends.share_weights``),
+    then calls ``gc.freeze()`` so the garbage collector does not touch, and
+    thereby copy, the inherited objects;
+  * it opens the listening socket once and forks the workers, which share all
+    of the above copy-on-write and each run their own event loop. Inference
+    sessions (ONNX Runtime owns thread pools that do not survive a fork) are
+    created inside each worker when its lifespan starts and run on the
+    inherited weight arrays: one copy of the weights for all workers.
+
+ONNX Runtime cannot prepack weights it does not own, which makes batches of
+several rows slower (about 3x for a 96 MB MLP at batch 8). With
+``--no-share-weights``, or without the ``onnx`` package, every worker builds
+its own prepacked copy of the weights instead and the parent only reads the
+model files ahead, which makes the workers' loads page-cache hits.
+
+Workers are recycled gracefully: after ``--max-requests`` requests (with jitter,
+so they do not all restart together) or when their memory exceeds
+``--max-memory-mb``, a worker asks the parent for a replacement, stops
+accepting connections and finishes the requests it has. ``SIGHUP`` recycles
+every worker one by one; ``SIGTERM`` / ``SIGINT`` shut down gracefully.
+
+    python serve.py --workers 4 --port 8000
+
+Each worker runs the pipeline on its own small thread pool, so the defaults
+below switch the execution engine to ``thread`` with one thread per worker.
+Linux / macOS only (needs ``fork``).
+
+Configuration (environment variables, overridden by the options):
+    VOICE_SERVE_WORKERS      worker processes (default: number of CPUs)
+    VOICE_MAX_REQUESTS       requests before a worker is recycled, 0 = never (default 0)
+    VOICE_MAX_WORKER_MB      worker RSS that triggers recycling, 0 = never (default 0)
+    VOICE_GRACEFUL_TIMEOUT   seconds a stopping worker may take to finish (default 30)
+    VOICE_SHARE_WEIGHTS      0 = every worker keeps its own copy of the ONNX model weights (default 1)
+"""
+import argparse
+import gc
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+
+
+def preload(share_weights: bool = True):
+    """
+    Imports and builds everything workers can share. Returns a short summary.
+    """
+    import backends
+    import main
+    import model  # noqa: F401
+    import preprocessing
+    table_bytes = preprocessing.warm_tables()
+    model_bytes = 0
+    for path in {main.engine.model_path, main.CASCADE_MODEL, *main.LANGUAGE_MODELS.values()}:
+        if path and os.path.exists(path):
+            if share_weights and path.lower().endswith(".onnx"):
+                try:
+                    model_bytes += backends.share_weights(path)
+                    continue
+                except ImportError:
+                    print("serve: onnx is not installed, each worker loads its own copy of the model weights")
+                    share_weights = False
+            # page cache only: the workers' loads read the file from memory
+            with open(path, "rb") as f:
+                model_bytes += len(f.read())
+    try:
+        # the inference runtime is imported inside the backend on first load
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        pass
+    return f"{table_bytes / 2**20:.1f} MiB of feature tables, {model_bytes / 2**20:.1f} MiB of models"
+
+
+def worker_rss_mb():
+    """
+    Resident set size of this process in MiB (Linux /proc; 0 elsewhere).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def run_worker(sock, args, notify_fd: int):
+    """
+    Body of a forked worker: serves the app on the inherited socket until it
+    is told to stop or decides to be recycled.
+    """
+    import asyncio
+    import uvicorn
+    import main
+
+    # drop the supervisor's handlers; uvicorn installs its own while serving
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    random.seed(os.getpid())
+    max_requests = None
+    if args.max_requests:
+        # jitter spreads the restarts of workers that started together
+        max_requests = args.max_requests + random.randint(0, max(1, args.max_requests // 10))
+
+    config = uvicorn.Config(main.app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_timeout,
+                            lifespan="on")
+    server = uvicorn.Server(config)
+    retired = False
+
+    def retire(reason: str):
+        nonlocal retired
+        if retired:
+            return
+        retired = True
+        print(f"[worker {os.getpid()}] recycling ({reason})")
+        # the parent starts the replacement while this worker drains
+        os.write(notify_fd, f"{os.getpid()}\n".encode())
+        server.should_exit = True
+
+    async def watch():
+        while not server.should_exit:
+            await asyncio.sleep(1.0)
+            if args.max_memory_mb and worker_rss_mb() > args.max_memory_mb:
+                retire(f"RSS above {args.max_memory_mb} MiB")
+            elif max_requests and server.server_state.total_requests >= max_requests:
+                retire(f"{max_requests} requests served")
+
+    async def serve():
+        watcher = asyncio.create_task(watch())
+        try:
+            await server.serve(sockets=[sock])
+        finally:
+            watcher.cancel()
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    def __init__(self, args, sock):
+        self.args = args
+        self.sock = sock
+        self.children = set()
+        self.retiring = set()
+        self.stopping = False
+        self.recycle_all = False
+        self.notify_r, self.notify_w = os.pipe()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(self.notify_r)
+                run_worker(self.sock, self.args, self.notify_w)
+            except BaseException as e:
+                print(f"[worker {os.getpid()}] crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+        return pid
+
+    def retire(self, pid: int):
+        if pid in self.children and pid not in self.retiring:
+            self.retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        for _ in range(self.args.workers):
+            self.spawn()
+        print(f"Serving on http://{self.args.host}:{self.args.port} with {self.args.workers} workers "
+              f"(supervisor {os.getpid()})")
+        while self.children:
+            if self.stopping:
+                self._stop_all()
+                break
+            if self.recycle_all:
+                self.recycle_all = False
+                self._rolling_restart()
+            self._read_notifications(timeout=0.5)
+            self._reap()
+        os.close(self.notify_r)
+        os.close(self.notify_w)
+
+    def _read_notifications(self, timeout: float):
+        try:
+            ready, _, _ = select.select([self.notify_r], [], [], timeout)
+        except InterruptedError:
+            return
+        if not ready:
+            return
+        for line in os.read(self.notify_r, 4096).decode().split():
+            pid = int(line)
+            if pid in self.children and not self.stopping:
+                # replace first, so capacity does not dip while the old worker drains
+                self.retiring.add(pid)
+                self.spawn()
+
+    def _reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif not self.stopping:
+                print(f"Worker {pid} exited unexpectedly (status {status}); starting a new one")
+                self.spawn()
+
+    def _rolling_restart(self):
+        for pid in list(self.children - self.retiring):
+            if self.stopping:
+                return
+            self.spawn()
+            self.retire(pid)
+            # wait for the old worker to go before recycling the next one
+            deadline = time.monotonic() + self.args.graceful_timeout + 5
+            while pid in self.children and time.monotonic() < deadline and not self.stopping:
+                self._read_notifications(timeout=0.2)
+                self._reap()
+
+    def _stop_all(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            print(f"Worker {pid} did not stop in time; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_hup(self, signum, frame):
+        self.recycle_all = True
+
+
+def bind(host: str, port: int):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API with pre-forked workers sharing preloaded memory.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("VOICE_SERVE_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--max-requests", type=int, default=int(os.environ.get("VOICE_MAX_REQUESTS", "0")),
+                        help="recycle a worker after about this many requests (0 = never)")
+    parser.add_argument("--max-memory-mb", type=float, default=float(os.environ.get("VOICE_MAX_WORKER_MB", "0")),
+                        help="recycle a worker whose RSS exceeds this (0 = never)")
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.environ.get("VOICE_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds a stopping worker may take to finish its requests")
+    parser.add_argument("--share-weights", action=argparse.BooleanOptionalAction,
+                        default=os.environ.get("VOICE_SHARE_WEIGHTS", "1") == "1",
+                        help="one copy of the ONNX model weights for all workers (default; slower batches)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve.py needs fork(); use uvicorn directly on this platform")
+
+    # one small in-process pool per worker instead of a process pool per worker
+    os.environ.setdefault("VOICE_EXECUTOR", "thread")
+    os.environ.setdefault("VOICE_WORKERS", "1")
+
+    start = time.perf_counter()
+    summary = preload(args.share_weights)
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded {summary} in {time.perf_counter() - start:.2f}s")
+
+    sock = bind(args.host, args.port)
+    Supervisor(args, sock).run()
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
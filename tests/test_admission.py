@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionMiddleware, Overloaded
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=8, queue_timeout=5)
+        await controller.acquire()
+        order = []
+
+        async def waiter(name):
+            await controller.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        assert controller.queued == 3
+        for _ in range(3):
+            controller.release()
+            await asyncio.sleep(0)
+            # handed over, never freed in between
+            assert controller.active == 1
+        await asyncio.gather(*tasks)
+        controller.release()
+        return order, controller.stats()
+
+    order, stats = run(scenario())
+    assert order == ["a", "b", "c"]
+    assert stats["active"] == 0 and stats["queued"] == 0 and stats["admitted"] == 4
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5, retry_after=3)
+        await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await controller.acquire()
+        controller.release()
+        await queued
+        return rejected.value, controller.stats()
+
+    rejected, stats = run(scenario())
+    assert rejected.reason == "queue_full" and rejected.retry_after == 3
+    assert stats["rejected"] == {"queue_full": 1, "queue_timeout": 0}
+    assert stats["active"] == 1
+
+
+def test_zero_queue_rejects_when_busy():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        async with controller.slot():
+            with pytest.raises(Overloaded):
+                async with controller.slot():
+                    pass
+        return controller.active
+
+    assert run(scenario()) == 0
+
+
+def test_queue_timeout_leaves_no_waiter_behind():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await controller.acquire()
+        with pytest.raises(Overloaded) as rejected:
+            await controller.acquire()
+        assert controller.queued == 0
+        controller.release()
+        return rejected.value.reason, controller.stats()
+
+    reason, stats = run(scenario())
+    assert reason == "queue_timeout"
+    assert stats["active"] == 0 and stats["rejected"]["queue_timeout"] == 1
+
+
+def test_cancelled_waiter_does_not_take_the_slot():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+        await controller.acquire()
+        cancelled = asyncio.create_task(controller.acquire())
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.wait_for(waiting, 1)
+        active = controller.active
+        controller.release()
+        return active, controller.active, controller.queued
+
+    assert run(scenario()) == (1, 0, 0)
+
+
+def call_middleware(middleware, path="/detect", headers=(), body=b""):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    run(middleware(scope, receive, send))
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    return start["status"], dict(start["headers"])
+
+
+async def ok_app(scope, receive, send):
+    await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_middleware_rejects_a_declared_oversized_body():
+    controller = AdmissionController(max_concurrent=1)
+    middleware = AdmissionMiddleware(ok_app, controller, {"/detect": 100})
+    status, _ = call_middleware(middleware, headers=[(b"content-length", b"101")])
+    assert status == 413
+    assert controller.admitted == 0
+    assert call_middleware(middleware, headers=[(b"content-length", b"100")], body=b"x" * 100)[0] == 200
+
+
+def test_middleware_answers_503_with_retry_after_when_busy():
+    async def busy():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, retry_after=7)
+        await controller.acquire()
+        return controller
+
+    controller = run(busy())
+    middleware = AdmissionMiddleware(ok_app, controller, {"/detect": None})
+    status, headers = call_middleware(middleware)
+    assert status == 503 and headers[b"retry-after"] == b"7"
+    # other routes are not admission controlled
+    assert call_middleware(middleware, path="/health")[0] == 200
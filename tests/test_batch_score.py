@@ -0,0 +1,46 @@
+import json
+
+import batch_score
+
+
+def test_completed_ids_missing_file(tmp_path):
+    assert batch_score.completed_ids(str(tmp_path / "results.jsonl")) == set()
+
+
+def test_completed_ids_truncates_a_partial_last_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    lines = [json.dumps({"id": "a", "classification": "Human"}), json.dumps({"id": 7})]
+    path.write_bytes(("\n".join(lines) + "\n").encode() + b'{"id": "b", "classif')
+    assert batch_score.completed_ids(str(path)) == {"a", "7"}
+    # appending continues on a clean line
+    assert path.read_bytes() == ("\n".join(lines) + "\n").encode()
+
+
+def test_completed_ids_partial_only_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(b'{"id": "a"')
+    assert batch_score.completed_ids(str(path)) == set()
+    assert path.read_bytes() == b""
+
+
+def test_completed_ids_skips_lines_without_an_id(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(b'{"id": "a"}\n\nnot json\n[1, 2]\n{"error": "x"}\n')
+    assert batch_score.completed_ids(str(path)) == {"a"}
+    assert path.read_bytes().endswith(b'{"error": "x"}\n')
+
+
+def test_iter_jsonl_ids_languages_and_invalid_lines(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "x", "audio_base64": "AAAA", "language": "Tamil"}),
+        "",
+        json.dumps({"audio_base64": "BBBB"}),
+        "{broken",
+        json.dumps({"language": "Hindi"}),
+    ]) + "\n", encoding="utf-8")
+    items = list(batch_score.iter_jsonl(str(path), "English"))
+    assert items[0] == ("x", ("base64", "AAAA"), "Tamil")
+    # ids default to the 1-based line number, blank lines included
+    assert items[1] == ("3", ("base64", "BBBB"), "English")
+    assert [(item_id, kind) for item_id, (kind, _), _ in items[2:]] == [("4", "invalid"), ("5", "invalid")]
@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pytest
+
+import executor
+from feature_store import FRAME_COLUMNS, INDEX_DTYPE, SUMMARY_WIDTH, FeatureStore
+from model import features_to_vector
+from preprocessing import extract_features
+
+
+@pytest.fixture(scope="module")
+def clips():
+    rng = np.random.default_rng(0)
+    clips = []
+    for i, seconds in enumerate((0.5, 1.2, 0.8, 2.0)):
+        y = (rng.standard_normal(int(16000 * seconds)) * 0.1).astype(np.float32)
+        clips.append((bytes([i]) * 16, extract_features(y, 16000, vad=True)))
+    return clips
+
+
+def assert_same(stored, features):
+    assert np.array_equal(features_to_vector(stored), features_to_vector(features))
+    assert stored["duration"] == pytest.approx(features["duration"])
+    for name in FRAME_COLUMNS:
+        assert np.array_equal(np.asarray(stored["frames"][name]), np.asarray(features["frames"][name], dtype=np.float32)), name
+
+
+def generation_file(path, name):
+    with open(os.path.join(path, "CURRENT"), "r", encoding="utf-8") as f:
+        return os.path.join(path, f.read().strip(), name)
+
+
+def test_append_get_round_trip(tmp_path, clips):
+    path = str(tmp_path / "store")
+    with FeatureStore(path, flush_every=3) as store:
+        for key, features in clips:
+            store.append(key, features, "Tamil")
+        # two clips are still buffered: get flushes them
+        assert_same(store.get(clips[3][0]), clips[3][1])
+    with FeatureStore(path) as store:
+        assert len(store) == len(clips)
+        for key, features in clips:
+            assert_same(store.get(key.hex()), features)
+        assert store.get(b"\xff" * 16) is None
+        keys, languages, summary = next(store.iter_batches(10))
+        assert keys == [key for key, _ in clips]
+        assert languages == ["Tamil"] * len(clips)
+        assert summary.shape == (len(clips), SUMMARY_WIDTH)
+
+
+def test_append_rejects_bad_keys_and_summary_only_features(tmp_path, clips):
+    with FeatureStore(str(tmp_path / "store")) as store:
+        with pytest.raises(ValueError):
+            store.append(b"short", clips[0][1])
+        summary_only = {name: value for name, value in clips[0][1].items() if name != "frames"}
+        with pytest.raises(ValueError):
+            store.append(clips[0][0], summary_only)
+
+
+def test_supersede_and_remove(tmp_path, clips):
+    path = str(tmp_path / "store")
+    with FeatureStore(path) as store:
+        for key, features in clips:
+            store.append(key, features, "English")
+        store.append(clips[0][0], clips[1][1], "Hindi")
+        assert store.remove(clips[2][0])
+        assert not store.remove(clips[2][0])
+        stats = store.stats()
+        assert (stats["clips"], stats["records"], stats["dead_records"]) == (3, 5, 2)
+    with FeatureStore(path) as store:
+        assert len(store) == 3
+        assert clips[2][0] not in store
+        assert_same(store.get(clips[0][0]), clips[1][1])
+        languages = dict(zip(*next(store.iter_batches(10))[:2]))
+        assert languages[clips[0][0]] == "Hindi"
+
+
+def test_partial_tail_is_cut_off_on_open(tmp_path, clips):
+    path = str(tmp_path / "store")
+    with FeatureStore(path) as store:
+        for key, features in clips[:2]:
+            store.append(key, features)
+    # an interrupted run: data without an index record, half an index record
+    with open(generation_file(path, "summary.f32"), "ab") as f:
+        f.write(b"\x00" * 100)
+    with open(generation_file(path, "frames.mfcc.f32"), "ab") as f:
+        f.write(b"\x00" * 50)
+    with open(generation_file(path, "index.bin"), "ab") as f:
+        f.write(b"\x01" * (INDEX_DTYPE.itemsize // 2))
+    with FeatureStore(path) as store:
+        assert len(store) == 2
+        assert os.path.getsize(generation_file(path, "summary.f32")) == 2 * 4 * SUMMARY_WIDTH
+        assert os.path.getsize(generation_file(path, "index.bin")) == 2 * INDEX_DTYPE.itemsize
+        assert os.path.getsize(generation_file(path, "frames.mfcc.f32")) == store.frame_count * 4 * FRAME_COLUMNS["mfcc"]
+        store.append(clips[2][0], clips[2][1])
+    with FeatureStore(path) as store:
+        assert len(store) == 3
+        for key, features in clips[:3]:
+            assert_same(store.get(key), features)
+
+
+def test_record_with_incomplete_data_is_dropped(tmp_path, clips):
+    path = str(tmp_path / "store")
+    with FeatureStore(path) as store:
+        for key, features in clips[:3]:
+            store.append(key, features)
+        frames = store.frame_count
+    # the last record's frames never reached the disk
+    mfcc = generation_file(path, "frames.mfcc.f32")
+    with open(mfcc, "r+b") as f:
+        f.truncate((frames - 1) * 4 * FRAME_COLUMNS["mfcc"])
+    with FeatureStore(path) as store:
+        assert len(store) == 2
+        assert clips[2][0] not in store
+        assert os.path.getsize(generation_file(path, "index.bin")) == 2 * INDEX_DTYPE.itemsize
+        assert_same(store.get(clips[1][0]), clips[1][1])
+
+
+def test_compact_keeps_live_records(tmp_path, clips):
+    path = str(tmp_path / "store")
+    with FeatureStore(path) as store:
+        for key, features in clips:
+            store.append(key, features, "Tamil")
+        store.append(clips[1][0], clips[0][1], "Malayalam")
+        store.remove(clips[3][0])
+        old = store.generation
+        assert store.compact() > 0
+        stats = store.stats()
+        assert stats["generation"] != old
+        assert (stats["clips"], stats["records"], stats["dead_records"]) == (3, 3, 0)
+        assert_same(store.get(clips[1][0]), clips[0][1])
+    assert sorted(name for name in os.listdir(path) if not name.startswith(".")) == ["CURRENT", stats["generation"]]
+    with FeatureStore(path) as store:
+        assert len(store) == 3
+        assert clips[3][0] not in store
+        for key, features in clips[:3]:
+            assert_same(store.get(key), clips[0][1] if key == clips[1][0] else features)
+
+
+def test_settings_mismatch(tmp_path, clips, monkeypatch):
+    path = str(tmp_path / "store")
+    with FeatureStore(path) as store:
+        store.append(*clips[0])
+    monkeypatch.setattr(executor, "VAD", not executor.VAD)
+    with pytest.raises(ValueError, match="vad"):
+        FeatureStore(path)
+    with FeatureStore(path, check_settings=False) as store:
+        assert len(store) == 1
+        # the store keeps the settings it was extracted with
+        assert store.stats()["settings"]["vad"] != executor.VAD
@@ -0,0 +1,160 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = jobs.JobStore(str(tmp_path / "jobs"), aging=0.0, max_attempts=2)
+    store.open()
+    yield store
+    store.close()
+
+
+def add(store, job_id, duration=None, age=0.0):
+    with open(store.audio_path(job_id), "wb") as f:
+        f.write(b"audio")
+    store.add(job_id, "English", "full", f"key-{job_id}", duration)
+    if age:
+        store._db.execute("UPDATE jobs SET created = created - ? WHERE id = ?", (age, job_id))
+
+
+def set_owner(store, job_id, owner):
+    store._db.execute("UPDATE jobs SET owner = ? WHERE id = ?", (owner, job_id))
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def audio_files(store):
+    return os.listdir(os.path.join(store.directory, "audio"))
+
+
+def test_claim_shortest_first_unknown_last(store):
+    add(store, "unknown")
+    add(store, "long", 60.0)
+    add(store, "short", 2.0)
+    add(store, "medium", 10.0)
+    assert [store.claim()["id"] for _ in range(4)] == ["short", "medium", "long", "unknown"]
+    assert store.claim() is None
+
+
+def test_claim_ties_go_to_the_oldest(store):
+    add(store, "newer", 5.0)
+    add(store, "older", 5.0, age=30)
+    assert store.claim()["id"] == "older"
+
+
+def test_aging_lets_a_long_wait_overtake(store):
+    store.aging = 0.1
+    # waited 1000s: 120 - 100 = 20 beats a fresh 30s clip, not a fresh 10s one
+    add(store, "waiting", 120.0, age=1000)
+    add(store, "fresh", 30.0)
+    add(store, "short", 10.0)
+    assert [store.claim()["id"] for _ in range(3)] == ["short", "waiting", "fresh"]
+
+
+def test_claim_marks_running(store):
+    add(store, "a", 1.0)
+    before = time.time()
+    job = store.claim()
+    assert job["id"] == "a"
+    job = store.get("a")
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["owner"] == store.owner
+    assert job["started"] >= before
+
+
+def test_complete_stores_json_and_removes_audio(store):
+    add(store, "ok", 1.0)
+    add(store, "bad", 1.0)
+    store.complete("ok", result={"classification": "Human", "confidence_score": 0.9})
+    store.complete("bad", error={"status": 400, "detail": "Unsupported audio"})
+    ok, bad = store.get("ok"), store.get("bad")
+    assert (ok["status"], ok["result"], ok["error"]) == ("done", {"classification": "Human", "confidence_score": 0.9}, None)
+    assert (bad["status"], bad["result"], bad["error"]) == ("failed", None, {"status": 400, "detail": "Unsupported audio"})
+    assert audio_files(store) == []
+    assert store.get("missing") is None
+
+
+def test_recover_requeues_own_and_dead_owners(store):
+    host = socket.gethostname()
+    for job_id in ("own", "dead", "alive", "remote"):
+        add(store, job_id, 1.0)
+        store.claim()
+    set_owner(store, "dead", f"{host}:{dead_pid()}")
+    set_owner(store, "alive", f"{host}:1")
+    set_owner(store, "remote", "otherhost:1")
+    assert store.recover() == 2
+    statuses = {job_id: store.get(job_id)["status"] for job_id in ("own", "dead", "alive", "remote")}
+    assert statuses == {"own": "queued", "dead": "queued", "alive": "running", "remote": "running"}
+    assert store.get("own")["owner"] is None
+
+
+def test_recover_fails_jobs_out_of_attempts(store):
+    add(store, "crashy", 1.0)
+    store.claim()
+    assert store.recover() == 1
+    store.claim()
+    # second start crashed as well: max_attempts is 2
+    assert store.recover() == 0
+    job = store.get("crashy")
+    assert job["status"] == "failed"
+    assert job["error"] == {"status": 500, "detail": "Job crashed its worker too often"}
+    assert audio_files(store) == []
+
+
+def test_release_does_not_count_the_attempt(store):
+    add(store, "a", 1.0)
+    add(store, "b", 2.0)
+    store.claim()
+    set_owner(store, "a", "otherhost:1")
+    store.claim()
+    store.release()
+    a, b = store.get("a"), store.get("b")
+    assert (a["status"], a["attempts"]) == ("running", 1)
+    assert (b["status"], b["attempts"], b["owner"]) == ("queued", 0, None)
+
+
+def test_purge_and_counts(store):
+    for job_id in ("old", "recent", "queued"):
+        add(store, job_id, 1.0)
+    store.complete("old", result={})
+    store.complete("recent", error={"status": 400, "detail": "x"})
+    store._db.execute("UPDATE jobs SET finished = finished - 100 WHERE id = 'old'")
+    assert store.counts() == {"queued": 1, "running": 0, "done": 1, "failed": 1}
+    store.purge(50)
+    assert store.get("old") is None
+    assert store.counts() == {"queued": 1, "running": 0, "done": 0, "failed": 1}
+
+
+def test_queue_survives_reopen(tmp_path):
+    directory = str(tmp_path / "jobs")
+    store = jobs.JobStore(directory)
+    assert not store.exists
+    store.open()
+    add(store, "a", 3.0)
+    add(store, "b", 1.0)
+    store.claim()
+    store.close()
+
+    reopened = jobs.JobStore(directory)
+    assert reopened.exists
+    reopened.open()
+    try:
+        assert reopened.counts()["queued"] == 1
+        # "b" was left running by a store with this PID
+        assert reopened.recover() == 1
+        assert [reopened.claim()["id"] for _ in range(2)] == ["b", "a"]
+    finally:
+        reopened.close()
@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import preprocessing
+
+# more than one DECODE_BLOCK, so the block-wise conversion is covered
+DECODE_FRAMES = preprocessing.DECODE_BLOCK + 1234
+
+
+def wav_bytes(samples, sr, subtype):
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sr, format="WAV", subtype=subtype)
+    return buffer.getvalue()
+
+
+def reference_mono(data):
+    # what libsndfile decodes, mixed down like _decode_soundfile
+    y, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    return y.mean(axis=1, dtype=np.float32), sr
+
+
+@pytest.mark.parametrize("subtype", ["PCM_U8", "PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE"])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_decode_wav_matches_libsndfile(subtype, channels):
+    rng = np.random.default_rng(0)
+    samples = (rng.uniform(-0.9, 0.9, (DECODE_FRAMES, channels))).astype(np.float32)
+    data = wav_bytes(samples, 22050, subtype)
+    y, sr = preprocessing._decode_wav(np.frombuffer(data, dtype=np.uint8))
+    expected, expected_sr = reference_mono(data)
+    assert sr == expected_sr == 22050
+    assert y.dtype == np.float32
+    np.testing.assert_allclose(y, expected, atol=1e-6)
+
+
+def test_decode_wav_24_bit_extremes():
+    # full-scale 24-bit samples: the sign must survive the widening to int32
+    pcm = np.array([0x7FFFFF, -0x800000, 1, -1, 0], dtype=np.int32)
+    raw = b"".join(int(v).to_bytes(3, "little", signed=True) for v in pcm)
+    header = (b"RIFF" + (36 + len(raw)).to_bytes(4, "little") + b"WAVE"
+              + b"fmt " + (16).to_bytes(4, "little")
+              + np.array([1, 1], "<u2").tobytes() + np.array([8000, 8000 * 3], "<u4").tobytes()
+              + np.array([3, 24], "<u2").tobytes()
+              + b"data" + len(raw).to_bytes(4, "little"))
+    y, sr = preprocessing._decode_wav(np.frombuffer(header + raw, dtype=np.uint8))
+    assert sr == 8000
+    np.testing.assert_allclose(y, pcm / 2.0 ** 23, atol=1e-7)
+
+
+def test_decode_wav_open_ended_data_chunk():
+    # streaming writers leave the data size at 0xFFFFFFFF: read to the end
+    samples = np.linspace(-0.5, 0.5, 100, dtype=np.float32)
+    data = bytearray(wav_bytes(samples, 16000, "PCM_16"))
+    data[40:44] = (0xFFFFFFFF).to_bytes(4, "little")
+    y, _ = preprocessing._decode_wav(np.frombuffer(bytes(data), dtype=np.uint8))
+    assert len(y) == 100
+
+
+def test_decode_wav_leaves_compressed_codecs_to_libsndfile():
+    data = wav_bytes(np.zeros(800, dtype=np.float32), 8000, "ULAW")
+    assert preprocessing._decode_wav(np.frombuffer(data, dtype=np.uint8)) is None
+    y, sr = preprocessing.decode_audio_bytes(data)
+    assert sr == 8000 and len(y) == 800
+
+
+def test_decode_wav_without_data_chunk():
+    data = wav_bytes(np.zeros(10, dtype=np.float32), 8000, "PCM_16")[:36]
+    with pytest.raises(ValueError):
+        preprocessing.decode_audio_bytes(data)
+
+
+def resample_in_blocks(y, orig_sr, target_sr, sizes):
+    resampler = preprocessing.StreamResampler(orig_sr, target_sr)
+    out, pos, i = [], 0, 0
+    while pos < len(y):
+        size = sizes[i % len(sizes)]
+        out.append(resampler.process(y[pos:pos + size]))
+        pos += size
+        i += 1
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize("orig_sr, target_sr", [(44100, 16000), (48000, 16000), (8000, 16000), (22050, 22050)])
+def test_stream_resampler_blocks_are_seamless(orig_sr, target_sr):
+    y = np.random.default_rng(1).standard_normal(orig_sr).astype(np.float32)
+    whole = preprocessing.StreamResampler(orig_sr, target_sr).process(y)
+    # block sizes below the filter length, odd sizes and empty blocks included
+    blocks = resample_in_blocks(y, orig_sr, target_sr, [1, 7, 0, 62, 1000, 4096, 3])
+    assert blocks.dtype == np.float32
+    np.testing.assert_allclose(blocks, whole, atol=1e-5)
+    assert abs(len(whole) - len(y) * target_sr / orig_sr) <= 2
+
+
+def test_stream_resampler_removes_content_above_the_new_nyquist():
+    sr = 48000
+    t = np.arange(sr) / sr
+    low, high = np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 12000 * t)
+    out_low = resample_in_blocks(low.astype(np.float32), sr, 16000, [4096])
+    out_high = resample_in_blocks(high.astype(np.float32), sr, 16000, [4096])
+    # past the filter's start-up
+    assert np.sqrt(np.mean(out_low[200:] ** 2)) > 0.6
+    assert np.sqrt(np.mean(out_high[200:] ** 2)) < 0.05
+
+
+def test_iter_audio_blocks_caps_the_output_duration():
+    samples = np.random.default_rng(2).uniform(-0.5, 0.5, (44100 * 3, 2)).astype(np.float32)
+    data = wav_bytes(samples, 44100, "FLOAT")
+    blocks = list(preprocessing.iter_audio_blocks(data, target_sr=16000, max_seconds=1.5, block_frames=1000))
+    assert sum(len(b) for b in blocks) == 24000
+    uncapped = np.concatenate(list(preprocessing.iter_audio_blocks(data, target_sr=16000, max_seconds=None)))
+    np.testing.assert_allclose(np.concatenate(blocks), uncapped[:24000], atol=1e-5)
@@ -0,0 +1,121 @@
+import base64
+import json
+import os
+
+import pytest
+
+from cache import audio_digest
+from uploads import AudioSpool, InvalidJson, JsonAudioReader, UploadTooLarge
+
+AUDIO = bytes(range(256)) * 5 + b"tail"
+
+
+def parse(body: bytes, chunk_size: int = None, **spool_options):
+    spool = AudioSpool(**spool_options)
+    reader = JsonAudioReader(spool)
+    try:
+        step = chunk_size or len(body) or 1
+        for start in range(0, len(body), step):
+            reader.feed(body[start:start + step])
+        members = reader.finish()
+        spool.finish()
+        source = spool.source
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                source = f.read()
+        assert spool.digest() == audio_digest(source)
+        return members, source, reader.found
+    finally:
+        spool.close()
+
+
+def body(**members):
+    return json.dumps(members).encode()
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 2, 3, 5, 7, 64])
+def test_split_anywhere(chunk_size):
+    data = body(language="Tamil", audio_base64=base64.b64encode(AUDIO).decode(), mode="segments",
+                extra={"nested": [1, {"a": "}]\""}]}, score=-1.5e3, flag=True, nothing=None)
+    members, audio, found = parse(data, chunk_size)
+    assert found and audio == AUDIO
+    assert members == {"language": "Tamil", "mode": "segments", "extra": {"nested": [1, {"a": "}]\""}]},
+                       "score": -1500.0, "flag": True, "nothing": None}
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 3])
+def test_json_escapes_and_whitespace_in_the_audio_string(chunk_size):
+    encoded = base64.b64encode(AUDIO).decode()
+    # "\/" stands for "/"; an escaped line break is skipped like base64 whitespace
+    assert "/" in encoded
+    escaped = (encoded[:20] + "\\n" + encoded[20:]).replace("/", "\\/")
+    text = '{ "audio_base64" : "' + escaped + '" ,\n "language":"English" }'
+    members, audio, _ = parse(text.encode(), chunk_size)
+    assert audio == AUDIO and members == {"language": "English"}
+
+
+def test_unicode_escape_decodes_to_a_base64_character():
+    encoded = base64.b64encode(b"abc").decode()  # YWJj
+    text = '{"audio_base64": "' + "\\u0059" + encoded[1:] + '"}'
+    assert parse(text.encode(), 1)[1] == b"abc"
+
+
+def test_escaped_quotes_in_member_names_and_values():
+    text = '{"a\\"b": "x\\"}", "audio_base64": "YWJj"}'
+    members, audio, _ = parse(text.encode(), 1)
+    assert members == {'a"b': 'x"}'} and audio == b"abc"
+
+
+def test_body_without_audio():
+    members, audio, found = parse(body(language="Hindi"))
+    assert members == {"language": "Hindi"} and audio == b"" and not found
+
+
+@pytest.mark.parametrize("text", [
+    b'', b'{"audio_base64": "YWJj"', b'{"audio_base64": "YWJj",', b'{"language": "x"',
+    b'[]', b'{"a" 1}', b'{"a": 1 "b": 2}', b'{"a": tru}', b'{"a": 1}}',
+])
+def test_malformed_json(text):
+    with pytest.raises(InvalidJson):
+        parse(text, 1)
+
+
+def test_duplicate_audio_member():
+    with pytest.raises(InvalidJson):
+        parse(b'{"audio_base64": "YWJj", "audio_base64": "YWJj"}')
+
+
+def test_invalid_base64():
+    with pytest.raises(ValueError):
+        parse(b'{"audio_base64": "YWJjZ"}')
+
+
+def test_oversized_member():
+    spool = AudioSpool()
+    reader = JsonAudioReader(spool, max_member_bytes=16)
+    with pytest.raises(InvalidJson):
+        reader.feed(body(language="x" * 32))
+
+
+def test_audio_is_spooled_to_disk_past_the_threshold():
+    data = body(audio_base64=base64.b64encode(AUDIO).decode())
+    spool = AudioSpool(spool_bytes=100)
+    reader = JsonAudioReader(spool)
+    for start in range(0, len(data), 50):
+        reader.feed(data[start:start + 50])
+    reader.finish()
+    spool.finish()
+    try:
+        assert isinstance(spool.source, str)
+        with open(spool.source, "rb") as f:
+            assert f.read() == AUDIO
+        assert spool.head == AUDIO[:len(spool.head)] and spool.size == len(AUDIO)
+    finally:
+        path = spool.path
+        spool.close()
+    assert not os.path.exists(path)
+
+
+def test_upload_limit():
+    with pytest.raises(UploadTooLarge):
+        parse(body(audio_base64=base64.b64encode(AUDIO).decode()), 64, max_bytes=len(AUDIO) - 1)
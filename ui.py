@@ -0,0 +1,340 @@
+"""
+Static UI delivery.
+
+``/`` and ``/app`` are rendered once from a single shared template, and every
+static asset (pages, manifest, service worker) is stored precompressed (gzip,
+and brotli, from the ``brotli`` package in requirements.txt) with a strong ETag.
+``serve_asset`` negotiates the encoding and answers ``If-None-Match`` with 304.
+
+The service worker caches the app shell, so repeat visits to ``/app`` are served
+from the browser cache without reaching the server.
+"""
+import gzip
+import hashlib
+import json
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # listed in requirements.txt; without it only gzip is offered
+    brotli = None
+
+PAGE_TEMPLATE = """<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+{{HEAD_META}}
+  <title>AI Voice Detection</title>
+  <style>
+    :root { color-scheme: dark; }
+    @keyframes gradientShift { 0% { background-position: 0% 50%; } 50% { background-position: 100% 50%; } 100% { background-position: 0% 50%; } }
+    body { font-family: system-ui, -apple-system, Segoe UI, Roboto, Helvetica, Arial, sans-serif; margin: 0; min-height: 100vh; padding: {{BODY_PADDING}}; background: linear-gradient(135deg, #0b1220 0%, {{BG_MID}} 50%, #0b1220 100%); background-size: 200% 200%; animation: gradientShift 18s {{EASING}} infinite; display: flex; align-items: center; color: #e2e8f0; }
+    .card { max-width: {{CARD_WIDTH}}; margin: 0 auto; border-radius: 18px; padding: 2rem; backdrop-filter: blur({{CARD_BLUR}}) saturate(160%); background: rgba(15,23,42,0.55); border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 10px 30px rgba(2,6,23,0.6), 0 0 20px rgba(99,102,241,0.2); }
+    h1 { font-size: {{H1_SIZE}}; margin-bottom: 1rem; letter-spacing: .02em; color: #000000; }
+    label { display: block; margin: .6rem 0 .3rem; font-weight: 700; color: #cbd5e1; }
+    input[type=file], select, textarea { width: 100%; padding: .75rem .9rem; border: 1px solid rgba(148,163,184,0.25); border-radius: 14px; background: rgba(2,6,23,0.6); color: #e2e8f0; box-shadow: inset 0 1px 6px rgba(2,6,23,0.3); }
+    input[type=file]:focus, select:focus, textarea:focus { outline: none; border-color: #22d3ee; box-shadow: 0 0 0 3px rgba(34,211,238,0.25); }
+    button { margin-top: 1rem; padding: .85rem 1.2rem; border: none; border-radius: 14px; background: linear-gradient(90deg, #3b82f6, #8b5cf6); color: #fff; cursor: pointer; box-shadow: 0 12px 24px rgba(59,130,246,0.35), 0 0 16px rgba(139,92,246,0.35); transition: transform .18s ease, box-shadow .18s ease; }
+    button:hover { transform: translateY(-1px); box-shadow: 0 16px 30px rgba(59,130,246,0.5), 0 0 22px rgba(139,92,246,0.45); }
+    button:disabled { background: linear-gradient(90deg,#64748b,#475569); cursor: not-allowed; box-shadow: none; }
+    .dialog { border-radius: 18px; border: 1px solid rgba(99,102,241,0.35); background: rgba(2,6,23,0.75); box-shadow: 0 10px 28px rgba(2,6,23,0.55), 0 0 20px rgba(99,102,241,0.18); }
+    .dialog-header { display: flex; align-items: center; gap: .75rem; padding: .75rem 1rem; border-bottom: 1px solid rgba(148,163,184,0.2); }
+    .badge { padding: .35rem .6rem; border-radius: 999px; font-size: .85rem; background: linear-gradient(90deg,#22d3ee,#a78bfa); color: #0b1220; }
+    .badge--ai { background: linear-gradient(90deg,#ef4444,#f59e0b); color: #0b1220; }
+    .badge--human { background: linear-gradient(90deg,#10b981,#22d3ee); color: #0b1220; }
+    .dialog-body { padding: .9rem 1rem; }
+    .summary { color: #cbd5e1; margin-bottom: .5rem; }
+    pre { background: rgba(2,6,23,0.9); color: #e2e8f0; padding: 1rem; border-radius: 14px; overflow: auto; border: 1px solid rgba(99,102,241,0.35); box-shadow: 0 0 0 1px rgba(99,102,241,0.25) inset, 0 8px 24px rgba(59,130,246,0.25), 0 0 16px rgba(139,92,246,0.2); }
+    #copy { margin-left: auto; padding: .6rem .85rem; border: none; border-radius: 12px; background: linear-gradient(90deg, #22d3ee, #a78bfa); color: #0b1220; cursor: pointer; box-shadow: 0 8px 18px rgba(34,211,238,0.35), 0 0 12px rgba(167,139,250,0.3); }
+    .row { display: grid; grid-template-columns: 1fr; gap: 1rem; }
+    @media (min-width: 640px) { .row { grid-template-columns: 1fr 1fr; } }
+    .small { font-size: .95rem; color: #94a3b8; }
+{{EXTRA_CSS}}
+  </style>
+{{HEAD_SCRIPT}}
+</head>
+<body>
+  <div class="card">
+    <h1>AI-Generated Voice Detection</h1>
+{{LINKS}}
+    <p class="small">Upload audio and select language. The API returns classification, confidence, and explanation.</p>
+    <div class="row">
+      <div>
+        <label for="file">Audio file (WAV/MP3)</label>
+        <input id="file" type="file" accept=".wav,.mp3,audio/*">
+      </div>
+      <div>
+        <label for="lang">Language</label>
+        <select id="lang">
+          <option>English</option>
+          <option>Tamil</option>
+          <option>Hindi</option>
+          <option>Malayalam</option>
+          <option>Telugu</option>
+          <option>Kannada</option>
+        </select>
+      </div>
+    </div>
+    <button id="send">Detect</button>
+    <div id="out" style="margin-top:1rem;">
+      <div class="dialog">
+        <div class="dialog-header">
+          <span id="status-badge" class="badge">Ready</span>
+          <button id="copy">Copy</button>
+        </div>
+        <div class="dialog-body">
+          <div class="summary" id="summary-text">Awaiting input</div>
+          <pre id="result">{ "status": "ready" }</pre>
+        </div>
+      </div>
+    </div>
+    <p class="small">Or paste Base64 audio below (optional):</p>
+    <textarea id="base64" rows="4" placeholder="Base64 audio string"></textarea>
+  </div>
+  <script>
+    async function toBase64(file) {
+      return new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onload = () => resolve(reader.result.split(',')[1]);
+        reader.onerror = reject;
+        reader.readAsDataURL(file);
+      });
+    }
+    async function detect() {
+      const btn = document.getElementById('send');
+      btn.disabled = true;
+      const fileInput = document.getElementById('file');
+      const lang = document.getElementById('lang').value;
+      let audioB64 = document.getElementById('base64').value.trim();
+      try {
+        if (!audioB64) {
+          const f = fileInput.files[0];
+          if (!f) throw new Error('Select a file or paste Base64 audio');
+          audioB64 = await toBase64(f);
+        }
+        const res = await fetch('/detect', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ audio_base64: audioB64, language: lang })
+        });
+        const txt = await res.text();
+        document.getElementById('result').textContent = txt;
+      } catch (err) {
+        document.getElementById('result').textContent = JSON.stringify({ error: String(err) }, null, 2);
+      } finally {
+        btn.disabled = false;
+      }
+    }
+    document.getElementById('send').addEventListener('click', detect);
+    document.getElementById('copy').addEventListener('click', async () => {
+      const txt = document.getElementById('result').textContent;
+      try { await navigator.clipboard.writeText(txt); } catch(e) {}
+    });
+    function renderSummary(obj) {
+      const badge = document.getElementById('status-badge');
+      const summary = document.getElementById('summary-text');
+      badge.className = 'badge';
+      if (obj && typeof obj === 'object' && obj.classification) {
+        const cls = String(obj.classification);
+        const conf = typeof obj.confidence_score === 'number' ? Math.round(obj.confidence_score * 100) / 100 : obj.confidence_score;
+        summary.textContent = `${cls} • ${conf}`;
+        badge.textContent = cls;
+        if (/AI-Generated/i.test(cls)) badge.className = 'badge badge--ai';
+        if (/Human/i.test(cls)) badge.className = 'badge badge--human';
+      } else {
+        summary.textContent = 'Response';
+        badge.textContent = 'JSON';
+      }
+    }
+  </script>
+</body>
+</html>
+"""
+
+ROOT_LINKS = """    <div class="links">
+      <a href="/docs">API Docs</a>
+      <a href="/health" target="_blank">Health JSON</a>
+      <a href="/?format=json" target="_blank">Root JSON</a>
+    </div>
+"""
+
+APP_HEAD_META = """  <meta name="apple-mobile-web-app-capable" content="yes">
+  <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
+  <link rel="manifest" href="/manifest.json">
+"""
+
+APP_HEAD_SCRIPT = """  <script>
+    if ('serviceWorker' in navigator) {
+      window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js').catch(() => {});
+      });
+    }
+  </script>
+"""
+
+def render_page(**values):
+    """
+    Fills the {{NAME}} placeholders of PAGE_TEMPLATE. Placeholders that sit on
+    a line of their own take whole lines (and vanish when the value is empty).
+    """
+    html = PAGE_TEMPLATE
+    for name, value in values.items():
+        html = html.replace("{{" + name + "}}\n", value).replace("{{" + name + "}}", value)
+    return html
+
+ROOT_HTML = render_page(
+    HEAD_META="",
+    HEAD_SCRIPT="",
+    BODY_PADDING="3rem 2rem",
+    BG_MID="#101826",
+    EASING="ease",
+    CARD_WIDTH="900px",
+    CARD_BLUR="14px",
+    H1_SIZE="2rem",
+    EXTRA_CSS="    .links a { margin-right: .75rem; color: #93c5fd; text-decoration: none; }\n",
+    LINKS=ROOT_LINKS,
+)
+
+APP_HTML = render_page(
+    HEAD_META=APP_HEAD_META,
+    HEAD_SCRIPT=APP_HEAD_SCRIPT,
+    BODY_PADDING="2.5rem 2rem",
+    BG_MID="#0f172a",
+    EASING="ease-in-out",
+    CARD_WIDTH="760px",
+    CARD_BLUR="12px",
+    H1_SIZE="1.8rem",
+    EXTRA_CSS="",
+    LINKS="",
+)
+
+MANIFEST = {
+    "name": "AI Voice Detection",
+    "short_name": "VoiceDetect",
+    "start_url": "/app",
+    "display": "standalone",
+    "background_color": "#ffffff",
+    "theme_color": "#2563eb",
+    "icons": []
+}
+
+# URLs precached by the service worker. Served cache-first and refreshed in the
+# background; everything else (API calls, /docs) always goes to the network.
+APP_SHELL = ["/app", "/manifest.json"]
+
+SERVICE_WORKER_TEMPLATE = """const CACHE = 'voice-shell-{{VERSION}}';
+const SHELL = {{SHELL}};
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(CACHE).then((cache) => cache.addAll(SHELL)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE).map((key) => caches.delete(key))))
+      .then(() => clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin || !SHELL.includes(url.pathname)) {
+    return;
+  }
+  // Cache first; refresh the cached copy in the background (ETag revalidation).
+  event.respondWith(caches.open(CACHE).then((cache) => cache.match(url.pathname).then((cached) => {
+    const refresh = fetch(event.request).then((response) => {
+      if (response.ok) cache.put(url.pathname, response.clone());
+      return response;
+    });
+    if (cached) {
+      event.waitUntil(refresh.catch(() => {}));
+      return cached;
+    }
+    return refresh;
+  })));
+});
+"""
+
+class StaticAsset:
+    """
+    A static response body stored once in identity, gzip and (optionally)
+    brotli encodings, each with its own strong ETag.
+    """
+    def __init__(self, body: str, media_type: str, cache_control: str, vary: str = "Accept-Encoding"):
+        raw = body.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.vary = vary
+        self.version = digest[:12]
+        # encoding -> (etag, bytes); a different content-coding is a different
+        # representation, so each one gets its own strong validator
+        self.variants = {"identity": (f'"{digest}"', raw)}
+        self.variants["gzip"] = (f'"{digest}-gz"', gzip.compress(raw, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self.variants["br"] = (f'"{digest}-br"', brotli.compress(raw, quality=11))
+
+def _accepted_encodings(header: str):
+    accepted = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+def _choose_encoding(asset: StaticAsset, header: str):
+    accepted = _accepted_encodings(header)
+    for encoding in ("br", "gzip"):
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in asset.variants and q > 0:
+            return encoding
+    return "identity"
+
+def serve_asset(request, asset: StaticAsset):
+    """
+    Returns the best-encoded variant of ``asset``, or 304 when the client
+    already holds any of its representations.
+    """
+    headers = {"Cache-Control": asset.cache_control, "Vary": asset.vary}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Weak comparison, as required for If-None-Match
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        for etag, _ in asset.variants.values():
+            if "*" in tags or etag in tags:
+                headers["ETag"] = etag
+                return Response(status_code=304, headers=headers)
+    encoding = _choose_encoding(asset, request.headers.get("accept-encoding", ""))
+    etag, body = asset.variants[encoding]
+    headers["ETag"] = etag
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset.media_type, headers=headers)
+
+# Built once at import. HTML is revalidated on every visit (cheap 304s); the
+# service worker keeps the app shell for offline / repeat visits.
+ROOT_PAGE = StaticAsset(ROOT_HTML, "text/html; charset=utf-8", "no-cache", vary="Accept, Accept-Encoding")
+APP_PAGE = StaticAsset(APP_HTML, "text/html; charset=utf-8", "no-cache")
+MANIFEST_ASSET = StaticAsset(json.dumps(MANIFEST), "application/manifest+json", "public, max-age=86400")
+SERVICE_WORKER = StaticAsset(
+    SERVICE_WORKER_TEMPLATE
+        .replace("{{VERSION}}", APP_PAGE.version + MANIFEST_ASSET.version)
+        .replace("{{SHELL}}", json.dumps(APP_SHELL)),
+    "text/javascript; charset=utf-8",
+    # Browsers always revalidate service workers; a new deploy changes VERSION
+    # and with it the cache name, which evicts the old shell.
+    "no-cache",
+)
@@ -0,0 +1,324 @@
+"""
+Spooling of binary audio uploads.
+
+``/detect/upload`` receives raw audio (multipart or ``application/octet-stream``)
+instead of a base64 JSON string. The body is consumed chunk by chunk into an
+``AudioSpool``: small uploads stay in memory, large ones go to a temporary file
+whose path is handed to the decoder. The audio hash for the result cache is
+computed while spooling, so no extra pass over the data is needed.
+
+``/detect`` keeps its JSON body but is read the same way: ``JsonAudioReader``
+parses the request stream incrementally and base64-decodes the
+``audio_base64`` string straight into an ``AudioSpool``, so neither the raw
+body nor the base64 text is ever held in full.
+
+Configuration (environment variables):
+    VOICE_UPLOAD_MAX_BYTES    largest accepted upload (default 50 MiB)
+    VOICE_UPLOAD_SPOOL_BYTES  uploads above this size are spooled to disk (default 4 MiB)
+"""
+import binascii
+import json
+import os
+import tempfile
+
+from cache import new_audio_hasher
+
+UPLOAD_MAX_BYTES = int(os.environ.get("VOICE_UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("VOICE_UPLOAD_SPOOL_BYTES", str(4 * 1024 * 1024)))
+# Leading bytes kept aside for probing the audio header while the upload continues
+HEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class InvalidJson(ValueError):
+    pass
+
+
+class AudioSpool:
+    def __init__(self, max_bytes: int = UPLOAD_MAX_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.path = None
+        self._buffer = bytearray()
+        self._file = None
+        self._hasher = new_audio_hasher()
+        self.head = bytearray()
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+        self._hasher.update(chunk)
+        if len(self.head) < HEAD_BYTES:
+            self.head += chunk[:HEAD_BYTES - len(self.head)]
+        if self._file is None and self.size > self.spool_bytes:
+            fd, self.path = tempfile.mkstemp(prefix="voice-upload-", suffix=".audio")
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer += chunk
+
+    async def consume(self, chunks):
+        """
+        Spools an async iterator of byte chunks (``request.stream()`` or an upload).
+        """
+        async for chunk in chunks:
+            self.write(chunk)
+        self.finish()
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def source(self):
+        """
+        What the decoder receives: the in-memory bytes or the spooled file path.
+        """
+        return self.path if self.path is not None else bytes(self._buffer)
+
+    def digest(self):
+        return self._hasher.digest()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._buffer = bytearray()
+
+
+async def iter_upload(upload, chunk_size: int = 1024 * 1024):
+    """
+    Reads a Starlette ``UploadFile`` in chunks.
+    """
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+_B64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+# everything else is skipped, as base64.b64decode does by default
+_B64_DISCARD = bytes(sorted(set(range(256)) - set(_B64_ALPHABET)))
+# JSON escapes that stand for a base64 character; all others decode to characters that are skipped
+_JSON_ESCAPES = {ord("/"): b"/"}
+_WHITESPACE = b" \t\r\n"
+
+
+class JsonAudioReader:
+    """
+    Incremental parser for a ``/detect`` JSON body: a top-level object whose
+    ``field`` string is base64-decoded into ``spool`` chunk by chunk, while
+    the remaining members (language, mode, ...) are small and collected as-is.
+
+    ``feed`` takes body chunks as they arrive; ``finish`` checks the document
+    is complete and returns the other members as a dict. Malformed JSON or
+    base64 raises ValueError (InvalidJson for the JSON). The audio string is scanned with ``bytes.find``
+    and decoded with ``binascii``, so the per-byte Python work is limited to
+    the small members.
+    """
+    def __init__(self, spool: AudioSpool, field: str = "audio_base64", max_member_bytes: int = 64 * 1024):
+        self.spool = spool
+        self.field = field
+        self.max_member_bytes = max_member_bytes
+        self.members = {}
+        self.found = False
+        # expect_object -> key -> colon -> value -> comma -> done
+        self._state = "expect_object"
+        self._token = bytearray()
+        self._key = None
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        self._escape = bytearray()
+        self._quad = b""
+
+    def feed(self, chunk: bytes):
+        pos = 0
+        n = len(chunk)
+        while pos < n:
+            if self._state == "audio":
+                pos = self._feed_audio(chunk, pos)
+            elif self._state == "value":
+                pos = self._feed_value(chunk, pos)
+            elif self._state == "key":
+                pos = self._feed_key(chunk, pos)
+            else:
+                byte = chunk[pos]
+                pos += 1
+                if byte in _WHITESPACE:
+                    continue
+                self._structural(byte)
+
+    def finish(self):
+        if self._state != "done":
+            raise InvalidJson("Request body is not a complete JSON object")
+        return self.members
+
+    def _structural(self, byte: int):
+        state = self._state
+        if state == "expect_object" and byte == ord("{"):
+            self._state = "key_or_end"
+        elif state in ("key_or_end", "key_start") and byte == ord('"'):
+            self._state = "key"
+            self._token.clear()
+        elif state == "key_or_end" and byte == ord("}"):
+            self._state = "done"
+        elif state == "colon" and byte == ord(":"):
+            self._state = "value_start"
+        elif state == "value_start":
+            if self._key == self.field and byte == ord('"'):
+                if self.found:
+                    raise InvalidJson(f"Duplicate '{self.field}' member")
+                self.found = True
+                self._state = "audio"
+            else:
+                self._state = "value"
+                self._token[:] = bytes([byte])
+                self._in_string = byte == ord('"')
+                self._escaped = False
+                self._depth = 1 if byte in b"[{" else 0
+        elif state == "comma" and byte == ord(","):
+            self._state = "key_start"
+        elif state == "comma" and byte == ord("}"):
+            self._state = "done"
+        else:
+            raise InvalidJson(f"Invalid JSON body near {chr(byte)!r}")
+
+    def _feed_key(self, chunk: bytes, pos: int):
+        end = chunk.find(b'"', pos)
+        while end >= 0 and _escaped_quote(self._token + chunk[pos:end]):
+            end = chunk.find(b'"', end + 1)
+        if end < 0:
+            self._append(chunk[pos:])
+            return len(chunk)
+        self._append(chunk[pos:end])
+        try:
+            self._key = json.loads(b'"' + self._token + b'"')
+        except ValueError:
+            raise InvalidJson("Invalid JSON member name")
+        self._state = "colon"
+        return end + 1
+
+    def _feed_value(self, chunk: bytes, pos: int):
+        # strings, numbers, literals and (nested) arrays/objects other than the audio
+        start = pos
+        n = len(chunk)
+        while pos < n:
+            byte = chunk[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif byte == ord("\\"):
+                    self._escaped = True
+                elif byte == ord('"'):
+                    self._in_string = False
+                    if not self._depth:
+                        self._append(chunk[start:pos + 1])
+                        self._end_value()
+                        return pos + 1
+            elif byte == ord('"'):
+                self._in_string = True
+            elif byte in b"[{":
+                self._depth += 1
+            elif byte in b"]}" and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    self._append(chunk[start:pos + 1])
+                    self._end_value()
+                    return pos + 1
+            elif not self._depth and (byte in b",}" or byte in _WHITESPACE):
+                # end of a number or literal; the delimiter is parsed as structure
+                self._append(chunk[start:pos])
+                self._end_value()
+                return pos
+            pos += 1
+        self._append(chunk[start:])
+        return n
+
+    def _end_value(self):
+        try:
+            self.members[self._key] = json.loads(bytes(self._token))
+        except ValueError:
+            raise InvalidJson(f"Invalid JSON value for '{self._key}'")
+        self._state = "comma"
+
+    def _feed_audio(self, chunk: bytes, pos: int):
+        if self._escape:
+            return self._feed_escape(chunk, pos)
+        quote = chunk.find(b'"', pos)
+        backslash = chunk.find(b"\\", pos, quote if quote >= 0 else len(chunk))
+        if backslash >= 0:
+            self._decode(chunk[pos:backslash])
+            self._escape[:] = b"\\"
+            return backslash + 1
+        if quote < 0:
+            self._decode(chunk[pos:])
+            return len(chunk)
+        self._decode(chunk[pos:quote])
+        if self._quad:
+            self._decode_quads(self._quad, final=True)
+        self._state = "comma"
+        return quote + 1
+
+    def _feed_escape(self, chunk: bytes, pos: int):
+        # \uXXXX needs six bytes, every other escape two; they may span chunks
+        while pos < len(chunk):
+            self._escape.append(chunk[pos])
+            pos += 1
+            needed = 6 if self._escape[1:2] == b"u" else 2
+            if len(self._escape) == needed:
+                if needed == 6:
+                    try:
+                        code = int(self._escape[2:], 16)
+                    except ValueError:
+                        raise InvalidJson("Invalid \\u escape in audio_base64")
+                    if code < 128:
+                        self._decode(bytes([code]))
+                else:
+                    self._decode(_JSON_ESCAPES.get(self._escape[1], b""))
+                self._escape.clear()
+                break
+        return pos
+
+    def _decode(self, text: bytes):
+        text = text.translate(None, _B64_DISCARD)
+        if text:
+            self._decode_quads(self._quad + text)
+
+    def _decode_quads(self, text: bytes, final: bool = False):
+        usable = len(text) if final else len(text) - len(text) % 4
+        self._quad = text[usable:]
+        if usable:
+            try:
+                self.spool.write(binascii.a2b_base64(text[:usable]))
+            except binascii.Error as e:
+                raise ValueError(f"Invalid base64 audio: {e}")
+
+    def _append(self, data: bytes):
+        self._token += data
+        if len(self._token) > self.max_member_bytes:
+            raise InvalidJson(f"JSON member exceeds {self.max_member_bytes} bytes")
+
+
+def _escaped_quote(text: bytes):
+    """
+    True when ``text`` ends in an odd number of backslashes, i.e. the quote that
+    follows it is escaped.
+    """
+    return (len(text) - len(text.rstrip(b"\\"))) % 2 == 1